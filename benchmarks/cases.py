@@ -0,0 +1,244 @@
+"""The benchmark cases. Each setup function prepares its data and returns the function to time."""
+
+import datetime as dt
+import io
+from decimal import Decimal
+
+from django.contrib.auth.models import User  # pylint: disable=imported-auth-user
+from django.core.management import call_command
+from django.core.signals import request_finished, request_started
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from benchmarks.runner import SkipBenchmark, benchmark
+from invoice.bank_statements import match_transactions, normalize_reference, parse_camt053
+from invoice.epc_qr import EpcBeneficiary, gen_epc_qr_data
+from invoice.invoice_number_generator import InvoiceNumberFormat
+from invoice.management.commands.seed_benchmark_data import USERNAME_PREFIX
+from invoice.models import Address, BankAccount, Customer, Invoice, InvoiceItem, Vendor
+from invoice.pdf_generator import gen_invoice_pdf
+
+ITEM_COUNTS = (10, 100, 1_000)
+PDF_ITEM_COUNTS = {"small": 5, "large": 200}
+INVOICE_NUMBER_FORMAT = "RE-<year>-<month>-<customer>-<counter:vendor:5>-<counter:customer:3>"
+# total invoices and items of the seeded data sets for the list views
+LIST_VOLUMES = {"small": (200, 2_000), "medium": (2_000, 20_000)}
+LIST_URL_NAMES = ("invoice-list", "customer-list", "vendor-list")
+# customer and item terms of the seeded data sets for the invoice search
+SEARCH_QUERY = "müller consulting project 42"
+# transfers of the bank statement and open invoices of its index
+STATEMENT_TRANSFERS = 20_000
+_seeded = {"volume": None}
+# the database settings of the DB_CONN_PROFILE values, see rechnung.settings
+CONNECTION_PROFILES = {
+    "default": {"CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": False, "pool": None},
+    "persistent": {"CONN_MAX_AGE": 60, "CONN_HEALTH_CHECKS": True, "pool": None},
+    "pool": {"CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": False, "pool": {"min_size": 1, "max_size": 1}},
+}
+
+
+def _create_invoice(item_count: int, username: str) -> Invoice:
+    """Create an invoice in EUR with a bank account, so that the PDF includes the EPC QR code."""
+    user = User.objects.create_user(username=username)
+    vendor = Vendor.objects.create(
+        name=f"Benchmark Vendor {username}",
+        company_name="Benchmark GmbH",
+        address=Address.objects.create(line_1="Hauptstraße 1", postcode="10115", city="Berlin", country="DE"),
+        tax_id="DE123456789",
+        bank_account=BankAccount.objects.create(
+            owner="Benchmark GmbH", iban="DE89370400440532013000", bic="COBADEFFXXX"
+        ),
+        user=user,
+    )
+    customer = Customer.objects.create(
+        first_name="Erika",
+        last_name="Mustermann",
+        email="erika@example.com",
+        address=Address.objects.create(line_1="Gartenweg 2", postcode="20095", city="Hamburg", country="DE"),
+        vendor=vendor,
+    )
+    date = dt.date(2024, 6, 1)
+    invoice = Invoice.objects.create(
+        invoice_number=f"{username}-1",
+        date=date,
+        due_date=date + dt.timedelta(days=14),
+        delivery_date=date,
+        vendor=vendor,
+        customer=customer,
+    )
+    InvoiceItem.objects.bulk_create(
+        InvoiceItem(
+            name=f"Item {index}",
+            description="Development according to the agreement",
+            quantity=Decimal(index % 40 + 1) / 4,
+            unit="h",
+            price=Decimal(index % 250 + 50) + Decimal("0.99"),
+            tax=(Decimal("0.19"), Decimal("0.07"), Decimal("0.00"))[index % 3],
+            invoice=invoice,
+        )
+        for index in range(item_count)
+    )
+    return invoice
+
+
+def _totals_setup(item_count: int):
+    def setup():
+        invoice_id = _create_invoice(item_count, f"totals-{item_count}").pk
+
+        def totals():
+            invoice = Invoice.objects.get(pk=invoice_id)
+            return invoice.net_total, invoice.tax_amount_per_rate, invoice.tax_amount, invoice.total
+
+        return totals
+
+    return setup
+
+
+def _pdf_setup(item_count: int):
+    def setup():
+        invoice = Invoice.objects.select_related("vendor__address", "vendor__bank_account", "customer__address").get(
+            pk=_create_invoice(item_count, f"pdf-{item_count}").pk
+        )
+        return lambda: gen_invoice_pdf(invoice, io.BytesIO())
+
+    return setup
+
+
+def _list_setup(volume: str, url_name: str, query: str = ""):
+    def setup():
+        if _seeded["volume"] != volume:
+            invoice_count, item_count = LIST_VOLUMES[volume]
+            call_command(
+                "seed_benchmark_data",
+                "--clear",
+                users=1,
+                vendors_per_user=2,
+                customers_per_vendor=max(1, invoice_count // 20),
+                invoices=invoice_count,
+                items=item_count,
+                stdout=io.StringIO(),
+            )
+            _seeded["volume"] = volume
+        client = Client()
+        client.force_login(User.objects.get(username=f"{USERNAME_PREFIX}00000"))
+        url = reverse(url_name)
+        if query:
+            url += "?" + urlencode({"q": query})
+
+        def get():
+            response = client.get(url)
+            if response.status_code != 200:  # noqa: PLR2004
+                raise RuntimeError(f"{url} returned {response.status_code}")
+            return response
+
+        return get
+
+    return setup
+
+
+def _connection_setup(profile: str):
+    """
+    Emulate the connection handling of a request with one small query under the given connection profile.
+
+    The request signals close the connection at the end of a request unless it is persistent, exactly like the
+    request handlers do. The in-memory SQLite test database is never closed, so only other databases show a difference.
+    """
+
+    def setup():
+        values = CONNECTION_PROFILES[profile]
+        if values["pool"] and connection.vendor != "postgresql":
+            raise SkipBenchmark("pooling requires PostgreSQL")
+        settings_dict = connection.settings_dict
+        original = {key: settings_dict.get(key) for key in ("CONN_MAX_AGE", "CONN_HEALTH_CHECKS")}
+        original_options = settings_dict.setdefault("OPTIONS", {}).copy()
+        connection.close()
+        settings_dict["CONN_MAX_AGE"] = values["CONN_MAX_AGE"]
+        settings_dict["CONN_HEALTH_CHECKS"] = values["CONN_HEALTH_CHECKS"]
+        if values["pool"]:
+            settings_dict["OPTIONS"]["pool"] = values["pool"]
+
+        def request():
+            request_started.send(sender=None)
+            try:
+                return list(Vendor.objects.values_list("pk", flat=True)[:1])
+            finally:
+                request_finished.send(sender=None)
+
+        yield request
+        connection.close()
+        if values["pool"]:
+            connection.close_pool()
+        settings_dict.update(original)
+        settings_dict["OPTIONS"] = original_options
+
+    return setup
+
+
+for _count in ITEM_COUNTS:
+    benchmark(f"invoice_totals[{_count} items]")(_totals_setup(_count))
+
+for _size, _count in PDF_ITEM_COUNTS.items():
+    benchmark(f"gen_invoice_pdf[{_size}]")(_pdf_setup(_count))
+
+for _volume in LIST_VOLUMES:
+    for _url_name in LIST_URL_NAMES:
+        benchmark(f"view[{_url_name}, {_volume}]")(_list_setup(_volume, _url_name))
+    benchmark(f"view[invoice-list search, {_volume}]")(_list_setup(_volume, "invoice-list", SEARCH_QUERY))
+
+for _profile in CONNECTION_PROFILES:
+    benchmark(f"request_cycle[{_profile} connection]", number=20)(_connection_setup(_profile))
+
+
+@benchmark("gen_epc_qr_data", number=1_000)
+def epc_qr_data_setup():
+    """Generate the payload of a typical EUR invoice."""
+    return lambda: gen_epc_qr_data(
+        "Benchmark GmbH",
+        "DE89370400440532013000",
+        beneficiary_bic="COBADEFFXXX",
+        eur_amount=Decimal("1234.56"),
+        remittance_info="Invoice RE-2024-06-00042",
+    )
+
+
+@benchmark("epc_qr_payload[validated beneficiary]", number=1_000)
+def epc_qr_payload_setup():
+    """Generate the payload of the same invoice with a beneficiary validated once, as the bulk export does."""
+    beneficiary = EpcBeneficiary("Benchmark GmbH", "DE89370400440532013000", bic="COBADEFFXXX")
+    return lambda: beneficiary.payload(eur_amount=Decimal("1234.56"), remittance_info="Invoice RE-2024-06-00042")
+
+
+@benchmark("invoice_number_format[compile]", number=1_000)
+def invoice_number_compile_setup():
+    """Parse the format string."""
+    return lambda: InvoiceNumberFormat(INVOICE_NUMBER_FORMAT)
+
+
+@benchmark("invoice_number_format[render]", number=1_000)
+def invoice_number_render_setup():
+    """Render the invoice number without touching the counters."""
+    invoice = Invoice.objects.select_related("vendor", "customer").get(pk=_create_invoice(0, "number").pk)
+    number_format = InvoiceNumberFormat(INVOICE_NUMBER_FORMAT)
+    return lambda: number_format.preview_invoice_number(invoice)
+
+
+@benchmark(f"bank_statement_match[{STATEMENT_TRANSFERS} transfers]")
+def bank_statement_match_setup():
+    """Parse a CAMT.053 statement and match every transfer against an index of as many open invoices."""
+    amounts = [Decimal(index % 5_000 + 1) + Decimal("0.19") for index in range(STATEMENT_TRANSFERS)]
+    index = {
+        (normalize_reference(f"RE-2024-{number:06d}"), "EUR", amount): [number] for number, amount in enumerate(amounts)
+    }
+    entries = "".join(
+        f'<Ntry><Amt Ccy="EUR">{amount}</Amt><CdtDbtInd>CRDT</CdtDbtInd><Sts><Cd>BOOK</Cd></Sts>'
+        f"<BookgDt><Dt>2024-06-03</Dt></BookgDt><NtryDtls><TxDtls><RmtInf>"
+        f"<Ustrd>Invoice: RE-2024-{number:06d}</Ustrd></RmtInf></TxDtls></NtryDtls></Ntry>"
+        for number, amount in enumerate(amounts)
+    )
+    data = (
+        '<Document xmlns="urn:iso:std:iso:20022:tech:xsd:camt.053.001.08"><BkToCstmrStmt><Stmt>'
+        f"{entries}</Stmt></BkToCstmrStmt></Document>"
+    ).encode()
+    return lambda: match_transactions(parse_camt053(io.BytesIO(data)), index)
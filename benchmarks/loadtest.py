@@ -0,0 +1,325 @@
+"""
+HTTP load test with scripted user scenarios against a locally started gunicorn with WSGI or ASGI workers.
+
+Every virtual user is a thread with its own connection and session. It repeats the scenario of a typical user: log in,
+list the invoices, create an invoice, add items, finalize it and download the PDF. Redirects are followed like a
+browser does and every request is timed separately, grouped by method and URL name. A scenario that cannot go on, e.g.
+because the invoice was not created, counts as error and makes the load test fail.
+"""
+
+import datetime as dt
+import http.client
+import math
+import os
+import socket
+import subprocess  # nosec B404
+import sys
+import threading
+import time
+from http.cookies import SimpleCookie
+from io import StringIO
+from pathlib import Path
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.core.management import call_command
+from django.urls import Resolver404, resolve, reverse
+
+from invoice.management.commands.seed_benchmark_data import USERNAME_PREFIX
+from invoice.models import Customer, Vendor
+
+PASSWORD = "benchmark"  # noqa: S105, set by seed_benchmark_data
+REDIRECT_STATUSES = {301, 302, 303}
+PERCENTILES = (50, 95, 99)
+SERVER_START_TIMEOUT = 30.0
+
+
+def percentile(sorted_values: list[float], percent: float) -> float:
+    """Get the percentile of sorted values by the nearest-rank method."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(percent / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class ScenarioError(Exception):
+    """A step of the scenario failed, so that the remaining steps cannot run."""
+
+
+def _url_name(path: str) -> str:
+    try:
+        return resolve(urlsplit(path).path).url_name or "unknown"
+    except Resolver404:
+        return "unknown"
+
+
+class VirtualUser:
+    """A single simulated browser session that runs the scenario in a loop."""
+
+    def __init__(self, host: str, port: int, account: tuple[str, int, int], items: int):
+        """Create a virtual user for a seeded account of username, vendor id and customer id."""
+        self.connection = http.client.HTTPConnection(host, port, timeout=60)
+        self.username, self.vendor_id, self.customer_id = account
+        self.items = items
+        self.cookies: dict[str, str] = {}
+        self.samples: list[tuple[str, float, bool]] = []
+
+    def request(self, method: str, path: str, data: dict | None = None) -> tuple[int, str, bytes]:
+        """Send a request, record its latency and follow redirects. Return the status, final path and body."""
+        while True:
+            headers = {"Cookie": "; ".join(f"{name}={value}" for name, value in self.cookies.items())}
+            body = None
+            if method == "POST":
+                headers["Content-Type"] = "application/x-www-form-urlencoded"
+                headers["X-CSRFToken"] = self.cookies.get("csrftoken", "")
+                body = urlencode(data or {})
+            start = time.perf_counter()
+            try:
+                self.connection.request(method, path, body=body, headers=headers)
+                response = self.connection.getresponse()
+                content = response.read()
+            except OSError, http.client.HTTPException:
+                self.connection.close()
+                self.samples.append((f"{method} {_url_name(path)}", time.perf_counter() - start, False))
+                return 0, path, b""
+            self.samples.append((f"{method} {_url_name(path)}", time.perf_counter() - start, response.status < 400))  # noqa: PLR2004
+            cookie = SimpleCookie()
+            for header in response.headers.get_all("Set-Cookie") or []:
+                cookie.load(header)
+            self.cookies.update({name: morsel.value for name, morsel in cookie.items()})
+            if response.will_close:
+                self.connection.close()
+            if response.status not in REDIRECT_STATUSES:
+                return response.status, path, content
+            method, path, data = "GET", urlsplit(response.headers["Location"]).path, None
+
+    def run_scenario(self):
+        """Run the scenario once in a fresh session."""
+        self.cookies.clear()
+        login = reverse("login")
+        self.request("GET", login)
+        self.request("POST", login, {"username": self.username, "password": PASSWORD})
+        self.request("GET", reverse("invoice-list"))
+
+        today = dt.date.today().isoformat()  # noqa: DTZ011
+        invoice = {
+            "date": today,
+            "due_date": (dt.date.today() + dt.timedelta(days=14)).isoformat(),  # noqa: DTZ011
+            "delivery_date": today,
+            "vendor": self.vendor_id,
+            "customer": self.customer_id,
+            "currency": "EUR",
+        }
+        status, path, _ = self.request("POST", reverse("invoice-add"), invoice)
+        match = resolve(path) if status == 200 else None  # noqa: PLR2004
+        if match is None or match.url_name != "invoice-update":
+            raise ScenarioError(f"the invoice was not created, the response was {status} at {path}")
+        invoice_id = match.kwargs["pk"]
+
+        for index in range(self.items):
+            item = {
+                "name": f"Item {index + 1}",
+                "description": "Development according to the agreement",
+                "quantity": "1.5",
+                "unit": "h",
+                "price": "95.00",
+                "tax": "0.19",
+            }
+            self.request("POST", reverse("invoice-item-add", args=[invoice_id]), item)
+        self.request("POST", reverse("invoice-update", args=[invoice_id]), {**invoice, "final": "on"})
+        self.request("GET", reverse("invoice-pdf", args=[invoice_id]))
+
+    def run(self, stop_at: float, iterations: int, errors: list):
+        """Repeat the scenario until the deadline or the number of iterations is reached, also after failed ones."""
+        count = 0
+        try:
+            while time.monotonic() < stop_at and (not iterations or count < iterations):
+                try:
+                    self.run_scenario()
+                except ScenarioError as error:
+                    errors.append(f"{self.username}: {error}")
+                count += 1
+        except Exception as error:  # noqa: BLE001 # pylint: disable=broad-exception-caught
+            errors.append(f"{self.username}: {error!r}")
+        finally:
+            self.connection.close()
+
+
+def prepare(users: int, invoices: int, items: int, *, seed: bool, log) -> list[tuple[str, int, int]]:
+    """Migrate the database, seed the benchmark users and return username, vendor and customer id per user."""
+    call_command("migrate", verbosity=0)
+    call_command("collectstatic", interactive=False, verbosity=0)
+    if seed:
+        output = StringIO()
+        call_command(
+            "seed_benchmark_data",
+            "--clear",
+            users=users,
+            vendors_per_user=1,
+            customers_per_vendor=20,
+            invoices=invoices,
+            items=items,
+            stdout=output,
+        )
+        log(output.getvalue())
+    accounts = []
+    for vendor in Vendor.objects.filter(user__username__startswith=USERNAME_PREFIX).select_related("user"):
+        customer = Customer.objects.filter(vendor=vendor).order_by("pk").first()
+        if customer is not None:
+            accounts.append((vendor.user.username, vendor.pk, customer.pk))
+    accounts.sort()
+    if len(accounts) < users:
+        raise RuntimeError(f"only {len(accounts)} seeded users found, run without --no-seed")
+    return accounts[:users]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode: str, workers: int, threads: int, port: int, log) -> subprocess.Popen:
+    """
+    Start gunicorn with the current environment, in particular the same DATABASE_URL, and wait until it listens.
+
+    :param mode: ``wsgi`` for threaded sync workers or ``asgi`` for uvicorn workers like the entrypoint.
+    """
+    command = [
+        sys.executable,
+        "-m",
+        "gunicorn",
+        f"--bind=127.0.0.1:{port}",
+        f"--workers={workers}",
+        "--config=python:rechnung.gunicorn",
+    ]
+    if mode == "asgi":
+        command += ["--worker-class=uvicorn_worker.UvicornWorker", "rechnung.asgi"]
+    else:
+        command += [f"--threads={threads}", "rechnung.wsgi"]
+    log(f"Starting {' '.join(command[2:])}\n")
+    # the threads also size the connection pool of the pool connection profile
+    environment = {
+        **os.environ,
+        "ALLOWED_HOSTS": "127.0.0.1,localhost",
+        "DEBUG": "False",
+        "GUNICORN_THREADS": str(threads),
+        # the pool profile requires DB_POOL_MAX_SIZE with ASGI workers
+        "SERVER_MODE": mode,
+    }
+    # pylint: disable-next=consider-using-with
+    server = subprocess.Popen(command, cwd=Path(settings.BASE_DIR), env=environment)  # noqa: S603 # nosec B603
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {server.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+        except OSError:
+            time.sleep(0.2)
+        else:
+            return server
+    server.terminate()
+    raise RuntimeError("gunicorn did not start in time")
+
+
+def summarize(samples: list[tuple[str, float, bool]], elapsed: float) -> dict:
+    """Compute the request count, errors, throughput and latency percentiles per request name."""
+    grouped: dict[str, list[tuple[float, bool]]] = {}
+    for name, duration, ok in samples:
+        grouped.setdefault(name, []).append((duration, ok))
+    grouped["TOTAL"] = [(duration, ok) for _, duration, ok in samples]
+    summary = {}
+    for name, values in grouped.items():
+        durations = sorted(duration for duration, _ in values)
+        summary[name] = {
+            "requests": len(values),
+            "errors": sum(not ok for _, ok in values),
+            "throughput": len(values) / elapsed if elapsed else 0.0,
+            "mean": sum(durations) / len(durations),
+            **{f"p{percent}": percentile(durations, percent) for percent in PERCENTILES},
+        }
+    return summary
+
+
+def format_summary(summary: dict) -> str:
+    """Format the summary as table with the latencies in milliseconds."""
+    lines = [f"{'request':<32} {'count':>7} {'errors':>6} {'req/s':>8} {'p50':>9} {'p95':>9} {'p99':>9}"]
+    for name, row in sorted(summary.items(), key=lambda item: (item[0] == "TOTAL", item[0])):
+        lines.append(
+            f"{name:<32} {row['requests']:>7} {row['errors']:>6} {row['throughput']:>8.1f} "
+            + " ".join(f"{row[f'p{percent}'] * 1000:>9.1f}" for percent in PERCENTILES)
+        )
+    return "\n".join(lines) + "\n"
+
+
+def run_users(virtual_users: list[VirtualUser], duration: float, iterations: int) -> tuple[float, list[str]]:
+    """Run all virtual users concurrently and return the elapsed seconds and the errors."""
+    errors: list[str] = []
+    start = time.monotonic()
+    threads = [threading.Thread(target=user.run, args=(start + duration, iterations, errors)) for user in virtual_users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.monotonic() - start, errors
+
+
+def format_comparison(runs: dict[str, dict]) -> str:
+    """Format the throughput and p95 latency of the same requests in several server modes side by side."""
+    modes = list(runs)
+    names = sorted({name for run in runs.values() for name in run["results"]}, key=lambda name: (name == "TOTAL", name))
+    lines = [f"{'request':<32} " + " ".join(f"{f'{mode} req/s':>12} {f'{mode} p95':>10}" for mode in modes)]
+    for name in names:
+        cells = []
+        for mode in modes:
+            row = runs[mode]["results"].get(name)
+            cells.append(f"{row['throughput']:>12.1f} {row['p95'] * 1000:>10.1f}" if row else f"{'-':>12} {'-':>10}")
+        lines.append(f"{name:<32} " + " ".join(cells))
+    return "\n".join(lines) + "\n"
+
+
+def run_server_mode(mode: str, accounts: list[tuple[str, int, int]], options: dict, log) -> dict:
+    """Run the scenarios against one server and return the summary. Starts gunicorn unless ``url`` is given."""
+    server = None
+    if options["url"]:
+        target = urlsplit(options["url"])
+        host, port = target.hostname, target.port or 80
+    else:
+        host, port = "127.0.0.1", _free_port()
+        server = start_server(mode, options["workers"], options["threads"], port, log)
+    try:
+        virtual_users = [VirtualUser(host, port, account, options["items"]) for account in accounts]
+        elapsed, errors = run_users(virtual_users, options["duration"], options["iterations"])
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    summary = summarize([sample for user in virtual_users for sample in user.samples], elapsed)
+    log(f"\n{mode.upper()}\n")
+    log(format_summary(summary))
+    for error in errors:
+        log(f"error: {error}\n")
+    return {"elapsed": elapsed, "errors": errors, "results": summary}
+
+
+def run_loadtest(options: dict, log=sys.stdout.write) -> dict:
+    """
+    Run the load test and return its configuration and the summary per server mode.
+
+    With the server mode ``both`` the same scenarios run against WSGI and then ASGI workers for a comparison.
+    """
+    accounts = prepare(options["users"], options["seed_invoices"], options["seed_items"], seed=options["seed"], log=log)
+    modes = ("wsgi", "asgi") if options["server"] == "both" else (options["server"],)
+    runs = {mode: run_server_mode(mode, accounts, options, log) for mode in modes}
+    if len(runs) > 1:
+        log("\n" + format_comparison(runs))
+    return {
+        "database": settings.DATABASES["default"]["ENGINE"].rsplit(".", 1)[-1],
+        "workers": options["workers"],
+        "threads": options["threads"],
+        "users": options["users"],
+        "items": options["items"],
+        "errors": [error for run in runs.values() for error in run["errors"]],
+        "runs": runs,
+    }
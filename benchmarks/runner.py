@@ -0,0 +1,148 @@
+"""Registers, runs and compares benchmarks."""
+
+import json
+import platform
+import statistics
+import sys
+from dataclasses import dataclass
+from inspect import isgenerator
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import TYPE_CHECKING
+
+import django
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.utils.timezone import now
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+
+class SkipBenchmark(Exception):  # noqa: N818
+    """Raised by the setup of a benchmark that cannot run in the current environment."""
+
+
+@dataclass(frozen=True)
+class Benchmark:
+    """
+    A named benchmark.
+
+    ``setup`` prepares the data outside the measurement and returns the function to time. A setup that has to clean up
+    afterwards yields the function instead and continues after the measurement. ``number`` is the count of calls per
+    sample, use it for very fast functions.
+    """
+
+    name: str
+    setup: Callable[[], Callable[[], object]]
+    number: int = 1
+
+
+BENCHMARKS: list[Benchmark] = []
+
+
+def benchmark(name: str, number: int = 1):
+    """Register the decorated setup function as benchmark."""
+
+    def decorator(setup):
+        BENCHMARKS.append(Benchmark(name, setup, number))
+        return setup
+
+    return decorator
+
+
+def measure(function: Callable[[], object], number: int, repeat: int, warmup: int = 1) -> dict[str, float | int]:
+    """Time the function and return statistics of the seconds per call."""
+    for _ in range(warmup):
+        function()
+    samples = []
+    for _ in range(repeat):
+        start = perf_counter()
+        for _ in range(number):
+            function()
+        samples.append((perf_counter() - start) / number)
+    return {
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "repeat": repeat,
+        "number": number,
+    }
+
+
+def run(name_filter: str = "", repeat: int = 5, log=sys.stdout.write) -> dict:
+    """Run all benchmarks matching the filter against a fresh test database and return the results."""
+    results = {}
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        with (
+            TemporaryDirectory() as media_root,
+            override_settings(
+                MEDIA_ROOT=media_root,
+                STORAGES={
+                    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+                    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+                },
+            ),
+        ):
+            for case in BENCHMARKS:
+                if name_filter not in case.name:
+                    continue
+                try:
+                    setup = case.setup()
+                    function = next(setup) if isgenerator(setup) else setup
+                except SkipBenchmark as reason:
+                    log(f"{case.name:<50} skipped: {reason}\n")
+                    continue
+                try:
+                    results[case.name] = measure(function, case.number, repeat)
+                finally:
+                    if isgenerator(setup):
+                        next(setup, None)
+                log(f"{case.name:<50} {results[case.name]['median'] * 1000:10.3f} ms\n")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+    return {
+        "created": now().isoformat(),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "database": connection.vendor,
+        "results": results,
+    }
+
+
+def write(results: dict, path):
+    """Write the results as JSON."""
+    Path(path).write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+
+
+def read(path) -> dict:
+    """Read results written by :func:`write`."""
+    return json.loads(Path(path).read_text(encoding="utf-8"))
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[tuple[str, float, float, str]]:
+    """
+    Compare the medians of the benchmarks present in both results.
+
+    :param threshold: Relative change that counts as regression or improvement, e.g. 0.2 for 20%.
+    :return: Rows of name, baseline median, current median and status.
+    """
+    rows = []
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        before = baseline["results"][name]["median"]
+        after = result["median"]
+        if after > before * (1 + threshold):
+            status = "REGRESSION"
+        elif after < before * (1 - threshold):
+            status = "improvement"
+        else:
+            status = "ok"
+        rows.append((name, before, after, status))
+    return rows
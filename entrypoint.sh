@@ -4,4 +4,10 @@ python manage.py check --deploy
 python manage.py migrate --noinput
 python manage.py collectstatic --noinput
 python manage.py compilemessages
-gunicorn --bind=0.0.0.0:8000 rechnung.wsgi
+# gunicorn reads the number of worker processes from WEB_CONCURRENCY, its hooks clear stale metrics files
+if [ "$SERVER_MODE" = "asgi" ]; then
+  # the async views run on the event loop of each uvicorn worker
+  gunicorn --bind=0.0.0.0:8000 --config=python:rechnung.gunicorn --worker-class=uvicorn_worker.UvicornWorker rechnung.asgi
+else
+  gunicorn --bind=0.0.0.0:8000 --config=python:rechnung.gunicorn --threads="${GUNICORN_THREADS:-1}" rechnung.wsgi
+fi
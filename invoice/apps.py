@@ -7,3 +7,8 @@ class InvoiceConfig(AppConfig):
     """Configuration for invoice app."""
 
     name = "invoice"
+
+    def ready(self):
+        """Connect the receivers of the signals of the models."""
+        # pylint: disable=import-outside-toplevel,unused-import
+        from invoice import snapshots  # noqa: F401, PLC0415
@@ -0,0 +1,259 @@
+"""
+Import bank statements and mark the invoices they pay as paid.
+
+Two formats are read, both streamed, so that a statement of many megabytes is never held in memory at once:
+
+* CAMT.053 XML, parsed incrementally. Every entry is dropped from the tree as soon as its transactions are read.
+* MT940 text, read line by line.
+
+Only booked credits are transactions. A transaction pays an invoice if its remittance information contains the invoice
+number, like the ``Invoice: <number>`` of the EPC QR code, and its amount is the open balance of the invoice. The open
+invoices are loaded once into an index keyed by their normalized number, currency and open balance, so that matching
+costs a dictionary lookup per transaction. The payments of the matched invoices are then created in bulk.
+"""
+
+import datetime as dt
+import io
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from decimal import Decimal
+from itertools import batched
+from typing import TYPE_CHECKING
+from xml.etree.ElementTree import iterparse
+
+from django.db import transaction
+
+from invoice.models import Invoice, Payment
+
+if TYPE_CHECKING:
+    from django.db.models import QuerySet
+
+REMITTANCE_INFO_LENGTH = Payment._meta.get_field("reference").max_length  # noqa: SLF001
+# MT940 statement line: value date, optional entry date, debit/credit mark, optional funds code, amount, type
+MT940_STATEMENT_LINE = re.compile(r"(?P<date>\d{6})(?:\d{4})?(?P<mark>R?[CD])[A-Z]?(?P<amount>\d+,\d*)[NF]")
+# MT940 opening balance: debit/credit mark, date, currency
+MT940_OPENING_BALANCE = re.compile(r"[CD]\d{6}(?P<currency>[A-Z]{3})")
+# structured MT940 information: the remittance information is split into the subfields ?20 to ?29 and ?60 to ?63
+MT940_SUBFIELD = re.compile(r"\?(\d\d)")
+MT940_REMITTANCE_SUBFIELDS = frozenset({*(str(code) for code in range(20, 30)), "60", "61", "62", "63"})
+
+
+@dataclass(frozen=True)
+class Transaction:
+    """Incoming transfer of a bank statement."""
+
+    amount: Decimal
+    currency: str
+    date: dt.date
+    remittance_info: str
+
+
+@dataclass
+class ImportResult:
+    """Outcome of the import of a bank statement."""
+
+    matched: int = 0
+    unmatched: list[Transaction] = field(default_factory=list)
+
+
+def normalize_reference(text: str) -> str:
+    """Normalize an invoice number or a part of a remittance information to its letters and digits, case-folded."""
+    return "".join(character for character in text.casefold() if character.isalnum())
+
+
+def reference_candidates(remittance_info: str) -> list[str]:
+    """
+    Get the normalized strings of the remittance information that might be an invoice number.
+
+    These are every word and every rest of the text from a word on, e.g. an invoice number after a label, which banks
+    might have split with spaces.
+    """
+    words = [normalize_reference(word) for word in re.split(r"[\s:]+", remittance_info)]
+    candidates = ["".join(words[start:]) for start in range(len(words))] + words
+    return [candidate for candidate in dict.fromkeys(candidates) if candidate]
+
+
+def _local_tags(namespace: str, path: str) -> str:
+    """Qualify every tag of the element path with the namespace of the document."""
+    return "/".join(namespace + tag for tag in path.split("/"))
+
+
+def _text(element, namespace: str, path: str) -> str:
+    """Get the stripped text of the child at the path, an empty string if it is missing."""
+    child = element.find(_local_tags(namespace, path))
+    return "" if child is None else "".join(child.itertext()).strip()
+
+
+def _camt_transactions(entry, namespace: str):
+    """Get the transactions of a booked credit entry, one per transaction detail if the entry is a batch."""
+    if _text(entry, namespace, "CdtDbtInd") != "CRDT" or _text(entry, namespace, "RvslInd") == "true":
+        return
+    if _text(entry, namespace, "Sts") not in {"", "BOOK"}:
+        return
+    amount = entry.find(_local_tags(namespace, "Amt"))
+    date = _text(entry, namespace, "BookgDt/Dt") or _text(entry, namespace, "BookgDt/DtTm")[:10]
+    details = entry.findall(_local_tags(namespace, "NtryDtls/TxDtls"))
+    for detail in details or [entry]:
+        detail_amount = detail.find(_local_tags(namespace, "AmtDtls/TxAmt/Amt"))
+        if detail_amount is None or len(details) <= 1:
+            detail_amount = amount
+        remittance = detail.find(_local_tags(namespace, "RmtInf"))
+        yield Transaction(
+            amount=Decimal(detail_amount.text.strip()),
+            currency=detail_amount.get("Ccy", ""),
+            date=dt.date.fromisoformat(date),
+            remittance_info="" if remittance is None else " ".join(" ".join(remittance.itertext()).split()),
+        )
+
+
+def parse_camt053(file):
+    """Yield the transactions of a CAMT.053 statement in a binary file, parsed incrementally."""
+    namespace = ""
+    statement = None
+    # entities are not resolved by the parser and expat limits their expansion
+    for event, element in iterparse(file, events=("start", "end")):  # noqa: S314
+        tag = element.tag.rpartition("}")[2]
+        if event == "start":
+            if not namespace and element.tag.startswith("{"):
+                namespace = element.tag[: element.tag.index("}") + 1]
+            if tag == "Stmt":
+                statement = element
+        elif tag == "Ntry":
+            yield from _camt_transactions(element, namespace)
+            element.clear()
+            if statement is not None:
+                statement.remove(element)
+
+
+def _mt940_remittance_info(information: str) -> str:
+    """Get the remittance information of the :86: field, from its subfields if it is structured."""
+    parts = MT940_SUBFIELD.split(information)
+    if len(parts) == 1:
+        return information
+    return "".join(text for code, text in batched(parts[1:], 2, strict=True) if code in MT940_REMITTANCE_SUBFIELDS)
+
+
+def _mt940_transaction(line: str, information: str, currency: str) -> Transaction | None:
+    """Get the transaction of a statement line and its information, None unless it is a credit."""
+    match = MT940_STATEMENT_LINE.match(line)
+    if match is None or match["mark"] != "C":
+        return None
+    return Transaction(
+        amount=Decimal(match["amount"].replace(",", ".")),
+        currency=currency,
+        date=dt.datetime.strptime(match["date"], "%y%m%d").date(),  # noqa: DTZ007
+        remittance_info=_mt940_remittance_info(information),
+    )
+
+
+def parse_mt940(file):
+    """
+    Yield the transactions of an MT940 statement in a binary file, read line by line.
+
+    A statement line :61: is complete at the next field other than its information :86:, whose value may continue over
+    several lines.
+    """
+    currency = ""
+    line = None
+    information = ""
+    text_file = io.TextIOWrapper(file, encoding="latin-1", newline=None)
+    try:
+        for text in map(str.rstrip, text_file):
+            if not text.startswith((":", "-")):
+                information += text if information else ""
+                continue
+            tag, _, value = text[1:].partition(":")
+            if line is not None and tag != "86":
+                if (found := _mt940_transaction(line, information, currency)) is not None:
+                    yield found
+                line = None
+            information = ""
+            if tag in {"60F", "60M"} and (match := MT940_OPENING_BALANCE.match(value)):
+                currency = match["currency"]
+            elif tag == "61":
+                line = value
+            elif tag == "86" and line is not None:
+                information = value
+        if line is not None and (found := _mt940_transaction(line, information, currency)) is not None:
+            yield found
+    finally:
+        # leave the file open for the caller
+        text_file.detach()
+
+
+def parse_statement(file):
+    """Yield the transactions of a statement in a binary file, CAMT.053 if it is XML and MT940 otherwise."""
+    start = file.read(64)
+    file.seek(0)
+    if start.lstrip(b"\xef\xbb\xbf \t\r\n").startswith(b"<"):
+        return parse_camt053(file)
+    return parse_mt940(file)
+
+
+def open_invoice_index(invoices: QuerySet) -> dict[tuple[str, str, Decimal], list[int]]:
+    """
+    Index the open final invoices by their normalized number, currency and open balance.
+
+    The invoices are read by one query, which the partial index ``invoice_open`` covers. The IDs of all invoices with
+    the same key are kept, so that an ambiguous transaction can be told apart.
+    """
+    index = defaultdict(list)
+    rows = (
+        invoices.filter(final=True, open_balance__gt=0)
+        .order_by()
+        .values_list("pk", "invoice_number", "currency", "open_balance")
+    )
+    for pk, invoice_number, currency, open_balance in rows.iterator(chunk_size=2000):
+        index[normalize_reference(invoice_number), currency, open_balance].append(pk)
+    return dict(index)
+
+
+def match_transactions(transactions, index: dict[tuple[str, str, Decimal], list[int]]) -> tuple[dict, list]:
+    """
+    Match the transactions to the open invoices of the index.
+
+    A transaction matches if one of its reference candidates and its amount are the key of exactly one invoice. Every
+    invoice is paid at most once, so that a transfer paid twice is left for manual review. Return the transactions by
+    the IDs of their invoices and the unmatched transactions.
+    """
+    matches = {}
+    unmatched = []
+    for transfer in transactions:
+        for candidate in reference_candidates(transfer.remittance_info):
+            invoice_ids = index.get((candidate, transfer.currency, transfer.amount))
+            if invoice_ids is not None and len(invoice_ids) == 1 and invoice_ids[0] not in matches:
+                matches[invoice_ids[0]] = transfer
+                break
+        else:
+            unmatched.append(transfer)
+    return matches, unmatched
+
+
+def record_payments(matches: dict[int, Transaction], chunk_size: int = 500) -> int:
+    """
+    Create a payment per matched invoice and refresh the open balances of these invoices.
+
+    Every chunk is created by one bulk insert and refreshed by one aggregate query in its own transaction. Return the
+    number of payments.
+    """
+    for chunk in batched(matches.items(), chunk_size, strict=False):
+        payments = [
+            Payment(
+                invoice_id=invoice_id,
+                amount=transfer.amount,
+                date=transfer.date,
+                reference=transfer.remittance_info[:REMITTANCE_INFO_LENGTH],
+            )
+            for invoice_id, transfer in chunk
+        ]
+        with transaction.atomic():
+            Payment.objects.bulk_create(payments)
+            Invoice.objects.filter(pk__in=[invoice_id for invoice_id, _ in chunk]).refresh_open_balances()
+    return len(matches)
+
+
+def import_statement(file, invoices: QuerySet) -> ImportResult:
+    """Import the bank statement in a binary file and record the payments of the invoices it pays."""
+    matches, unmatched = match_transactions(parse_statement(file), open_invoice_index(invoices))
+    return ImportResult(matched=record_payments(matches), unmatched=unmatched)
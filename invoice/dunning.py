@@ -0,0 +1,136 @@
+"""
+Dunning of the overdue final invoices: a reminder PDF per invoice whose dunning level rises.
+
+An unpaid final invoice reaches level n once it is ``DUNNING_DAYS[n - 1]`` days past its due date. A dunning run
+selects every invoice whose level is above the level of its last reminder by one query, which the partial index
+``invoice_open`` covers. It renders their reminders in a process pool and records the new level and the date of the
+run per invoice. An invoice is reminded at most once a day, so a repeated run of the same day does nothing, and a run
+that was interrupted only renders the remaining reminders. Invoices without a due date are never overdue.
+"""
+
+import datetime as dt
+from dataclasses import dataclass
+from itertools import batched
+from typing import TYPE_CHECKING
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, PositiveSmallIntegerField, QuerySet, Value, When
+from django.utils.translation import gettext
+
+from invoice import render_worker
+from invoice.models import Invoice
+from invoice.render_pool import batch_renderer
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+@dataclass(frozen=True)
+class Reminder:
+    """Reminder of an overdue invoice at a dunning level."""
+
+    invoice: Invoice
+    level: int
+    date: dt.date
+    final: bool = False
+
+    @property
+    def filename(self) -> str:
+        """Get the name of the PDF file, the same on every run."""
+        return f"reminder-{self.invoice.pk}-{self.level}.pdf"
+
+    @property
+    def title(self) -> str:
+        """Get the title of the reminder in the active language."""
+        if self.level == 1:
+            return gettext("Payment reminder")
+        if self.final:
+            return gettext("Final dunning notice")
+        return gettext("Dunning notice")
+
+    def text(self, amount: str) -> str:
+        """Get the text of the reminder in the active language, the amount is the formatted open balance."""
+        values = {
+            "number": escape(self.invoice.invoice_number),
+            "date": self.invoice.date,
+            "due_date": self.invoice.due_date,
+            "amount": amount,
+        }
+        if self.level == 1:
+            return (
+                gettext(
+                    "We kindly remind you that the invoice %(number)s of %(date)s was due on %(due_date)s. "
+                    "Please transfer the open amount of %(amount)s."
+                )
+                % values
+            )
+        return (
+            gettext(
+                "Despite our reminder the invoice %(number)s of %(date)s, due on %(due_date)s, is still unpaid. "
+                "Please transfer the open amount of %(amount)s within seven days."
+            )
+            % values
+        )
+
+
+def dunning_level(today: dt.date):
+    """Get an expression of the dunning level an invoice reaches today by its due date."""
+    return Case(
+        *(
+            When(due_date__lte=today - dt.timedelta(days=days), then=Value(level))
+            for level, days in reversed(list(enumerate(sorted(settings.DUNNING_DAYS), start=1)))
+        ),
+        default=Value(0),
+        output_field=PositiveSmallIntegerField(),
+    )
+
+
+def overdue_invoices(invoices: QuerySet, today: dt.date) -> QuerySet:
+    """
+    Get the invoices to remind today, with their new level as ``reached_level``.
+
+    These are the open final invoices that reached a higher level than the level of their last reminder and were not
+    reminded today. They come with everything the reminder shows, so that the render does not need the database.
+    """
+    if not settings.DUNNING_DAYS:
+        return invoices.none()
+    return (
+        invoices.filter(
+            final=True, open_balance__gt=0, due_date__lte=today - dt.timedelta(days=min(settings.DUNNING_DAYS))
+        )
+        .exclude(dunned_on=today)
+        .annotate(reached_level=dunning_level(today))
+        .filter(dunning_level__lt=F("reached_level"))
+        .select_related("vendor__address", "vendor__bank_account", "customer__address")
+        .order_by("vendor_id", "due_date", "pk")
+    )
+
+
+def run_dunning(invoices: QuerySet, today: dt.date, output: Path, processes: int, chunk_size: int = 100) -> int:
+    """
+    Write the reminders of the overdue invoices into the output directory and record their levels.
+
+    The levels of every chunk of reminders are recorded by one bulk update as soon as their PDFs are written. Return
+    the number of reminders.
+    """
+    final_level = len(settings.DUNNING_DAYS)
+    reminders = [
+        Reminder(invoice, invoice.reached_level, today, final=invoice.reached_level == final_level)
+        for invoice in overdue_invoices(invoices, today)
+    ]
+    output.mkdir(parents=True, exist_ok=True)
+    with batch_renderer(render_worker.render_reminder, processes) as render:
+        for chunk in batched(zip(reminders, render(reminders), strict=True), chunk_size, strict=False):
+            for reminder, pdf in chunk:
+                (output / reminder.filename).write_bytes(pdf)
+            with transaction.atomic():
+                Invoice.objects.bulk_update(
+                    [
+                        Invoice(pk=reminder.invoice.pk, dunning_level=reminder.level, dunned_on=today)
+                        for reminder, _ in chunk
+                    ],
+                    ["dunning_level", "dunned_on"],
+                )
+    return len(reminders)
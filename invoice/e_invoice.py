@@ -0,0 +1,410 @@
+"""
+Structured e-invoices: the UN/CEFACT Cross Industry Invoice (CII) XML of the EN 16931 profile of ZUGFeRD/Factur-X.
+
+The XML is written element by element by an :class:`~xml.sax.saxutils.XMLGenerator` and handed out in chunks, so that
+an invoice with thousands of items streams out without a document tree. The amounts follow the calculation rules of
+EN 16931: every line is rounded to two decimals, the VAT of each rate is computed from the sum of its rounded lines, see
+:func:`~invoice.models.tax_bases`. The PDF, the snapshot and the open balance round the same way.
+
+The XML can be embedded into the invoice PDF as ``factur-x.xml`` attachment, which turns it into a ZUGFeRD invoice.
+The PDF is not PDF/A-3 though, its standard fonts are not embedded.
+"""
+
+import io
+import re
+import zipfile
+from collections import defaultdict
+from decimal import Decimal
+from itertools import groupby
+from operator import attrgetter
+from typing import TYPE_CHECKING
+from xml.sax.saxutils import XMLGenerator
+
+from django.utils.text import get_valid_filename
+from reportlab.pdfbase.pdfdoc import PDFArray, PDFDictionary, PDFName, PDFStream, PDFString, PDFZCompress
+
+from invoice.models import CENT, InvoiceItem, InvoiceSnapshot, rounded_taxes
+
+if TYPE_CHECKING:
+    import datetime as dt
+    from collections.abc import Iterable, Iterator
+
+    from django.db.models import QuerySet
+
+    from invoice.models import Address, Invoice
+
+GUIDELINE_EN16931 = "urn:cen.eu:en16931:2017"
+NAMESPACES = {
+    "rsm": "urn:un:unece:uncefact:data:standard:CrossIndustryInvoice:100",
+    "ram": "urn:un:unece:uncefact:data:standard:ReusableAggregateBusinessInformationEntity:100",
+    "udt": "urn:un:unece:uncefact:data:standard:UnqualifiedDataType:100",
+    "qdt": "urn:un:unece:uncefact:data:standard:QualifiedDataType:100",
+}
+ATTACHMENT_NAME = "factur-x.xml"
+# commercial invoice of UNTDID 1001, SEPA credit transfer of UNTDID 4461
+INVOICE_TYPE_CODE = "380"
+CREDIT_TRANSFER_CODE = "58"
+# UN/ECE recommendation 20 codes of common units, all others are "one"
+UNIT_CODES = {
+    "h": "HUR",
+    "hour": "HUR",
+    "hours": "HUR",
+    "std": "HUR",
+    "stunde": "HUR",
+    "stunden": "HUR",
+    "d": "DAY",
+    "day": "DAY",
+    "days": "DAY",
+    "tag": "DAY",
+    "tage": "DAY",
+    "month": "MON",
+    "months": "MON",
+    "monat": "MON",
+    "monate": "MON",
+    "pcs": "H87",
+    "piece": "H87",
+    "pieces": "H87",
+    "stk": "H87",
+    "stück": "H87",
+    "kg": "KGM",
+    "km": "KMT",
+    "m": "MTR",
+    "l": "LTR",
+}
+DEFAULT_UNIT_CODE = "C62"
+# lines written before the next chunk is handed out
+LINES_PER_CHUNK = 100
+
+
+def unit_code(unit: str) -> str:
+    """Get the UN/ECE recommendation 20 code of the unit of an item."""
+    return UNIT_CODES.get(unit.strip().rstrip(".").casefold(), DEFAULT_UNIT_CODE)
+
+
+def tax_category(rate: Decimal) -> str:
+    """Get the VAT category of UNTDID 5305 of the tax rate: standard rated or zero rated."""
+    return "S" if rate else "Z"
+
+
+def _number(value: Decimal) -> str:
+    """Format a quantity or percentage without exponent and trailing zeros."""
+    return format(value.normalize(), "f")
+
+
+def _percent(rate: Decimal) -> str:
+    """Format a tax rate in percent."""
+    return _number(rate * 100)
+
+
+class CiiWriter:
+    """Write the CII XML of an invoice into a text buffer, from which the chunks are taken."""
+
+    def __init__(self):
+        """Create a writer with an empty buffer."""
+        self._buffer = io.StringIO()
+        self._xml = XMLGenerator(self._buffer, encoding="utf-8", short_empty_elements=True)
+
+    def take(self) -> str:
+        """Take the text written since the last call."""
+        text = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return text
+
+    def start(self, name: str, attributes: dict | None = None):
+        """Open an element."""
+        self._xml.startElement(name, attributes or {})
+
+    def end(self, name: str):
+        """Close an element."""
+        self._xml.endElement(name)
+
+    def element(self, name: str, text, attributes: dict | None = None):
+        """Write an element with the text, nothing if the text is empty."""
+        if text is None or text == "":
+            return
+        self.start(name, attributes)
+        self._xml.characters(str(text))
+        self.end(name)
+
+    def date(self, name: str, value: dt.date):
+        """Write a date element in the format 102, i.e. YYYYMMDD."""
+        self.start(name)
+        self.element("udt:DateTimeString", f"{value:%Y%m%d}", {"format": "102"})
+        self.end(name)
+
+    def address(self, address: Address):
+        """Write a postal address."""
+        self.start("ram:PostalTradeAddress")
+        self.element("ram:PostcodeCode", address.postcode)
+        self.element("ram:LineOne", address.line_1)
+        self.element("ram:LineTwo", address.line_2)
+        self.element("ram:LineThree", address.line_3)
+        self.element("ram:CityName", address.city)
+        self.element("ram:CountryID", address.country.code)
+        self.element("ram:CountrySubDivisionName", address.state)
+        self.end("ram:PostalTradeAddress")
+
+    def start_document(self, invoice: Invoice):
+        """Write the context and the header of the invoice and open the transaction."""
+        self._xml.startDocument()
+        self.start("rsm:CrossIndustryInvoice", {f"xmlns:{prefix}": uri for prefix, uri in NAMESPACES.items()})
+        self.start("rsm:ExchangedDocumentContext")
+        self.start("ram:GuidelineSpecifiedDocumentContextParameter")
+        self.element("ram:ID", GUIDELINE_EN16931)
+        self.end("ram:GuidelineSpecifiedDocumentContextParameter")
+        self.end("rsm:ExchangedDocumentContext")
+        self.start("rsm:ExchangedDocument")
+        self.element("ram:ID", invoice.invoice_number)
+        self.element("ram:TypeCode", INVOICE_TYPE_CODE)
+        self.date("ram:IssueDateTime", invoice.date)
+        self.end("rsm:ExchangedDocument")
+        self.start("rsm:SupplyChainTradeTransaction")
+
+    def line(self, number: int, item: InvoiceItem) -> Decimal:
+        """Write a line of the item and return its net amount rounded to two decimals."""
+        price, quantity = item.price, item.quantity
+        if price < 0:
+            # the net price of EN 16931 is never negative, a discount is a negative quantity
+            price, quantity = -price, -quantity
+        amount = (price * quantity).quantize(CENT)
+        self.start("ram:IncludedSupplyChainTradeLineItem")
+        self.start("ram:AssociatedDocumentLineDocument")
+        self.element("ram:LineID", number)
+        self.end("ram:AssociatedDocumentLineDocument")
+        self.start("ram:SpecifiedTradeProduct")
+        self.element("ram:Name", item.name)
+        self.element("ram:Description", item.description)
+        self.end("ram:SpecifiedTradeProduct")
+        self.start("ram:SpecifiedLineTradeAgreement")
+        self.start("ram:NetPriceProductTradePrice")
+        self.element("ram:ChargeAmount", price)
+        self.end("ram:NetPriceProductTradePrice")
+        self.end("ram:SpecifiedLineTradeAgreement")
+        self.start("ram:SpecifiedLineTradeDelivery")
+        self.element("ram:BilledQuantity", _number(quantity), {"unitCode": unit_code(item.unit)})
+        self.end("ram:SpecifiedLineTradeDelivery")
+        self.start("ram:SpecifiedLineTradeSettlement")
+        self.start("ram:ApplicableTradeTax")
+        self.element("ram:TypeCode", "VAT")
+        self.element("ram:CategoryCode", tax_category(item.tax))
+        self.element("ram:RateApplicablePercent", _percent(item.tax))
+        self.end("ram:ApplicableTradeTax")
+        self.start("ram:SpecifiedTradeSettlementLineMonetarySummation")
+        self.element("ram:LineTotalAmount", amount)
+        self.end("ram:SpecifiedTradeSettlementLineMonetarySummation")
+        self.end("ram:SpecifiedLineTradeSettlement")
+        self.end("ram:IncludedSupplyChainTradeLineItem")
+        return amount
+
+    def parties(self, invoice: Invoice):
+        """Write the agreement with the vendor as seller and the customer as buyer, and the delivery."""
+        vendor = invoice.vendor
+        customer = invoice.customer
+        self.start("ram:ApplicableHeaderTradeAgreement")
+        self.start("ram:SellerTradeParty")
+        self.element("ram:Name", str(vendor))
+        self.address(vendor.address)
+        if vendor.tax_id:
+            self.start("ram:SpecifiedTaxRegistration")
+            # a VAT ID starts with the country code, a tax number with digits
+            scheme = "VA" if re.match(r"[A-Za-z]{2}", vendor.tax_id) else "FC"
+            self.element("ram:ID", vendor.tax_id, {"schemeID": scheme})
+            self.end("ram:SpecifiedTaxRegistration")
+        self.end("ram:SellerTradeParty")
+        self.start("ram:BuyerTradeParty")
+        self.element("ram:Name", customer.full_name)
+        self.address(customer.address)
+        if customer.email:
+            self.start("ram:URIUniversalCommunication")
+            self.element("ram:URIID", customer.email, {"schemeID": "EM"})
+            self.end("ram:URIUniversalCommunication")
+        self.end("ram:BuyerTradeParty")
+        self.end("ram:ApplicableHeaderTradeAgreement")
+        self.start("ram:ApplicableHeaderTradeDelivery")
+        if invoice.delivery_date:
+            self.date("ram:ActualDeliverySupplyChainEvent", invoice.delivery_date)
+        self.end("ram:ApplicableHeaderTradeDelivery")
+
+    def settlement(self, invoice: Invoice, bases: dict[Decimal, Decimal]):
+        """Write the payment means, the VAT breakdown of the net amounts per tax rate and the totals."""
+        currency = invoice.currency
+        self.start("ram:ApplicableHeaderTradeSettlement")
+        self.element("ram:PaymentReference", invoice.invoice_number)
+        self.element("ram:InvoiceCurrencyCode", currency)
+        if bank_account := invoice.vendor.bank_account:
+            self.start("ram:SpecifiedTradeSettlementPaymentMeans")
+            self.element("ram:TypeCode", CREDIT_TRANSFER_CODE)
+            self.start("ram:PayeePartyCreditorFinancialAccount")
+            self.element("ram:IBANID", bank_account.iban.replace(" ", ""))
+            self.element("ram:AccountName", bank_account.owner)
+            self.end("ram:PayeePartyCreditorFinancialAccount")
+            if bank_account.bic:
+                self.start("ram:PayeeSpecifiedCreditorFinancialInstitution")
+                self.element("ram:BICID", bank_account.bic)
+                self.end("ram:PayeeSpecifiedCreditorFinancialInstitution")
+            self.end("ram:SpecifiedTradeSettlementPaymentMeans")
+        taxes = rounded_taxes(bases)
+        for rate, basis in sorted(bases.items()):
+            self.start("ram:ApplicableTradeTax")
+            self.element("ram:CalculatedAmount", taxes[rate])
+            self.element("ram:TypeCode", "VAT")
+            self.element("ram:BasisAmount", basis)
+            self.element("ram:CategoryCode", tax_category(rate))
+            self.element("ram:RateApplicablePercent", _percent(rate))
+            self.end("ram:ApplicableTradeTax")
+        if invoice.due_date:
+            self.start("ram:SpecifiedTradePaymentTerms")
+            self.date("ram:DueDateDateTime", invoice.due_date)
+            self.end("ram:SpecifiedTradePaymentTerms")
+        net_total = sum(bases.values(), Decimal("0.00"))
+        tax_total = sum(taxes.values(), Decimal("0.00"))
+        self.start("ram:SpecifiedTradeSettlementHeaderMonetarySummation")
+        self.element("ram:LineTotalAmount", net_total)
+        self.element("ram:TaxBasisTotalAmount", net_total)
+        self.element("ram:TaxTotalAmount", tax_total, {"currencyID": currency})
+        self.element("ram:GrandTotalAmount", net_total + tax_total)
+        self.element("ram:DuePayableAmount", net_total + tax_total)
+        self.end("ram:SpecifiedTradeSettlementHeaderMonetarySummation")
+        self.end("ram:ApplicableHeaderTradeSettlement")
+
+    def end_document(self):
+        """Close the transaction and the document."""
+        self.end("rsm:SupplyChainTradeTransaction")
+        self.end("rsm:CrossIndustryInvoice")
+        self._xml.endDocument()
+
+
+def cii_chunks(invoice: Invoice, items: Iterable[InvoiceItem] | None = None) -> Iterator[str]:
+    """
+    Yield the CII XML of the invoice in chunks.
+
+    The items are read from the database in batches by default. An invoice with its items already loaded, e.g. in a
+    render process, passes them instead. The vendor, customer, their addresses and the bank account should come with the
+    invoice, e.g. from :func:`~invoice.render_pool.invoice_pdf_queryset`.
+    """
+    if items is None:
+        items = invoice.invoiceitem_set.order_by("pk").iterator(chunk_size=2000)
+    writer = CiiWriter()
+    writer.start_document(invoice)
+    bases = defaultdict(lambda: Decimal("0.00"))
+    for number, item in enumerate(items, start=1):
+        bases[item.tax] += writer.line(number, item)
+        if number % LINES_PER_CHUNK == 0:
+            yield writer.take()
+    writer.parties(invoice)
+    writer.settlement(invoice, bases)
+    writer.end_document()
+    yield writer.take()
+
+
+def cii_xml(invoice: Invoice, items: Iterable[InvoiceItem] | None = None) -> bytes:
+    """Get the CII XML of the invoice as UTF-8."""
+    return "".join(cii_chunks(invoice, items)).encode()
+
+
+def e_invoice_documents(invoices: QuerySet) -> Iterator[tuple[Invoice, Iterator[InvoiceItem]]]:
+    """
+    Yield the final invoices with an iterator of their items, in the order of their IDs.
+
+    The invoices and all their items are read by two queries in batches, so that thousands of invoices are exported
+    without a query per invoice. The items of an invoice have to be consumed before the next invoice is taken.
+    """
+    invoices = (
+        invoices.filter(final=True)
+        .select_related("vendor__address", "vendor__bank_account", "customer__address")
+        .order_by("pk")
+    )
+    items = InvoiceItem.objects.filter(invoice__in=invoices.values("pk")).order_by("invoice_id", "pk")
+    groups = groupby(items.iterator(chunk_size=2000), key=attrgetter("invoice_id"))
+    group = next(groups, None)
+    for invoice in invoices.iterator(chunk_size=500):
+        if group is not None and group[0] == invoice.pk:
+            yield invoice, group[1]
+            group = next(groups, None)
+        else:
+            yield invoice, iter(())
+
+
+def archive_name(vendor_id: int, invoice_number: str) -> str:
+    """Get the name of the XML of the invoice in an export archive, unique by the vendor."""
+    return f"{vendor_id}/{get_valid_filename(invoice_number)}.xml"
+
+
+def write_e_invoice_archive(invoices: QuerySet, file) -> int:
+    """
+    Write the CII XML of every final invoice into a ZIP archive, streamed entry by entry. Return the number of invoices.
+
+    The XML of the invoices with a snapshot is read from it, see :mod:`invoice.snapshots`, in the order of their IDs.
+    The XML of the other final invoices follows, generated from their current data. The file may be a path or a
+    binary file, e.g. a response.
+    """
+    count = 0
+    snapshots = (
+        InvoiceSnapshot.objects.filter(pk__in=invoices.filter(final=True).values("pk"))
+        .order_by("pk")
+        .values_list("data__vendor__id", "data__invoice_number", "xml")
+    )
+    with zipfile.ZipFile(file, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for vendor_id, invoice_number, xml in snapshots.iterator(chunk_size=100):
+            archive.writestr(archive_name(vendor_id, invoice_number), bytes(xml))
+            count += 1
+        for invoice, items in e_invoice_documents(invoices.filter(snapshot__isnull=True)):
+            with archive.open(archive_name(invoice.vendor_id, invoice.invoice_number), "w") as entry:
+                for chunk in cii_chunks(invoice, items):
+                    entry.write(chunk.encode())
+            count += 1
+    return count
+
+
+def _xmp_metadata() -> bytes:
+    """Get the XMP metadata of the Factur-X extension schema, which announces the attachment."""
+    return (
+        '<?xpacket begin="\ufeff" id="W5M0MpCehiHzreSzNTczkc9d"?>'
+        '<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">'
+        '<rdf:Description rdf:about="" xmlns:fx="urn:factur-x:pdfa:CrossIndustryDocument:invoice:1p0#">'
+        f"<fx:DocumentType>INVOICE</fx:DocumentType><fx:DocumentFileName>{ATTACHMENT_NAME}</fx:DocumentFileName>"
+        "<fx:Version>1.0</fx:Version><fx:ConformanceLevel>EN 16931</fx:ConformanceLevel>"
+        '</rdf:Description></rdf:RDF></x:xmpmeta><?xpacket end="w"?>'
+    ).encode()
+
+
+def embed_cii_xml(pdf_object, xml: bytes):
+    """Attach the CII XML to the PDF canvas as ``factur-x.xml`` with the Factur-X metadata, before it is saved."""
+    document = pdf_object._doc  # noqa: SLF001 # pylint: disable=protected-access
+    stream = document.Reference(
+        PDFStream(
+            PDFDictionary(
+                {
+                    "Type": PDFName("EmbeddedFile"),
+                    # PDFName escapes the number sign of the escaped slash
+                    "Subtype": "/text#2Fxml",
+                    "Params": PDFDictionary({"Size": len(xml)}),
+                }
+            ),
+            content=xml,
+            filters=[PDFZCompress],
+        )
+    )
+    file_specification = document.Reference(
+        PDFDictionary(
+            {
+                "Type": PDFName("Filespec"),
+                "F": PDFString(ATTACHMENT_NAME),
+                "UF": PDFString(ATTACHMENT_NAME),
+                "Desc": PDFString("Factur-X"),
+                "AFRelationship": PDFName("Alternative"),
+                "EF": PDFDictionary({"F": stream, "UF": stream}),
+            }
+        )
+    )
+    catalog = document.Catalog
+    catalog.Names = PDFDictionary(
+        {"EmbeddedFiles": PDFDictionary({"Names": PDFArray([PDFString(ATTACHMENT_NAME), file_specification])})}
+    )
+    catalog.Metadata = PDFStream(
+        PDFDictionary({"Type": PDFName("Metadata"), "Subtype": PDFName("XML")}), _xmp_metadata()
+    )
+    # the associated files of PDF/A-3, which the catalog does not know
+    catalog.AF = PDFArray([file_specification])
+    catalog.__NoDefault__ = [*catalog.__NoDefault__, "AF"]
@@ -4,6 +4,8 @@ from decimal import Decimal
 
 from schwifty import BIC, IBAN
 
+from rechnung.metrics import EPC_QR_SECONDS
+
 _VERSIONS = ("001", "002")
 _ENCODINGS = {
     "1": {"utf8", "utf-8"},
@@ -17,7 +19,105 @@ _ENCODINGS = {
 }
 
 
-def gen_epc_qr_data(  # noqa: C901, PLR0912, PLR0913
+def clean_text(s, max_length) -> str:
+    """Clean a string for inclusion in the EPC QR code format."""
+    s = str("" if s is None else s).strip()
+    for pattern in ("\r\n", "\n"):
+        s = s.replace(pattern, " ")
+    return s[:max_length]
+
+
+class EpcBeneficiary:  # pylint: disable=too-few-public-methods
+    """
+    Validated beneficiary of EPC QR codes, which generates the payloads of any number of transfers to its account.
+
+    The name, IBAN and BIC are validated once, so that the payloads of many invoices of a vendor only format their
+    amounts and remittance informations.
+    """
+
+    def __init__(  # noqa: C901, PLR0913
+        self,
+        name: str,
+        iban: str,
+        *,
+        bic: str | None = None,
+        version: str = "001",
+        encoding: str = "utf-8",
+        instant: bool = False,
+        always_add_bic: bool = True,
+        use_crlf: bool = False,
+    ):
+        # pylint: disable=too-many-arguments
+        """Validate the beneficiary, see :func:`gen_epc_qr_data` for the parameters."""
+        if version not in _VERSIONS:
+            raise ValueError(f"unsupported version {version}")
+
+        identification = "SCT" if instant else "INST"
+
+        for k, v in _ENCODINGS.items():
+            if encoding in v:
+                encoding_key = k
+                break
+        else:
+            raise ValueError(f"unsupported encoding {encoding}")
+
+        if not iban:
+            raise ValueError("beneficiary_iban is required")
+        self.iban = IBAN(iban)
+
+        self.name = clean_text(name, max_length=70)
+        if not self.name:
+            raise ValueError("beneficiary name is required")
+
+        self.bic = self.iban.bic
+        if bic:
+            bic = BIC(bic)
+            if self.bic and bic != self.bic:
+                raise ValueError(f"bic {self.bic} from iban {self.iban} != beneficiary_bic {bic}")
+            if not self.bic:
+                self.bic = bic
+        if version == "001" and not self.bic:
+            raise ValueError("bic is required for version 001")
+        qr_bic = self.bic
+        if version == "002" and not always_add_bic and self.iban.bic:
+            qr_bic = None
+
+        self.line_separator = "\r\n" if use_crlf else "\n"
+        self.head = ["BCD", version, encoding_key, identification, qr_bic, self.name, self.iban]
+
+    def payload(
+        self,
+        *,
+        eur_amount: float | str | Decimal | None = None,
+        purpose: str = "",
+        structured_remittance_info: str = "",
+        remittance_info: str = "",
+        originator_info: str = "",
+    ) -> str:
+        """Generate the EPC QR code data of a transfer to the beneficiary, see :func:`gen_epc_qr_data`."""
+        eur_amount_num = Decimal(eur_amount).quantize(Decimal("0.01"))
+        if not Decimal("0.01") <= eur_amount_num <= Decimal("999999999.99"):
+            raise ValueError(f"eur_amount {eur_amount_num} is out of bounds")
+        eur_amount_str = f"EUR{eur_amount_num}" if eur_amount else ""
+
+        purpose = clean_text(purpose, max_length=4)
+
+        structured_remittance_info = clean_text(structured_remittance_info, max_length=35)
+        remittance_info = clean_text(remittance_info, max_length=140)
+        if structured_remittance_info and remittance_info:
+            raise ValueError("structured_remittance_info and remittance_info are exclusive")
+
+        originator_info = clean_text(originator_info, max_length=70)
+
+        return self.line_separator.join(
+            map(
+                str, [*self.head, eur_amount_str, purpose, structured_remittance_info, remittance_info, originator_info]
+            )
+        )
+
+
+@EPC_QR_SECONDS.time()
+def gen_epc_qr_data(  # noqa: PLR0913
     beneficiary_name: str,
     beneficiary_iban: str,
     *,
@@ -33,7 +133,7 @@ def gen_epc_qr_data(  # noqa: C901, PLR0912, PLR0913
     always_add_bic: bool = True,
     use_crlf: bool = False,
 ) -> str:
-    # pylint: disable=too-many-locals,too-many-arguments,too-many-positional-arguments,too-many-branches,line-too-long
+    # pylint: disable=too-many-arguments,line-too-long
     """Generate EPC QR code data (`Official`_, `Wikipedia`_) as a string.
 
     Strings should not contain newlines or be longer than the maximum length for their field!
@@ -59,77 +159,20 @@ def gen_epc_qr_data(  # noqa: C901, PLR0912, PLR0913
     .. _Official: https://www.europeanpaymentscouncil.eu/document-library/guidance-documents/quick-response-code-guidelines-enable-data-capture-initiation
     .. _Wikipedia: https://de.wikipedia.org/wiki/EPC-QR-Code
     """
-
-    def clean_text(s, max_length) -> str:
-        """Clean a string for inclusion in the EPC QR code format."""
-        s = str("" if s is None else s).strip()
-        for pattern in ("\r\n", "\n"):
-            s = s.replace(pattern, " ")
-        return s[:max_length]
-
-    if version not in _VERSIONS:
-        raise ValueError(f"unsupported version {version}")
-
-    identification = "SCT" if instant else "INST"
-
-    for k, v in _ENCODINGS.items():
-        if encoding in v:
-            encoding_key = k
-            break
-    else:
-        raise ValueError(f"unsupported encoding {encoding}")
-
-    if not beneficiary_iban:
-        raise ValueError("beneficiary_iban is required")
-    iban = IBAN(beneficiary_iban)
-
-    name = clean_text(beneficiary_name, max_length=70)
-    if not name:
-        raise ValueError("beneficiary name is required")
-
-    bic = iban.bic
-    if beneficiary_bic:
-        beneficiary_bic = BIC(beneficiary_bic)
-        if bic and beneficiary_bic != bic:
-            raise ValueError(f"bic {bic} from iban {iban} != beneficiary_bic {beneficiary_bic}")
-        if not bic:
-            bic = beneficiary_bic
-    if version == "001" and not bic:
-        raise ValueError("bic is required for version 001")
-    if version == "002" and not always_add_bic and iban.bic:
-        bic = None
-
-    eur_amount_num = Decimal(eur_amount).quantize(Decimal("0.01"))
-    if not Decimal("0.01") <= eur_amount_num <= Decimal("999999999.99"):
-        raise ValueError(f"eur_amount {eur_amount_num} is out of bounds")
-    eur_amount_str = f"EUR{eur_amount_num}" if eur_amount else ""
-
-    purpose = clean_text(purpose, max_length=4)
-
-    structured_remittance_info = clean_text(structured_remittance_info, max_length=35)
-    remittance_info = clean_text(remittance_info, max_length=140)
-    if structured_remittance_info and remittance_info:
-        raise ValueError("structured_remittance_info and remittance_info are exclusive")
-
-    originator_info = clean_text(originator_info, max_length=70)
-
-    line_separator = "\r\n" if use_crlf else "\n"
-    return line_separator.join(
-        map(
-            str,
-            [
-                "BCD",
-                version,
-                encoding_key,
-                identification,
-                bic,
-                name,
-                iban,
-                eur_amount_str,
-                purpose,
-                structured_remittance_info,
-                remittance_info,
-                originator_info,
-            ],
-        )
+    beneficiary = EpcBeneficiary(
+        beneficiary_name,
+        beneficiary_iban,
+        bic=beneficiary_bic,
+        version=version,
+        encoding=encoding,
+        instant=instant,
+        always_add_bic=always_add_bic,
+        use_crlf=use_crlf,
+    )
+    return beneficiary.payload(
+        eur_amount=eur_amount,
+        purpose=purpose,
+        structured_remittance_info=structured_remittance_info,
+        remittance_info=remittance_info,
+        originator_info=originator_info,
     )
@@ -7,3 +7,11 @@ class FinalError(Exception):
 
 class IncompliantWarning(Warning):
     """Is raised if the invoice is legally not compliant."""
+
+
+class RenderOverloadError(Exception):
+    """Is raised if all PDF render processes are busy and the queue in front of them is full."""
+
+
+class RenderTimeoutError(Exception):
+    """Is raised if a PDF render takes longer than the ``PDF_RENDER_TIMEOUT`` setting."""
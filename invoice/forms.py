@@ -1,9 +1,23 @@
 """Forms of the invoice app."""
 
-from django.forms import ModelForm
+from django.forms import CharField, ChoiceField, DateField, FileField, Form, IntegerField, ModelChoiceField, ModelForm
 from django.forms.widgets import DateInput
-
-from invoice.models import Address, BankAccount, Customer, Invoice, InvoiceItem, Vendor
+from django.utils.translation import gettext_lazy as _
+
+from invoice.models import (
+    Address,
+    BankAccount,
+    Customer,
+    Invoice,
+    InvoiceItem,
+    OutboxMessage,
+    Payment,
+    Vendor,
+    validate_iban,
+)
+from invoice.payment_files import PaymentFileFormat
+from invoice.reporting import Granularity
+from invoice.widgets import AutocompleteSelect
 
 
 class InvoiceForm(ModelForm):
@@ -11,11 +25,13 @@ class InvoiceForm(ModelForm):
 
     class Meta:
         model = Invoice
-        fields = ["date", "due_date", "delivery_date", "vendor", "customer", "currency", "paid", "final"]
+        fields = ["date", "due_date", "delivery_date", "vendor", "customer", "currency", "final"]
         widgets = {
             "date": DateInput(attrs={"type": "date-local"}),
             "due_date": DateInput(attrs={"type": "date-local"}),
             "delivery_date": DateInput(attrs={"type": "date-local"}),
+            "vendor": AutocompleteSelect("vendor-autocomplete"),
+            "customer": AutocompleteSelect("customer-autocomplete", forward="vendor"),
         }
 
     def __init__(self, *args, **kwargs):
@@ -24,8 +40,8 @@ class InvoiceForm(ModelForm):
         super().__init__(*args, **kwargs)
         if user:
             # Filter the vendors and customers by the current user
-            self.fields["vendor"].queryset = Vendor.objects.filter(user=user)
-            self.fields["customer"].queryset = Customer.objects.filter(vendor__user=user)
+            self.fields["vendor"].queryset = Vendor.objects.owned_by(user)
+            self.fields["customer"].queryset = Customer.objects.owned_by(user)
 
 
 class InvoiceItemForm(ModelForm):
@@ -42,6 +58,7 @@ class CustomerForm(ModelForm):
     class Meta:
         model = Customer
         fields = ["first_name", "last_name", "email", "vendor"]
+        widgets = {"vendor": AutocompleteSelect("vendor-autocomplete")}
 
     def __init__(self, *args, **kwargs):
         """Initialize the form."""
@@ -49,7 +66,7 @@ class CustomerForm(ModelForm):
         super().__init__(*args, **kwargs)
         if user:
             # Filter the vendors and customers by the current user
-            self.fields["vendor"].queryset = Vendor.objects.filter(user=user)
+            self.fields["vendor"].queryset = Vendor.objects.owned_by(user)
 
 
 class AddressForm(ModelForm):
@@ -74,3 +91,89 @@ class VendorForm(ModelForm):
     class Meta:
         model = Vendor
         fields = ["name", "company_name", "tax_id", "logo"]
+
+
+class PaymentForm(ModelForm):
+    """Form for payments."""
+
+    class Meta:
+        model = Payment
+        fields = ["amount", "date", "reference"]
+        widgets = {"date": DateInput(attrs={"type": "date-local"})}
+
+
+class InvoiceEmailForm(ModelForm):
+    """Form for the email of an invoice."""
+
+    class Meta:
+        model = OutboxMessage
+        fields = ["recipient", "subject", "body"]
+
+
+class VatReportForm(Form):
+    """Filter of the VAT report."""
+
+    year = IntegerField(label=_("Year"), min_value=1900, max_value=9999)
+    granularity = ChoiceField(label=_("Period"), choices=Granularity.choices, initial=Granularity.MONTH)
+    vendor = ModelChoiceField(Vendor.objects.none(), label=_("Vendor"), required=False, empty_label=_("All vendors"))
+
+    def __init__(self, *args, user, **kwargs):
+        """Initialize the form with the vendors of the user."""
+        super().__init__(*args, **kwargs)
+        self.fields["vendor"].queryset = Vendor.objects.owned_by(user)
+
+
+class AgingReportForm(Form):
+    """Filter of the aging report."""
+
+    date = DateField(label=_("Date"), widget=DateInput(attrs={"type": "date-local"}))
+    vendor = ModelChoiceField(Vendor.objects.none(), label=_("Vendor"), required=False, empty_label=_("All vendors"))
+
+    def __init__(self, *args, user, **kwargs):
+        """Initialize the form with the vendors of the user."""
+        super().__init__(*args, **kwargs)
+        self.fields["vendor"].queryset = Vendor.objects.owned_by(user)
+
+
+class StatementForm(Form):
+    """Date of a customer statement."""
+
+    date = DateField(label=_("Date"), widget=DateInput(attrs={"type": "date-local"}))
+
+
+class BankStatementForm(Form):
+    """Upload of a bank statement whose transfers pay the invoices."""
+
+    file = FileField(label=_("Bank statement"), help_text=_("CAMT.053 XML or MT940 file."))
+    vendor = ModelChoiceField(Vendor.objects.none(), label=_("Vendor"), required=False, empty_label=_("All vendors"))
+
+    def __init__(self, *args, user, **kwargs):
+        """Initialize the form with the vendors of the user."""
+        super().__init__(*args, **kwargs)
+        self.fields["vendor"].queryset = Vendor.objects.owned_by(user)
+
+
+class PaymentFileForm(Form):
+    """Payment data of the open final invoices and, for a credit transfer file, the account to pay them from."""
+
+    format = ChoiceField(label=_("Format"), choices=PaymentFileFormat.choices)
+    vendor = ModelChoiceField(Vendor.objects.none(), label=_("Vendor"), required=False, empty_label=_("All vendors"))
+    debtor_name = CharField(label=_("Payer"), max_length=70, required=False)
+    debtor_iban = CharField(label=_("IBAN of the payer"), max_length=120, required=False, validators=[validate_iban])
+    execution_date = DateField(
+        label=_("Execution date"), required=False, widget=DateInput(attrs={"type": "date-local"})
+    )
+
+    def __init__(self, *args, user, **kwargs):
+        """Initialize the form with the vendors of the user."""
+        super().__init__(*args, **kwargs)
+        self.fields["vendor"].queryset = Vendor.objects.owned_by(user)
+
+    def clean(self):
+        """Require the payer for a credit transfer file."""
+        cleaned_data = super().clean()
+        if cleaned_data.get("format") == PaymentFileFormat.PAIN001:
+            for name in ("debtor_name", "debtor_iban"):
+                if not cleaned_data.get(name) and name not in self.errors:
+                    self.add_error(name, _("This field is required for a credit transfer file."))
+        return cleaned_data
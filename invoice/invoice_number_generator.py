@@ -8,6 +8,7 @@ from itertools import chain
 from typing import TYPE_CHECKING
 
 from invoice.constants import DEFAULT_INVOICE_NUMBER_COUNTER, DEFAULT_INVOICE_NUMBER_ZERO_PADDING
+from rechnung.metrics import INVOICE_NUMBER_SECONDS
 
 if TYPE_CHECKING:
     from invoice.models import Invoice
@@ -178,6 +179,7 @@ class InvoiceNumberFormat:
         element_strings = [_ for _ in element_strings if _]
         return [self._convert_from_string(_) for _ in element_strings]
 
+    @INVOICE_NUMBER_SECONDS.time()
     def get_invoice_number(self, invoice: Invoice) -> str:
         """Generate the invoice number."""
         return "".join(f.get(invoice) for f in self._format)
@@ -0,0 +1,28 @@
+"""Command to print the aging report of the unpaid final invoices as CSV."""
+
+import datetime as dt
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from invoice.models import Invoice
+from invoice.reporting import aging_report, aging_rows, write_aging_report_csv
+
+
+class Command(BaseCommand):
+    """Print the unpaid amounts per customer and currency by the days past the due date, e.g. for a monthly close."""
+
+    help = "Print the aging report of the unpaid final invoices of all vendors or of the given vendors as CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument("vendor_ids", nargs="*", type=int, help="IDs of the vendors, all vendors if omitted.")
+        parser.add_argument(
+            "--date", type=dt.date.fromisoformat, help="Date of the report as YYYY-MM-DD, today if omitted."
+        )
+
+    def handle(self, *args, **options):  # noqa: ARG002
+        invoices = Invoice.objects.all()
+        if options["vendor_ids"]:
+            invoices = invoices.filter(vendor_id__in=options["vendor_ids"])
+        today = options["date"] or timezone.localdate()
+        write_aging_report_csv(aging_rows(aging_report(invoices, today)), self.stdout)
@@ -0,0 +1,36 @@
+"""Command to generate the statements of all customers of a vendor as one PDF file."""
+
+import datetime as dt
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from invoice.models import Vendor
+from invoice.pdf_generator import gen_statements_pdf
+from invoice.statements import build_statements, statement_customers
+
+
+class Command(BaseCommand):
+    """Generate the statements of the customers of a vendor with open or recent final invoices, e.g. once a month."""
+
+    help = "Generate the statements of all customers of a vendor with open or recent final invoices as one PDF file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("vendor_id", type=int, help="ID of the vendor.")
+        parser.add_argument(
+            "--date", type=dt.date.fromisoformat, help="Date of the statements as YYYY-MM-DD, today if omitted."
+        )
+        parser.add_argument("--output", help="Path of the PDF file, statements-<vendor>-<date>.pdf if omitted.")
+
+    def handle(self, *args, **options):  # noqa: ARG002
+        start = perf_counter()
+        vendor_id = options["vendor_id"]
+        if not Vendor.objects.filter(pk=vendor_id).exists():
+            raise CommandError(f"Vendor {vendor_id} does not exist.")
+        date = options["date"] or timezone.localdate()
+        customers = statement_customers().filter(vendor_id=vendor_id).order_by("last_name", "first_name", "pk")
+        statements = [statement for statement in build_statements(customers, date) if statement.lines]
+        output = options["output"] or f"statements-{vendor_id}-{date.isoformat()}.pdf"
+        gen_statements_pdf(statements, output)
+        self.stdout.write(f"Wrote {len(statements)} statements to {output} in {perf_counter() - start:.1f}s.")
@@ -0,0 +1,28 @@
+"""Command to export the e-invoices of the final invoices."""
+
+from pathlib import Path
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from invoice.e_invoice import write_e_invoice_archive
+from invoice.models import Invoice
+
+
+class Command(BaseCommand):
+    """Export the CII XML of the final invoices into a ZIP archive, e.g. for the bookkeeping."""
+
+    help = "Export the CII XML of the final invoices of all vendors or of the given vendors into a ZIP archive."
+
+    def add_arguments(self, parser):
+        parser.add_argument("vendor_ids", nargs="*", type=int, help="IDs of the vendors, all vendors if omitted.")
+        parser.add_argument("--output", type=Path, help="Path of the archive, e-invoices-<date>.zip if omitted.")
+
+    def handle(self, *args, **options):  # noqa: ARG002
+        start = perf_counter()
+        vendor_ids = options["vendor_ids"]
+        invoices = Invoice.objects.filter(vendor_id__in=vendor_ids) if vendor_ids else Invoice.objects.all()
+        output = options["output"] or Path(f"e-invoices-{timezone.localdate().isoformat()}.zip")
+        count = write_e_invoice_archive(invoices, output)
+        self.stdout.write(f"Exported {count} e-invoices to {output} in {perf_counter() - start:.1f}s.")
@@ -0,0 +1,52 @@
+"""Command to export the payment data of the open final invoices."""
+
+import datetime as dt
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from schwifty import IBAN
+
+from invoice.models import Invoice
+from invoice.payment_files import PaymentFileBuilder, PaymentFileFormat
+
+
+class Command(BaseCommand):
+    """Export a SEPA credit transfer file or the EPC QR code payloads of the open invoices, e.g. for a payment run."""
+
+    help = "Export the payment data of the open final invoices of all vendors or of the given vendors."
+
+    def add_arguments(self, parser):
+        parser.add_argument("vendor_ids", nargs="*", type=int, help="IDs of the vendors, all vendors if omitted.")
+        parser.add_argument(
+            "--format", choices=PaymentFileFormat.values, default=PaymentFileFormat.PAIN001, help="Format of the data."
+        )
+        parser.add_argument("--debtor-name", default="", help="Name of the payer, required for pain.001.")
+        parser.add_argument("--debtor-iban", default="", help="IBAN of the payer, required for pain.001.")
+        parser.add_argument(
+            "--date", type=dt.date.fromisoformat, help="Execution date as YYYY-MM-DD, today if omitted."
+        )
+        parser.add_argument("--output", type=Path, help="Path of the file, standard output if omitted.")
+
+    def handle(self, *args, **options):  # noqa: ARG002
+        vendor_ids = options["vendor_ids"]
+        invoices = Invoice.objects.filter(vendor_id__in=vendor_ids) if vendor_ids else Invoice.objects.all()
+        builder = PaymentFileBuilder()
+        if options["format"] == PaymentFileFormat.PAIN001:
+            if not options["debtor_name"] or not options["debtor_iban"]:
+                raise CommandError("--debtor-name and --debtor-iban are required for pain.001.")
+            try:
+                IBAN(options["debtor_iban"])
+            except ValueError as err:
+                raise CommandError(f"Invalid IBAN of the payer: {err}") from err
+            date = options["date"] or timezone.localdate()
+            chunks = builder.pain001(invoices, options["debtor_name"], options["debtor_iban"], date)
+        else:
+            chunks = builder.epc_lines(invoices)
+        if options["output"] is None:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending="")
+            return
+        with options["output"].open("w", encoding="utf-8") as file:
+            file.writelines(chunks)
+        self.stderr.write(f"Wrote the payment data to {options['output']}.")
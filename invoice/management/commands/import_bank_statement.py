@@ -0,0 +1,34 @@
+"""Command to import a bank statement and record the payments of the invoices it pays."""
+
+from pathlib import Path
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from invoice.bank_statements import import_statement
+from invoice.models import Invoice
+
+
+class Command(BaseCommand):
+    """Import a CAMT.053 or MT940 statement, e.g. the daily statement fetched from the bank."""
+
+    help = "Import a bank statement and mark the open invoices of all vendors or of the given vendors as paid."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", type=Path, help="Path of the CAMT.053 XML or MT940 file.")
+        parser.add_argument("vendor_ids", nargs="*", type=int, help="IDs of the vendors, all vendors if omitted.")
+
+    def handle(self, *args, **options):  # noqa: ARG002
+        start = perf_counter()
+        vendor_ids = options["vendor_ids"]
+        invoices = Invoice.objects.filter(vendor_id__in=vendor_ids) if vendor_ids else Invoice.objects.all()
+        with options["path"].open("rb") as file:
+            result = import_statement(file, invoices)
+        for transfer in result.unmatched:
+            self.stdout.write(
+                f"Unmatched: {transfer.date} {transfer.amount} {transfer.currency} {transfer.remittance_info}"
+            )
+        self.stdout.write(
+            f"Marked {result.matched} invoices as paid, {len(result.unmatched)} transfers did not match, "
+            f"in {perf_counter() - start:.1f}s."
+        )
@@ -0,0 +1,24 @@
+"""Command to create a token for profiling requests."""
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from rechnung.profiling import make_profile_token
+
+
+class Command(BaseCommand):
+    """Print a signed profiling token for a staff user."""
+
+    help = "Print a token to profile requests with ?profile=<token> or the X-Profile header."
+
+    def add_arguments(self, parser):
+        parser.add_argument("username", help="Name of the staff user the token is issued for.")
+
+    def handle(self, *args, **options):  # noqa: ARG002
+        try:
+            user = get_user_model().objects.get(username=options["username"])
+        except get_user_model().DoesNotExist as err:
+            raise CommandError(f"User {options['username']} does not exist.") from err
+        if not user.is_staff:
+            raise CommandError(f"User {user.username} is not a staff user.")
+        self.stdout.write(make_profile_token(user))
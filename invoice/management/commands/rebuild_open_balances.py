@@ -0,0 +1,24 @@
+"""Command to rebuild the open balances of the invoices."""
+
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from invoice.models import Invoice
+
+
+class Command(BaseCommand):
+    """Rebuild the open balances, e.g. after bulk inserts or imports of items or payments that skipped save()."""
+
+    help = "Rebuild the open balances and paid flags of the invoices of all vendors or of the given vendors."
+
+    def add_arguments(self, parser):
+        parser.add_argument("vendor_ids", nargs="*", type=int, help="IDs of the vendors, all vendors if omitted.")
+
+    def handle(self, *args, **options):  # noqa: ARG002
+        start = perf_counter()
+        invoices = Invoice.objects.all()
+        if options["vendor_ids"]:
+            invoices = invoices.filter(vendor_id__in=options["vendor_ids"])
+        count = invoices.rebuild_open_balances()
+        self.stdout.write(f"Rebuilt the open balances of {count} invoices in {perf_counter() - start:.1f}s.")
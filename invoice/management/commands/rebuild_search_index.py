@@ -0,0 +1,21 @@
+"""Command to rebuild the search documents of the invoices."""
+
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from invoice.models import Invoice, SearchDocument
+
+
+class Command(BaseCommand):
+    """Rebuild the search documents, e.g. after bulk inserts or imports that skipped save()."""
+
+    help = "Rebuild the search documents of all invoices."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500, help="Invoices per query and transaction.")
+
+    def handle(self, *args, **options):  # noqa: ARG002
+        start = perf_counter()
+        count = SearchDocument.objects.rebuild(Invoice.objects.all(), options["chunk_size"])
+        self.stdout.write(f"Rebuilt {count} search documents in {perf_counter() - start:.1f}s.")
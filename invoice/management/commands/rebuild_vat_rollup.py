@@ -0,0 +1,24 @@
+"""Command to rebuild the VAT rollup of the final invoices."""
+
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from invoice.models import VatRollup, Vendor
+
+
+class Command(BaseCommand):
+    """Rebuild the VAT rollup, e.g. after bulk inserts or imports that skipped save()."""
+
+    help = "Rebuild the VAT rollup of all vendors or of the given vendors."
+
+    def add_arguments(self, parser):
+        parser.add_argument("vendor_ids", nargs="*", type=int, help="IDs of the vendors, all vendors if omitted.")
+
+    def handle(self, *args, **options):  # noqa: ARG002
+        start = perf_counter()
+        vendors = Vendor.objects.all()
+        if options["vendor_ids"]:
+            vendors = vendors.filter(pk__in=options["vendor_ids"])
+        count = VatRollup.objects.rebuild(vendors)
+        self.stdout.write(f"Rebuilt {count} VAT rollup rows in {perf_counter() - start:.1f}s.")
@@ -0,0 +1,40 @@
+"""Command to write the reminders of the overdue invoices."""
+
+import datetime as dt
+from pathlib import Path
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from invoice.dunning import run_dunning
+from invoice.models import Invoice
+
+
+class Command(BaseCommand):
+    """Write the reminder PDFs of the overdue invoices and raise their dunning levels, e.g. daily by cron."""
+
+    help = "Write the reminders of the overdue final invoices of all vendors or of the given vendors."
+
+    def add_arguments(self, parser):
+        parser.add_argument("vendor_ids", nargs="*", type=int, help="IDs of the vendors, all vendors if omitted.")
+        parser.add_argument(
+            "--date", type=dt.date.fromisoformat, help="Date of the run as YYYY-MM-DD, today if omitted."
+        )
+        parser.add_argument("--output", type=Path, help="Directory of the PDF files, reminders/<date> if omitted.")
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=settings.PDF_RENDER_WORKERS,
+            help="Number of render processes, 0 to render in this process.",
+        )
+
+    def handle(self, *args, **options):  # noqa: ARG002
+        start = perf_counter()
+        vendor_ids = options["vendor_ids"]
+        invoices = Invoice.objects.filter(vendor_id__in=vendor_ids) if vendor_ids else Invoice.objects.all()
+        today = options["date"] or timezone.localdate()
+        output = options["output"] or Path("reminders") / today.isoformat()
+        count = run_dunning(invoices, today, output, options["processes"])
+        self.stdout.write(f"Wrote {count} reminders to {output} in {perf_counter() - start:.1f}s.")
@@ -0,0 +1,309 @@
+"""Command to create large, deterministic data sets for benchmarks."""
+
+import argparse
+import datetime as dt
+import io
+import random
+from decimal import Decimal
+from itertools import batched
+from time import perf_counter
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User  # pylint: disable=imported-auth-user
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from PIL import Image
+from schwifty import IBAN
+
+from invoice import render_worker
+from invoice.models import (
+    Address,
+    BankAccount,
+    Customer,
+    Invoice,
+    InvoiceItem,
+    Payment,
+    SearchDocument,
+    VatRollup,
+    Vendor,
+)
+from invoice.render_pool import batch_renderer
+from invoice.snapshots import take_missing_snapshots
+
+USERNAME_PREFIX = "bench-"
+BASE_DATE = dt.date(2024, 1, 1)
+BANK_CODES = ("50010517", "10010010", "37040044", "70020270", "60050101")
+LOGO_COLORS = ("#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", "#8c564b")
+CITIES = ("Berlin", "Hamburg", "München", "Köln", "Frankfurt", "Stuttgart", "Leipzig", "Bremen")
+STREETS = ("Hauptstraße", "Bahnhofstraße", "Gartenweg", "Schulstraße", "Lindenallee", "Am Markt")
+FIRST_NAMES = ("Anna", "Ben", "Clara", "David", "Emma", "Felix", "Greta", "Hans", "Ida", "Jonas", "Lena", "Max")
+LAST_NAMES = ("Müller", "Schmidt", "Schneider", "Fischer", "Weber", "Meyer", "Wagner", "Becker", "Hoffmann")
+ITEM_NAMES = ("Consulting", "Development", "Design", "Support", "Training", "License", "Hosting", "Travel")
+UNITS = ("h", "d", "pcs", "")
+TAX_RATES = (Decimal("0.19"), Decimal("0.19"), Decimal("0.19"), Decimal("0.07"), Decimal("0.00"))
+
+
+def positive_int(value: str) -> int:
+    """Parse a count of at least one, the invoices are spread over the users, their vendors and the customers."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive number")
+    return number
+
+
+class Command(BaseCommand):
+    """
+    Seed the database with users, vendors, customers, invoices and items for benchmarks.
+
+    All objects are built from a seeded random generator, so the same arguments always create the same data.
+    Invoice item counts follow a log-normal distribution: most invoices are short, a few are very long. The final
+    invoices are left without snapshots, as if they were finalized before the snapshots existed. With ``--snapshots``
+    they get them like finalized ones, which renders a PDF per final invoice and takes far longer than the inserts,
+    e.g. hours instead of minutes for the default data set with few render processes.
+    """
+
+    help = "Create a deterministic benchmark data set with bulk inserts."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=42, help="Seed of the random generator.")
+        parser.add_argument("--users", type=positive_int, default=10)
+        parser.add_argument("--vendors-per-user", type=positive_int, default=2)
+        parser.add_argument("--customers-per-vendor", type=positive_int, default=100)
+        parser.add_argument("--invoices", type=int, default=20_000, help="Total number of invoices.")
+        parser.add_argument("--items", type=int, default=1_000_000, help="Total number of invoice items.")
+        parser.add_argument("--max-items-per-invoice", type=int, default=5_000)
+        parser.add_argument("--chunk-size", type=int, default=5_000, help="Rows per insert and transaction.")
+        parser.add_argument("--clear", action="store_true", help="Delete earlier benchmark data first.")
+        parser.add_argument(
+            "--snapshots",
+            action="store_true",
+            help="Take the snapshots of the final invoices with their PDFs, which renders a PDF per final invoice.",
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=settings.PDF_RENDER_WORKERS,
+            help="Number of processes that render the PDFs of the snapshots, 0 to render them in this process.",
+        )
+
+    def handle(self, *args, **options):  # noqa: ARG002
+        rng = random.Random(options["seed"])  # noqa: S311
+        chunk_size = options["chunk_size"]
+        start = perf_counter()
+
+        if options["clear"]:
+            deleted, _ = User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+            self.stdout.write(f"Deleted {deleted} objects of earlier benchmark data.")
+
+        users = self._create_users(options["users"], chunk_size)
+        vendors = self._create_vendors(rng, users, options["vendors_per_user"], chunk_size)
+        customers = self._create_customers(rng, vendors, options["customers_per_vendor"], chunk_size)
+        invoices = self._create_invoices(rng, vendors, customers, options["invoices"], chunk_size)
+        item_total = self._create_items(
+            rng,
+            invoices,
+            self._item_counts(rng, len(invoices), options["items"], options["max_items_per_invoice"]),
+            chunk_size,
+        )
+        # bulk inserts skip save(), which refreshes the search documents, the open balances and the VAT rollup. The
+        # seeded rows are selected by their users, a list of all their keys would exceed the bound parameters of SQLite.
+        seeded = Invoice.objects.filter(vendor__user__username__startswith=USERNAME_PREFIX)
+        SearchDocument.objects.rebuild(seeded)
+        seeded.rebuild_open_balances()
+        payment_count = self._create_payments(rng, seeded, chunk_size)
+        seeded.rebuild_open_balances()
+        VatRollup.objects.rebuild(Vendor.objects.filter(user__username__startswith=USERNAME_PREFIX))
+        snapshot_count = self._take_snapshots(seeded, options["processes"]) if options["snapshots"] else 0
+
+        self.stdout.write(
+            f"Created {len(users)} users, {len(vendors)} vendors, {len(customers)} customers, "
+            f"{len(invoices)} invoices, {item_total} items, {payment_count} payments "
+            f"and {snapshot_count} snapshots in {perf_counter() - start:.1f}s."
+        )
+
+    @staticmethod
+    def _take_snapshots(invoices, processes):
+        """Take the snapshots of the final invoices with their PDFs, which bulk inserts skip."""
+        with batch_renderer(render_worker.render, processes) as render:
+            return take_missing_snapshots(invoices, render)
+
+    @staticmethod
+    def _bulk_create(model, objects, chunk_size):
+        """Insert the objects in chunks, each in its own transaction, and return them with primary keys."""
+        created = []
+        for chunk in batched(objects, chunk_size, strict=False):
+            with transaction.atomic():
+                created += model.objects.bulk_create(chunk)
+        return created
+
+    def _create_users(self, count, chunk_size):
+        password = make_password("benchmark")
+        users = (
+            User(
+                username=f"{USERNAME_PREFIX}{index:05d}",
+                email=f"{USERNAME_PREFIX}{index:05d}@example.com",
+                password=password,
+            )
+            for index in range(count)
+        )
+        return self._bulk_create(User, users, chunk_size)
+
+    def _addresses(self, rng, count, chunk_size):
+        addresses = (
+            Address(
+                line_1=f"{rng.choice(STREETS)} {rng.randint(1, 200)}",
+                postcode=f"{rng.randint(1000, 99999):05d}",
+                city=rng.choice(CITIES),
+                country="DE",
+            )
+            for _ in range(count)
+        )
+        return self._bulk_create(Address, addresses, chunk_size)
+
+    @staticmethod
+    def _logos():
+        """Store one small logo per color and return their names in the storage."""
+        names = []
+        for index, color in enumerate(LOGO_COLORS):
+            name = f"logos/benchmark-{index}.png"
+            if not default_storage.exists(name):
+                buffer = io.BytesIO()
+                Image.new("RGB", (200, 200), color).save(buffer, format="PNG")
+                name = default_storage.save(name, ContentFile(buffer.getvalue()))
+            names.append(name)
+        return names
+
+    def _create_vendors(self, rng, users, vendors_per_user, chunk_size):
+        count = len(users) * vendors_per_user
+        addresses = self._addresses(rng, count, chunk_size)
+        bank_accounts = []
+        for index in range(count):
+            iban = IBAN.generate("DE", bank_code=BANK_CODES[index % len(BANK_CODES)], account_code=f"{index + 1:010d}")
+            bank_accounts.append(BankAccount(owner=f"Benchmark Vendor {index}", iban=str(iban), bic=str(iban.bic)))
+        bank_accounts = self._bulk_create(BankAccount, bank_accounts, chunk_size)
+        logos = self._logos()
+        vendors = [
+            Vendor(
+                name=f"Benchmark Vendor {index}",
+                company_name=f"Benchmark {index} GmbH",
+                address=addresses[index],
+                tax_id=f"DE{rng.randint(100_000_000, 999_999_999)}",
+                bank_account=bank_accounts[index],
+                user=users[index // vendors_per_user],
+                invoice_number_format="<year>-<counter:vendor:5>",
+                logo=logos[index % len(logos)],
+            )
+            for index in range(count)
+        ]
+        # bulk inserts skip save(), which fills the search name
+        for vendor in vendors:
+            vendor.search_name = vendor.get_search_name()
+        return self._bulk_create(Vendor, vendors, chunk_size)
+
+    def _create_customers(self, rng, vendors, customers_per_vendor, chunk_size):
+        count = len(vendors) * customers_per_vendor
+        addresses = self._addresses(rng, count, chunk_size)
+        customers = []
+        for index in range(count):
+            first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            customer = Customer(
+                first_name=first_name,
+                last_name=last_name,
+                email=f"{first_name}.{last_name}.{index}@example.com".lower(),
+                address=addresses[index],
+                vendor=vendors[index // customers_per_vendor],
+            )
+            customer.search_name = customer.get_search_name()
+            customers.append(customer)
+        return self._bulk_create(Customer, customers, chunk_size)
+
+    def _create_invoices(self, rng, vendors, customers, count, chunk_size):
+        customers_per_vendor = len(customers) // len(vendors)
+        counters = dict.fromkeys(range(len(vendors)), 0)
+        invoices = []
+        for _ in range(count):
+            vendor_index = rng.randrange(len(vendors))
+            customer = customers[vendor_index * customers_per_vendor + rng.randrange(customers_per_vendor)]
+            counters[vendor_index] += 1
+            date = BASE_DATE + dt.timedelta(days=rng.randrange(730))
+            final = rng.random() < 0.8  # noqa: PLR2004
+            invoices.append(
+                Invoice(
+                    invoice_number=f"{date.year}-{counters[vendor_index]:05d}",
+                    date=date,
+                    due_date=date + dt.timedelta(days=rng.choice((14, 30))),
+                    delivery_date=date,
+                    vendor=vendors[vendor_index],
+                    customer=customer,
+                    final=final,
+                )
+            )
+        invoices = self._bulk_create(Invoice, invoices, chunk_size)
+        for index, vendor in enumerate(vendors):
+            vendor.invoice_counter = counters[index]
+        Vendor.objects.bulk_update(vendors, ["invoice_counter"], batch_size=chunk_size)
+        return invoices
+
+    @staticmethod
+    def _item_counts(rng, invoice_count, item_total, maximum):
+        """Distribute the items log-normally over the invoices, so that they add up to the requested total."""
+        if not invoice_count:
+            return []
+        weights = [rng.lognormvariate(0, 1.2) for _ in range(invoice_count)]
+        scale = item_total / sum(weights)
+        counts = [min(maximum, max(1, round(weight * scale))) for weight in weights]
+        difference = item_total - sum(counts)
+        index = 0
+        while difference and index < invoice_count * maximum:
+            position = index % invoice_count
+            if difference > 0 and counts[position] < maximum:
+                counts[position] += 1
+                difference -= 1
+            elif difference < 0 and counts[position] > 1:
+                counts[position] -= 1
+                difference += 1
+            index += 1
+        return counts
+
+    def _create_items(self, rng, invoices, item_counts, chunk_size):
+        def items():
+            for invoice_index, (invoice, count) in enumerate(zip(invoices, item_counts, strict=True)):
+                for position in range(count):
+                    yield InvoiceItem(
+                        name=f"{rng.choice(ITEM_NAMES)} {position + 1}",
+                        description=f"{rng.choice(ITEM_NAMES)} for project {invoice_index % 97}",
+                        quantity=Decimal(rng.randint(1, 4000)) / 100,
+                        unit=rng.choice(UNITS),
+                        price=Decimal(rng.randint(500, 250_000)) / 100,
+                        tax=rng.choice(TAX_RATES),
+                        invoice=invoice,
+                    )
+
+        total = 0
+        for chunk in batched(items(), chunk_size, strict=False):
+            with transaction.atomic():
+                InvoiceItem.objects.bulk_create(chunk)
+            total += len(chunk)
+        return total
+
+    def _create_payments(self, rng, invoices, chunk_size):
+        """Pay 70% of the final invoices in full and 10% in part, some days after their date."""
+        payments = []
+        for pk, date, open_balance in (
+            invoices.filter(final=True).order_by("pk").values_list("pk", "date", "open_balance")
+        ):
+            draw = rng.random()
+            if draw < 0.8:  # noqa: PLR2004
+                amount = open_balance if draw < 0.7 else (open_balance / 2).quantize(Decimal("0.01"))  # noqa: PLR2004
+                payments.append(
+                    Payment(
+                        invoice_id=pk,
+                        amount=amount,
+                        date=date + dt.timedelta(days=rng.randrange(60)),
+                        reference=f"Payment {pk}",
+                    )
+                )
+        return len(self._bulk_create(Payment, payments, chunk_size))
@@ -0,0 +1,43 @@
+"""Command to send the queued invoice emails."""
+
+import time
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from invoice.outbox import send_outbox
+
+
+class Command(BaseCommand):
+    """Send the due messages of the outbox, once e.g. by cron or continuously as a worker."""
+
+    help = "Send the due invoice emails of the outbox in batches over one connection."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100, help="Number of messages per batch.")
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=settings.PDF_RENDER_WORKERS,
+            help="Number of PDF render processes, 0 for none.",
+        )
+        parser.add_argument(
+            "--poll",
+            type=float,
+            default=0,
+            help="Seconds to wait for new messages once the outbox is empty, 0 to stop then.",
+        )
+
+    def handle(self, *args, **options):  # noqa: ARG002
+        while True:
+            start = perf_counter()
+            result = send_outbox(options["batch_size"], options["processes"])
+            if result.sent or result.retried or result.failed or not options["poll"]:
+                self.stdout.write(
+                    f"Sent {result.sent} emails, {result.retried} to retry, {result.failed} failed "
+                    f"in {perf_counter() - start:.1f}s."
+                )
+            if not options["poll"]:
+                return
+            time.sleep(options["poll"])
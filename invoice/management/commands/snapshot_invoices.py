@@ -0,0 +1,32 @@
+"""Command to take the missing snapshots of the final invoices."""
+
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from invoice import render_worker
+from invoice.models import Invoice
+from invoice.render_pool import batch_renderer
+from invoice.snapshots import take_missing_snapshots
+
+
+class Command(BaseCommand):
+    """Take the snapshots of the final invoices without one, e.g. after bulk inserts or imports that skipped save()."""
+
+    help = "Take the snapshots of all final invoices that have none yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=100, help="Invoices per query and transaction.")
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=settings.PDF_RENDER_WORKERS,
+            help="Number of processes that render the PDFs, 0 to render them in this process.",
+        )
+
+    def handle(self, *args, **options):  # noqa: ARG002
+        start = perf_counter()
+        with batch_renderer(render_worker.render, options["processes"]) as render:
+            count = take_missing_snapshots(Invoice.objects.all(), render, options["chunk_size"])
+        self.stdout.write(f"Took {count} snapshots in {perf_counter() - start:.1f}s.")
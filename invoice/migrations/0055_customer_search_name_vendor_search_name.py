@@ -0,0 +1,41 @@
+# Generated by Django 6.0 on 2026-10-19 02:14
+
+from django.db import migrations, models
+
+
+def normalize(*parts):
+    return " ".join(part.strip() for part in parts if part.strip()).casefold()[:255]
+
+
+def fill_search_names(apps, schema_editor):
+    Customer = apps.get_model("invoice", "Customer")
+    Vendor = apps.get_model("invoice", "Vendor")
+    customers = list(Customer.objects.only("first_name", "last_name"))
+    for customer in customers:
+        customer.search_name = normalize(customer.last_name, customer.first_name)
+    Customer.objects.bulk_update(customers, ["search_name"], batch_size=1000)
+    vendors = list(Vendor.objects.only("name", "company_name"))
+    for vendor in vendors:
+        vendor.search_name = normalize(vendor.company_name or vendor.name)
+    Vendor.objects.bulk_update(vendors, ["search_name"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0054_vendor_logo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='search_name',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='vendor',
+            name='search_name',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(fill_search_names, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 6.0 on 2026-10-19 09:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+SQLITE_INSTALL = [
+    # external content table, the documents are stored once in invoice_searchdocument
+    "CREATE VIRTUAL TABLE invoice_searchdocument_fts USING fts5("
+    "document, content='invoice_searchdocument', content_rowid='invoice_id', tokenize='trigram')",
+    "CREATE TRIGGER invoice_searchdocument_fts_insert AFTER INSERT ON invoice_searchdocument BEGIN "
+    "INSERT INTO invoice_searchdocument_fts(rowid, document) VALUES (new.invoice_id, new.document); END",
+    "CREATE TRIGGER invoice_searchdocument_fts_delete AFTER DELETE ON invoice_searchdocument BEGIN "
+    "INSERT INTO invoice_searchdocument_fts(invoice_searchdocument_fts, rowid, document) "
+    "VALUES ('delete', old.invoice_id, old.document); END",
+    "CREATE TRIGGER invoice_searchdocument_fts_update AFTER UPDATE ON invoice_searchdocument BEGIN "
+    "INSERT INTO invoice_searchdocument_fts(invoice_searchdocument_fts, rowid, document) "
+    "VALUES ('delete', old.invoice_id, old.document); "
+    "INSERT INTO invoice_searchdocument_fts(rowid, document) VALUES (new.invoice_id, new.document); END",
+]
+SQLITE_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS invoice_searchdocument_fts_update",
+    "DROP TRIGGER IF EXISTS invoice_searchdocument_fts_delete",
+    "DROP TRIGGER IF EXISTS invoice_searchdocument_fts_insert",
+    "DROP TABLE IF EXISTS invoice_searchdocument_fts",
+]
+POSTGRESQL_INSTALL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX invoice_searchdocument_document_trgm ON invoice_searchdocument USING gin (document gin_trgm_ops)",
+]
+POSTGRESQL_UNINSTALL = ["DROP INDEX IF EXISTS invoice_searchdocument_document_trgm"]
+
+
+def install_index(apps, schema_editor):
+    statements = {"sqlite": SQLITE_INSTALL, "postgresql": POSTGRESQL_INSTALL}
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def uninstall_index(apps, schema_editor):
+    statements = {"sqlite": SQLITE_UNINSTALL, "postgresql": POSTGRESQL_UNINSTALL}
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def fill_documents(apps, schema_editor):
+    Invoice = apps.get_model("invoice", "Invoice")
+    SearchDocument = apps.get_model("invoice", "SearchDocument")
+    invoice_ids = list(Invoice.objects.order_by("pk").values_list("pk", flat=True))
+    for start in range(0, len(invoice_ids), 500):
+        invoices = (
+            Invoice.objects.filter(pk__in=invoice_ids[start:start + 500])
+            .select_related("vendor", "customer")
+            .prefetch_related("invoiceitem_set")
+        )
+        documents = []
+        for invoice in invoices:
+            customer = invoice.customer
+            parts = [invoice.invoice_number, customer.first_name, customer.last_name, customer.email]
+            for item in invoice.invoiceitem_set.all():
+                parts += [item.name, item.description]
+            documents.append(
+                SearchDocument(invoice=invoice, user_id=invoice.vendor.user_id, document="\n".join(parts).casefold())
+            )
+        SearchDocument.objects.bulk_create(documents)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0055_customer_search_name_vendor_search_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('invoice', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='invoice.invoice')),
+                ('document', models.TextField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(install_index, uninstall_index),
+        migrations.RunPython(fill_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 6.0 on 2026-10-19 11:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncMonth
+
+
+def fill_rollup(apps, schema_editor):
+    InvoiceItem = apps.get_model("invoice", "InvoiceItem")
+    VatRollup = apps.get_model("invoice", "VatRollup")
+    output_field = DecimalField(max_digits=28, decimal_places=4)
+    rows = (
+        InvoiceItem.objects.filter(invoice__final=True)
+        .values(
+            vendor_id=F("invoice__vendor_id"),
+            period=TruncMonth("invoice__date"),
+            currency=F("invoice__currency"),
+            tax_rate=F("tax"),
+        )
+        .annotate(
+            net_total=Sum(ExpressionWrapper(F("price") * F("quantity"), output_field=output_field)),
+            tax_amount=Sum(ExpressionWrapper(F("price") * F("quantity") * F("tax"), output_field=output_field)),
+            invoice_count=Count("invoice", distinct=True),
+        )
+        .order_by()
+    )
+    VatRollup.objects.bulk_create([VatRollup(**row) for row in rows], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0056_searchdocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VatRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.DateField(verbose_name='period')),
+                ('currency', models.CharField(choices=[('EUR', 'Euro'), ('USD', 'US Dollar'), ('JPY', 'Japanese Yen'), ('GBP', 'Pound Sterling'), ('CHF', 'Swiss Franc'), ('CAD', 'Canadian Dollar'), ('AUD', 'Australian Dollar'), ('NZD', 'New Zealand Dollar'), ('SEK', 'Swedish Krona'), ('DKK', 'Danish Krone'), ('NOK', 'Norwegian Krone'), ('HKD', 'Hong Kong Dollar'), ('CNY', 'Chinese Yuan')], max_length=3, verbose_name='currency')),
+                ('tax_rate', models.DecimalField(decimal_places=4, max_digits=5, verbose_name='tax rate')),
+                ('net_total', models.DecimalField(decimal_places=4, max_digits=28, verbose_name='net total')),
+                ('tax_amount', models.DecimalField(decimal_places=4, max_digits=28, verbose_name='tax amount')),
+                ('invoice_count', models.IntegerField(verbose_name='invoice count')),
+            ],
+            options={
+                'verbose_name': 'VAT rollup',
+                'verbose_name_plural': 'VAT rollups',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['vendor', 'date'], name='invoice_vendor_date'),
+        ),
+        migrations.AddField(
+            model_name='vatrollup',
+            name='vendor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='invoice.vendor', verbose_name='vendor'),
+        ),
+        migrations.AddConstraint(
+            model_name='vatrollup',
+            constraint=models.UniqueConstraint(fields=('vendor', 'period', 'currency', 'tax_rate'), name='unique_vat_rollup_key'),
+        ),
+        migrations.RunPython(fill_rollup, migrations.RunPython.noop),
+    ]
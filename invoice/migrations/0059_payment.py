@@ -0,0 +1,83 @@
+# Generated by Django 6.0 on 2026-10-19 12:05
+
+import django.core.validators
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def fill_balances(apps, schema_editor):
+    """
+    Pay the final invoices marked as paid with their total and set the open balances of the others to their total.
+
+    Only final invoices can be paid from now on, the paid flag of drafts is cleared instead of paying them.
+    """
+    Invoice = apps.get_model("invoice", "Invoice")
+    InvoiceItem = apps.get_model("invoice", "InvoiceItem")
+    Payment = apps.get_model("invoice", "Payment")
+    invoice_ids = list(Invoice.objects.order_by("pk").values_list("pk", flat=True))
+    for start in range(0, len(invoice_ids), 500):
+        chunk = invoice_ids[start:start + 500]
+        net_totals = dict.fromkeys(chunk, Decimal(0))
+        tax_amounts = dict.fromkeys(chunk, Decimal(0))
+        for invoice_id, price, quantity, tax in InvoiceItem.objects.filter(invoice_id__in=chunk).values_list(
+            "invoice_id", "price", "quantity", "tax"
+        ):
+            net_totals[invoice_id] += price * quantity
+            tax_amounts[invoice_id] += price * quantity * tax
+        invoices = list(Invoice.objects.filter(pk__in=chunk).only("final", "paid", "date", "due_date"))
+        payments = []
+        for invoice in invoices:
+            # rounded like Invoice.total_rounded
+            total = net_totals[invoice.pk].quantize(Decimal("0.01")) + tax_amounts[invoice.pk].quantize(Decimal("0.01"))
+            if invoice.paid and invoice.final:
+                payments.append(Payment(invoice_id=invoice.pk, amount=total, date=invoice.due_date or invoice.date))
+                invoice.open_balance = Decimal("0.00")
+            else:
+                invoice.paid = False
+                invoice.open_balance = total
+        Payment.objects.bulk_create(payments)
+        Invoice.objects.bulk_update(invoices, ["open_balance", "paid"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0057_vatrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Payment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=19, validators=[django.core.validators.MinValueValidator(Decimal('-1000000.00')), django.core.validators.MaxValueValidator(Decimal('1000000.00'))], verbose_name='amount')),
+                ('date', models.DateField(verbose_name='date')),
+                ('reference', models.CharField(blank=True, default='', max_length=140, verbose_name='reference')),
+            ],
+            options={
+                'verbose_name': 'payment',
+                'verbose_name_plural': 'payments',
+            },
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='open_balance',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=19, verbose_name='open balance'),
+        ),
+        migrations.AlterField(
+            model_name='invoice',
+            name='paid',
+            field=models.BooleanField(default=False, editable=False, verbose_name='paid'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(condition=models.Q(('final', True), ('open_balance__gt', 0)), fields=['vendor', 'due_date'], name='invoice_open'),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='invoice',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='invoice.invoice', verbose_name='invoice'),
+        ),
+        migrations.RunPython(fill_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-19 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0059_payment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='dunned_on',
+            field=models.DateField(editable=False, null=True, verbose_name='dunned on'),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='dunning_level',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='dunning level'),
+        ),
+    ]
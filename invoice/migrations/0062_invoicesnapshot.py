@@ -0,0 +1,36 @@
+# Generated by Django 6.0 on 2026-10-19 10:30
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0061_outboxmessage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceSnapshot',
+            fields=[
+                ('invoice', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='snapshot', serialize=False, to='invoice.invoice')),
+                ('currency', models.CharField(choices=[('EUR', 'Euro'), ('USD', 'US Dollar'), ('JPY', 'Japanese Yen'), ('GBP', 'Pound Sterling'), ('CHF', 'Swiss Franc'), ('CAD', 'Canadian Dollar'), ('AUD', 'Australian Dollar'), ('NZD', 'New Zealand Dollar'), ('SEK', 'Swedish Krona'), ('DKK', 'Danish Krone'), ('NOK', 'Norwegian Krone'), ('HKD', 'Hong Kong Dollar'), ('CNY', 'Chinese Yuan')], max_length=3, verbose_name='currency')),
+                ('net_total', models.DecimalField(decimal_places=2, max_digits=19, verbose_name='net total')),
+                ('tax_amount', models.DecimalField(decimal_places=2, max_digits=19, verbose_name='tax amount')),
+                ('total', models.DecimalField(decimal_places=2, max_digits=19, verbose_name='total')),
+                ('data', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('pdf', models.BinaryField(null=True)),
+                ('xml', models.BinaryField()),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='created')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'invoice snapshot',
+                'verbose_name_plural': 'invoice snapshots',
+            },
+        ),
+    ]
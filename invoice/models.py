@@ -1,11 +1,17 @@
 """Models for invoice app."""
 
+# pylint: disable=too-many-lines
+
 import operator
 import warnings
 from collections import Counter
+from contextlib import nullcontext
+from datetime import date, timedelta
 from decimal import Decimal
 from functools import reduce
+from itertools import batched, groupby
 from math import isinf, isnan
+from operator import itemgetter
 from warnings import deprecated
 
 # This is the recommended way as per django documentation.
@@ -13,27 +19,46 @@ from warnings import deprecated
 # pylint: disable=imported-auth-user
 from django.contrib.auth.models import User
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import transaction
 from django.db.models import (
     CASCADE,
+    BinaryField,
     BooleanField,
+    Case,
     CharField,
+    Count,
     DateField,
+    DateTimeField,
     EmailField,
+    Exists,
+    ExpressionWrapper,
     F,
     ForeignKey,
     ImageField,
+    Index,
     IntegerField,
+    JSONField,
     Model,
     OneToOneField,
+    OuterRef,
+    PositiveSmallIntegerField,
     Q,
+    QuerySet,
+    Subquery,
+    Sum,
     TextChoices,
+    TextField,
     UniqueConstraint,
+    When,
 )
 from django.db.models.constraints import CheckConstraint
 from django.db.models.fields import DecimalField
+from django.db.models.functions import TruncMonth
 from django.db.models.signals import post_delete
-from django.dispatch import receiver
+from django.dispatch import Signal, receiver
+from django.utils import timezone
 from django.utils.formats import number_format
 from django.utils.translation import gettext_lazy as _
 from django.utils.translation import pgettext_lazy
@@ -43,6 +68,185 @@ from schwifty import BIC, IBAN
 from invoice.errors import FinalError, IncompliantWarning
 
 MAX_VALUE_DJANGO_SAVE = 2147483647
+SEARCH_NAME_LENGTH = 255
+# fields that show up in the search document of an invoice, saving only other fields does not refresh it
+INVOICE_SEARCH_FIELDS = frozenset({"invoice_number", "customer"})
+INVOICE_SEARCH_ATTNAMES = frozenset({"invoice_number", "customer_id"})
+CUSTOMER_SEARCH_FIELDS = frozenset({"first_name", "last_name", "email"})
+# fields of an invoice that decide its VAT rollup rows, as names and as attribute names
+INVOICE_ROLLUP_FIELDS = frozenset({"vendor", "date", "currency", "final"})
+INVOICE_ROLLUP_ATTNAMES = frozenset({"vendor_id", "date", "currency", "final"})
+# sent with the instance by the save that finalizes an invoice, within its transaction, see invoice.snapshots
+invoice_finalized = Signal()
+# fields of an invoice kept up to date by its payments and items, a save of a stale instance must not overwrite them
+BALANCE_FIELDS = frozenset({"open_balance", "paid"})
+# digits of the sums in the VAT rollup
+ROLLUP_MAX_DIGITS = 28
+ROLLUP_DECIMAL_PLACES = 4
+CENT = Decimal("0.01")
+# values of the items joined to an invoice that its total is calculated from, see rounded_total
+INVOICE_ITEM_VALUES = ("invoiceitem__tax", "invoiceitem__price", "invoiceitem__quantity")
+
+
+def _increment_invoice_counter(instance) -> int:
+    """
+    Increment the invoice counter in the database and return the new value.
+
+    The update and the read happen in one write transaction, so concurrent requests never get the same counter.
+    """
+    with transaction.atomic():
+        manager = type(instance).objects
+        manager.filter(pk=instance.pk).update(invoice_counter=F("invoice_counter") + 1)
+        instance.invoice_counter = manager.values_list("invoice_counter", flat=True).get(pk=instance.pk)
+    return instance.invoice_counter
+
+
+def search_name(*parts: str) -> str:
+    """Normalize the name parts for a case-insensitive prefix search on an indexed column."""
+    return " ".join(part.strip() for part in parts if part.strip()).casefold()[:SEARCH_NAME_LENGTH]
+
+
+def _update_search_name(instance, kwargs):
+    """Keep the search name in sync with the saved name, also if only some fields are saved."""
+    instance.search_name = instance.get_search_name()
+    if kwargs.get("update_fields") is not None:
+        kwargs["update_fields"] = {*kwargs["update_fields"], "search_name"}
+
+
+def _saves_any(kwargs, fields) -> bool:
+    """Check if saving with the keyword arguments of save() writes any of the fields."""
+    update_fields = kwargs.get("update_fields")
+    return update_fields is None or not fields.isdisjoint(update_fields)
+
+
+def tax_bases(lines) -> dict[Decimal, Decimal]:
+    """
+    Sum up the net amounts of the (tax rate, net amount) lines per tax rate, each line rounded to two decimals.
+
+    This is the calculation of EN 16931, which the CII XML has to follow. The PDF, the snapshot and the open balance
+    use it as well, so that all of them show the same totals.
+    """
+    bases = {}
+    for rate, amount in lines:
+        bases[rate] = bases.get(rate, Decimal("0.00")) + amount.quantize(CENT)
+    return bases
+
+
+def rounded_taxes(bases: dict[Decimal, Decimal]) -> dict[Decimal, Decimal]:
+    """Get the tax amount of each tax rate from its basis, rounded to two decimals."""
+    return {rate: (basis * rate).quantize(CENT) for rate, basis in bases.items()}
+
+
+def rounded_total(rows) -> Decimal:
+    """
+    Get the total of an invoice from its rows joined to its items, with the values of ``INVOICE_ITEM_VALUES``.
+
+    It is rounded like :attr:`Invoice.total_rounded`. The single row of an invoice without items has no item values.
+    """
+    bases = tax_bases(
+        (row["invoiceitem__tax"], row["invoiceitem__price"] * row["invoiceitem__quantity"])
+        for row in rows
+        if row["invoiceitem__tax"] is not None
+    )
+    return sum(bases.values(), Decimal("0.00")) + sum(rounded_taxes(bases).values(), Decimal("0.00"))
+
+
+def _field_values(instance, attnames) -> tuple:
+    """Get the values of the fields of the instance by their attribute names, in a fixed order."""
+    return tuple(getattr(instance, attname) for attname in sorted(attnames))
+
+
+def _next_month(period: date) -> date:
+    """Get the first day of the month after the period."""
+    return (period.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+class OwnedQuerySet(QuerySet):
+    """Query set of objects that belong to a user through their vendor."""
+
+    owner_lookup = "vendor__user"
+
+    def owned_by(self, user) -> QuerySet:
+        """Get only the objects of the user. The lookup and the ownership check are one query."""
+        return self.filter(**{self.owner_lookup: user.id})
+
+
+class VendorQuerySet(OwnedQuerySet):
+    """Query set of vendors, which belong to a user directly."""
+
+    owner_lookup = "user"
+
+
+class InvoiceQuerySet(OwnedQuerySet):
+    """Query set of invoices."""
+
+    def apply_payment(self, amount: Decimal) -> int:
+        """Subtract the amount from the open balance of the invoices and derive their paid flag, in one query."""
+        return self.update(
+            open_balance=F("open_balance") - amount,
+            # the conditions see the balance before the update
+            paid=Case(
+                When(Q(open_balance__lte=amount) & Exists(Payment.objects.filter(invoice=OuterRef("pk"))), then=True),
+                default=False,
+            ),
+        )
+
+    def refresh_open_balances(self) -> int:
+        """
+        Recalculate the open balance and the paid flag of the invoices from their items and payments.
+
+        The values of the items and the sums of the payments are read by one query, the totals are rounded per item
+        like :attr:`Invoice.total_rounded`. Return the number of invoices.
+        """
+        payments = Payment.objects.filter(invoice=OuterRef("pk")).order_by().values("invoice")
+        rows = (
+            self.order_by("pk")
+            .values("pk", *INVOICE_ITEM_VALUES)
+            .annotate(
+                payment_total=Subquery(payments.annotate(total=Sum("amount")).values("total")),
+                has_payments=Exists(payments),
+            )
+        )
+        invoices = []
+        for _pk, group in groupby(rows, key=itemgetter("pk")):
+            invoice_rows = list(group)
+            row = invoice_rows[0]
+            open_balance = rounded_total(invoice_rows) - (row["payment_total"] or Decimal(0))
+            invoices.append(
+                Invoice(pk=row["pk"], open_balance=open_balance, paid=row["has_payments"] and open_balance <= 0)
+            )
+        Invoice.objects.bulk_update(invoices, list(BALANCE_FIELDS), batch_size=1000)
+        return len(invoices)
+
+    def rebuild_open_balances(self, chunk_size: int = 500) -> int:
+        """Refresh the open balances of many invoices in chunks, each in its own transaction. Return their number."""
+        total = 0
+        for chunk in batched(self.order_by("pk").values_list("pk", flat=True), chunk_size, strict=False):
+            with transaction.atomic():
+                total += Invoice.objects.filter(pk__in=chunk).refresh_open_balances()
+        return total
+
+
+class InvoiceItemQuerySet(OwnedQuerySet):
+    """Query set of invoice items, which belong to a user through their invoice."""
+
+    owner_lookup = "invoice__vendor__user"
+
+
+class PaymentQuerySet(OwnedQuerySet):
+    """Query set of payments, which belong to a user through their invoice."""
+
+    owner_lookup = "invoice__vendor__user"
+
+
+class OutboxMessageQuerySet(OwnedQuerySet):
+    """Query set of outbox messages, which belong to a user through their invoice."""
+
+    owner_lookup = "invoice__vendor__user"
+
+    def due(self, now) -> QuerySet:
+        """Narrow the messages down to the queued messages whose next attempt is due, which the partial index covers."""
+        return self.filter(status=OutboxMessage.Status.QUEUED, next_attempt__lte=now)
 
 
 class Address(Model):
@@ -121,6 +325,13 @@ class Customer(Model):
     address = OneToOneField(Address, verbose_name=_("address"), on_delete=CASCADE)
     vendor = ForeignKey("Vendor", verbose_name=_("vendor"), on_delete=CASCADE)
     invoice_counter = IntegerField(_("invoice counter"), default=0)
+    # "last name first name" for the autocomplete, on PostgreSQL its index supports prefix matches
+    search_name = CharField(max_length=SEARCH_NAME_LENGTH, editable=False, db_index=True, default="")
+
+    objects = OwnedQuerySet.as_manager()
+
+    # the values of the search fields the customer was loaded with
+    _loaded_search: tuple | None = None
 
     class Meta:
         verbose_name = _("customer")
@@ -129,16 +340,42 @@ class Customer(Model):
     def __str__(self):
         return self.full_name
 
+    def save(self, *args, **kwargs):
+        """
+        Save the customer and its search name.
+
+        The search documents of its invoices are refreshed in chunks, only if the name or the email changed since the
+        customer was loaded.
+        """
+        _update_search_name(self, kwargs)
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if _saves_any(kwargs, CUSTOMER_SEARCH_FIELDS):
+            search_values = _field_values(self, CUSTOMER_SEARCH_FIELDS)
+            if not adding and search_values != self._loaded_search:
+                SearchDocument.objects.rebuild(self.invoice_set.all())
+            self._loaded_search = search_values
+
+    @classmethod
+    def from_db(cls, db, field_names, values, **kwargs):
+        """Remember the search fields of the loaded customer, so that a save refreshes the search if they change."""
+        instance = super().from_db(db, field_names, values, **kwargs)
+        if CUSTOMER_SEARCH_FIELDS.isdisjoint(instance.get_deferred_fields()):
+            instance._loaded_search = _field_values(instance, CUSTOMER_SEARCH_FIELDS)  # noqa: SLF001
+        return instance
+
     @property
     def full_name(self):
         """Get the full name of the customer (first name + last name)."""
         return f"{self.first_name} {self.last_name}"
 
+    def get_search_name(self) -> str:
+        """Get the normalized name the autocomplete searches by prefix."""
+        return search_name(self.last_name, self.first_name)
+
     def get_next_invoice_counter(self) -> int:
         """Get the next invoice number based on the counter and saves the new number as current counter."""
-        self.invoice_counter += 1
-        self.save()
-        return self.invoice_counter
+        return _increment_invoice_counter(self)
 
 
 @receiver(post_delete, sender=Customer)
@@ -166,6 +403,10 @@ class Vendor(Model):
     invoice_counter = IntegerField(_("invoice counter"), default=0)
     invoice_number_format = CharField(_("invoice number format"), max_length=255, blank=True, default="")
     logo = ImageField(_("logo path"), upload_to="logos", blank=True, default="")
+    # the displayed name for the autocomplete, on PostgreSQL its index supports prefix matches
+    search_name = CharField(max_length=SEARCH_NAME_LENGTH, editable=False, db_index=True, default="")
+
+    objects = VendorQuerySet.as_manager()
 
     class Meta:
         """Meta configuration of vendor. Ensures uniques of the combination of name and vendor."""
@@ -179,11 +420,18 @@ class Vendor(Model):
             return self.company_name
         return self.name
 
+    def save(self, *args, **kwargs):
+        """Save the vendor and its search name."""
+        _update_search_name(self, kwargs)
+        super().save(*args, **kwargs)
+
+    def get_search_name(self) -> str:
+        """Get the normalized name the autocomplete searches by prefix."""
+        return search_name(str(self))
+
     def get_next_invoice_counter(self) -> int:
         """Get the next invoice number based on the counter and saves the new number as current counter."""
-        self.invoice_counter += 1
-        self.save()
-        return self.invoice_counter
+        return _increment_invoice_counter(self)
 
 
 @receiver(post_delete, sender=Vendor)
@@ -231,8 +479,23 @@ class Invoice(Model):
     currency = CharField(_("currency"), max_length=3, choices=Currency, default=Currency.EUR)
     due_date = DateField(_("due date"), null=True, blank=True)
     delivery_date = DateField(_("delivery date"), null=True, blank=True)
-    paid = BooleanField(_("paid"), default=False)
     final = BooleanField(_("final"), default=False)
+    # the total minus the payments, kept up to date by the payments and the items
+    open_balance = DecimalField(
+        _("open balance"), max_digits=19, decimal_places=2, default=Decimal("0.00"), editable=False
+    )
+    # derived from the open balance: there are payments and nothing is left to pay
+    paid = BooleanField(_("paid"), default=False, editable=False)
+    # the last reminder of the dunning run, see invoice.dunning
+    dunning_level = PositiveSmallIntegerField(_("dunning level"), default=0, editable=False)
+    dunned_on = DateField(_("dunned on"), null=True, editable=False)
+
+    objects = InvoiceQuerySet.as_manager()
+
+    # the VAT rollup key and the final flag the invoice was loaded with
+    _loaded_rollup: tuple[tuple, bool] | None = None
+    # the values of the search fields the invoice was loaded with
+    _loaded_search: tuple | None = None
 
     class Meta:
         """
@@ -248,12 +511,23 @@ class Invoice(Model):
             UniqueConstraint(fields=["vendor", "invoice_number"], name="unique_invoice_numbers_per_vendor"),
             CheckConstraint(condition=Q(due_date__gte=F("date")), name="due_date_gte_date"),
         ]
+        indexes = [
+            Index(fields=["vendor", "date"], name="invoice_vendor_date"),
+            # open items, e.g. of the aging report, are the final invoices with an open balance
+            Index(fields=["vendor", "due_date"], condition=Q(final=True, open_balance__gt=0), name="invoice_open"),
+        ]
 
     def __str__(self):
         return f"Invoice({self.invoice_number},{self.vendor},{self.customer})"
 
     def save(self, *args, **kwargs):
-        """Save an invoice unless it is marked final. Then a FinalError is raised."""
+        """
+        Save an invoice unless it is marked final. Then a FinalError is raised.
+
+        The open balance and the paid flag are left out of the update, they are maintained by the payments and items.
+        The save that finalizes the invoice sends :data:`invoice_finalized` in the same transaction, which takes its
+        snapshot, see :mod:`invoice.snapshots`.
+        """
         if self.final and self.pk is not None:
             initial = Invoice.objects.get(pk=self.pk)
             if initial.final:
@@ -261,7 +535,61 @@ class Invoice(Model):
 
         if self.final and not self.compliant:
             warnings.warn("Invoice is not compliant", IncompliantWarning, stacklevel=2)
-        super().save(*args, **kwargs)
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            deferred = self.get_deferred_fields()
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in BALANCE_FIELDS and field.attname not in deferred
+            ]
+        # the finalization and its snapshot are one write
+        with transaction.atomic() if self.final else nullcontext():
+            super().save(*args, **kwargs)
+            if _saves_any(kwargs, INVOICE_SEARCH_FIELDS):
+                search_values = _field_values(self, INVOICE_SEARCH_ATTNAMES)
+                if search_values != self._loaded_search:
+                    SearchDocument.objects.refresh(Invoice.objects.filter(pk=self.pk))
+                self._loaded_search = search_values
+            if _saves_any(kwargs, INVOICE_ROLLUP_FIELDS):
+                rollups = [self._loaded_rollup, (self.get_rollup_key(), self.final)]
+                keys = [key for key, final in filter(None, rollups) if final]
+                if keys:
+                    VatRollup.objects.refresh(keys)
+                self._loaded_rollup = rollups[1]
+            if self.final:
+                # a final invoice is only saved once, by the save that finalizes it
+                invoice_finalized.send(sender=Invoice, instance=self)
+
+    @classmethod
+    def from_db(cls, db, field_names, values, **kwargs):
+        """
+        Remember the VAT rollup key and the search fields of the loaded invoice.
+
+        A save then also updates the rollup rows the invoice leaves, and refreshes its search document only if the
+        search fields changed.
+        """
+        instance = super().from_db(db, field_names, values, **kwargs)
+        deferred = instance.get_deferred_fields()
+        if INVOICE_ROLLUP_ATTNAMES.isdisjoint(deferred):
+            instance._loaded_rollup = (instance.get_rollup_key(), instance.final)  # noqa: SLF001
+        if INVOICE_SEARCH_ATTNAMES.isdisjoint(deferred):
+            instance._loaded_search = _field_values(instance, INVOICE_SEARCH_ATTNAMES)  # noqa: SLF001
+        return instance
+
+    def get_rollup_key(self) -> tuple[int, date, str]:
+        """Get the vendor ID, the month and the currency, which select the VAT rollup rows of the invoice."""
+        invoice_date = self._meta.get_field("date").to_python(self.date)
+        return self.vendor_id, invoice_date.replace(day=1), self.currency
+
+    @property
+    def issued(self) -> InvoiceSnapshot | None:
+        """Get the snapshot taken when the invoice was finalized, None for drafts and final invoices without one."""
+        if not self.final:
+            return None
+        try:
+            return self.snapshot  # pylint: disable=no-member
+        except ObjectDoesNotExist:
+            return None
 
     @property
     def items(self) -> list[InvoiceItem]:
@@ -270,6 +598,13 @@ class Invoice(Model):
             return []
         return list(self.invoiceitem_set.all())
 
+    def get_search_document(self) -> str:
+        """Get the normalized text the invoice search matches: the number, the customer and the items."""
+        parts = [self.invoice_number, self.customer.first_name, self.customer.last_name, self.customer.email]
+        for item in self.items:
+            parts += [item.name, item.description]
+        return "\n".join(parts).casefold()
+
     @property
     def table_export(self):
         """Get the line items as list and export all of them as table with a header row."""
@@ -300,15 +635,30 @@ class Invoice(Model):
         """Get the sum of total."""
         return self.net_total + self.tax_amount
 
+    @property
+    def net_total_per_rate(self) -> dict[Decimal, Decimal]:
+        """Get the sum of the net totals of the items rounded to two decimals per tax rate, see tax_bases."""
+        return tax_bases((item.tax, item.net_total) for item in self.items)
+
+    @property
+    def tax_amount_per_rate_rounded(self) -> dict[str, Decimal]:
+        """
+        Get the tax amount per tax rate calculated from the rounded net totals and rounded to two decimals.
+
+        Rates without tax, like the zero rate, are left out.
+        """
+        rate_strings = {item.tax: item.tax_string for item in self.items}
+        return {rate_strings[rate]: amount for rate, amount in rounded_taxes(self.net_total_per_rate).items() if amount}
+
     @property
     def net_total_rounded(self) -> Decimal:
-        """Get the sum of net total rounded to two decimals."""
-        return self.net_total.quantize(Decimal("0.01"))
+        """Get the sum of the net totals of the items rounded to two decimals."""
+        return sum(self.net_total_per_rate.values(), Decimal("0.00"))
 
     @property
     def tax_amount_rounded(self) -> Decimal:
-        """Get the sum of tax amount rounded to two decimals."""
-        return self.tax_amount.quantize(Decimal("0.01"))
+        """Get the sum of the tax amounts per tax rate rounded to two decimals."""
+        return sum(rounded_taxes(self.net_total_per_rate).values(), Decimal("0.00"))
 
     @property
     def total_rounded(self) -> Decimal:
@@ -325,8 +675,8 @@ class Invoice(Model):
     def tax_amount_strings(self) -> dict[str, str]:
         """Get the tax amount strings as dictionary with the rate as key and the amount string as value."""
         return {
-            rate: f"{number_format(amount.quantize(Decimal('0.01')), decimal_pos=2, use_l10n=True)} {self.currency}"
-            for rate, amount in self.tax_amount_per_rate.items()
+            rate: f"{number_format(amount, decimal_pos=2, use_l10n=True)} {self.currency}"
+            for rate, amount in self.tax_amount_per_rate_rounded.items()
         }
 
     @property
@@ -389,9 +739,36 @@ class InvoiceItem(Model):
     )
     invoice = ForeignKey(Invoice, verbose_name=_("invoice"), on_delete=CASCADE)
 
+    objects = InvoiceItemQuerySet.as_manager()
+
     def __str__(self):
         return f"InvoiceItem({self.quantity}x{self.name},{self.price})"
 
+    def save(self, *args, **kwargs):
+        """
+        Save the item and refresh the search document and the open balance of its invoice.
+
+        The items of a final invoice are frozen with its snapshot, saving one raises a FinalError.
+        """
+        self._check_not_final()
+        super().save(*args, **kwargs)
+        self._refresh_invoice()
+
+    def delete(self, *args, **kwargs):
+        """Delete the item and refresh the search document and the open balance of its invoice unless it is final."""
+        self._check_not_final()
+        result = super().delete(*args, **kwargs)
+        self._refresh_invoice()
+        return result
+
+    def _check_not_final(self):
+        if Invoice.objects.filter(pk=self.invoice_id, final=True).exists():
+            raise FinalError
+
+    def _refresh_invoice(self):
+        SearchDocument.objects.refresh(Invoice.objects.filter(pk=self.invoice_id))
+        Invoice.objects.filter(pk=self.invoice_id).refresh_open_balances()
+
     @property
     def net_total(self) -> Decimal:
         """Get the sum of the item excluding taxes."""
@@ -473,3 +850,306 @@ class InvoiceItem(Model):
         """Get the total string."""
         formatted_total = number_format(self.total_rounded, decimal_pos=2, use_l10n=True)
         return f"{formatted_total} {self.invoice.currency}"
+
+
+class Payment(Model):
+    """
+    Payment of an invoice, e.g. a bank transfer.
+
+    Saving and deleting a payment updates the open balance of its invoice incrementally. Bulk operations skip that and
+    have to call :meth:`InvoiceQuerySet.rebuild_open_balances`.
+    """
+
+    invoice = ForeignKey(Invoice, verbose_name=_("invoice"), on_delete=CASCADE)
+    amount = DecimalField(
+        _("amount"),
+        max_digits=19,
+        decimal_places=2,
+        validators=[MinValueValidator(Decimal("-1000000.00")), MaxValueValidator(Decimal("1000000.00"))],
+    )
+    date = DateField(_("date"))
+    reference = CharField(_("reference"), max_length=140, blank=True, default="")
+
+    objects = PaymentQuerySet.as_manager()
+
+    # the invoice ID and the amount the payment was loaded with
+    _loaded_amount: tuple[int, Decimal] | None = None
+
+    class Meta:
+        verbose_name = _("payment")
+        verbose_name_plural = _("payments")
+
+    def __str__(self):
+        return f"Payment({self.invoice_id},{self.amount},{self.date})"
+
+    def save(self, *args, **kwargs):
+        """Save the payment and apply the difference to the open balance of its invoice."""
+        amount = self._meta.get_field("amount").to_python(self.amount)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if self._loaded_amount is not None:
+                invoice_id, loaded_amount = self._loaded_amount
+                Invoice.objects.filter(pk=invoice_id).apply_payment(-loaded_amount)
+            Invoice.objects.filter(pk=self.invoice_id).apply_payment(amount)
+        self._loaded_amount = (self.invoice_id, amount)
+
+    def delete(self, *args, **kwargs):
+        """Delete the payment and add it to the open balance of its invoice again."""
+        invoice_id, amount = self._loaded_amount or (self.invoice_id, self.amount)
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            Invoice.objects.filter(pk=invoice_id).apply_payment(-amount)
+        self._loaded_amount = None
+        return result
+
+    @classmethod
+    def from_db(cls, db, field_names, values, **kwargs):
+        """Remember the invoice and the amount of the loaded payment, so that a save only applies the difference."""
+        instance = super().from_db(db, field_names, values, **kwargs)
+        if {"invoice_id", "amount"}.isdisjoint(instance.get_deferred_fields()):
+            instance._loaded_amount = (instance.invoice_id, instance.amount)  # noqa: SLF001
+        return instance
+
+    def clean(self):
+        """Allow payments of final invoices only."""
+        if self.invoice_id is not None and not self.invoice.final:
+            raise ValidationError(_("Only final invoices can be paid."))
+
+
+class OutboxMessage(Model):
+    """
+    Email of an invoice with its PDF, waiting in the outbox until the worker sends it.
+
+    The worker of :mod:`invoice.outbox` sends the due messages and retries a failed message with a growing delay until
+    it gave up after ``EMAIL_MAX_ATTEMPTS`` attempts.
+    """
+
+    class Status(TextChoices):
+        """Delivery state of a message."""
+
+        QUEUED = "queued", _("queued")
+        SENT = "sent", _("sent")
+        FAILED = "failed", _("failed")
+
+    invoice = ForeignKey(Invoice, verbose_name=_("invoice"), on_delete=CASCADE)
+    recipient = EmailField(_("recipient"), max_length=256)
+    subject = CharField(_("subject"), max_length=255)
+    body = TextField(_("body"))
+    status = CharField(_("status"), max_length=6, choices=Status, default=Status.QUEUED, editable=False)
+    attempts = PositiveSmallIntegerField(_("attempts"), default=0, editable=False)
+    next_attempt = DateTimeField(_("next attempt"), default=timezone.now, editable=False)
+    last_error = TextField(_("last error"), blank=True, default="", editable=False)
+    created = DateTimeField(_("created"), auto_now_add=True)
+    sent_at = DateTimeField(_("sent at"), null=True, editable=False)
+
+    objects = OutboxMessageQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = _("outbox message")
+        verbose_name_plural = _("outbox messages")
+        indexes = [
+            # the worker reads the queued messages by their next attempt, the sent ones pile up beside them
+            Index(fields=["next_attempt"], condition=Q(status="queued"), name="outbox_due")
+        ]
+
+    def __str__(self):
+        return f"OutboxMessage({self.invoice_id},{self.recipient},{self.status})"
+
+    def clean(self):
+        """Allow emails of final invoices only."""
+        if self.invoice_id is not None and not self.invoice.final:
+            raise ValidationError(_("Only final invoices can be sent."))
+
+
+class SearchDocumentQuerySet(QuerySet):
+    """Query set of search documents."""
+
+    def refresh(self, invoices: QuerySet) -> int:
+        """Build the documents of the invoices and insert or update them in one query. Return their number."""
+        invoices = invoices.select_related("vendor", "customer").prefetch_related("invoiceitem_set")
+        documents = [
+            SearchDocument(invoice=invoice, user_id=invoice.vendor.user_id, document=invoice.get_search_document())
+            for invoice in invoices
+        ]
+        self.bulk_create(
+            documents, update_conflicts=True, unique_fields=["invoice"], update_fields=["user", "document"]
+        )
+        return len(documents)
+
+    def rebuild(self, invoices: QuerySet, chunk_size: int = 500) -> int:
+        """Refresh the documents of many invoices in chunks, each in its own transaction. Return their number."""
+        total = 0
+        for chunk in batched(invoices.order_by("pk").values_list("pk", flat=True), chunk_size, strict=False):
+            with transaction.atomic():
+                total += self.refresh(Invoice.objects.filter(pk__in=chunk))
+        return total
+
+
+class SearchDocument(Model):
+    """
+    Normalized text of an invoice, its customer and its items, which the invoice search matches.
+
+    It is refreshed whenever one of them is saved, bulk inserts have to call
+    :meth:`SearchDocumentQuerySet.rebuild`. Its index depends on the database, see :mod:`invoice.search`.
+    """
+
+    invoice = OneToOneField(Invoice, on_delete=CASCADE, primary_key=True, related_name="search_document")
+    # the owner of the invoice, so that the search needs no join
+    user = ForeignKey(User, on_delete=CASCADE, related_name="+")
+    document = TextField()
+
+    objects = SearchDocumentQuerySet.as_manager()
+
+    def __str__(self):
+        return f"SearchDocument({self.invoice_id})"
+
+
+class InvoiceSnapshotQuerySet(OwnedQuerySet):
+    """Query set of invoice snapshots, which belong to a user directly."""
+
+    owner_lookup = "user"
+
+
+class InvoiceSnapshot(Model):
+    """
+    Frozen record of a final invoice: its rendered fields and totals, its PDF and its CII XML.
+
+    It is taken when the invoice is finalized and never updated, so that later changes of the vendor, the customer or
+    their addresses do not change an issued invoice. The pages and downloads of a final invoice read only its snapshot,
+    see :mod:`invoice.snapshots`.
+    """
+
+    invoice = OneToOneField(Invoice, on_delete=CASCADE, primary_key=True, related_name="snapshot")
+    # the owner of the invoice, so that the downloads need no join
+    user = ForeignKey(User, on_delete=CASCADE, related_name="+")
+    currency = CharField(_("currency"), max_length=3, choices=Invoice.Currency)
+    net_total = DecimalField(_("net total"), max_digits=19, decimal_places=2)
+    tax_amount = DecimalField(_("tax amount"), max_digits=19, decimal_places=2)
+    total = DecimalField(_("total"), max_digits=19, decimal_places=2)
+    data = JSONField(encoder=DjangoJSONEncoder)
+    # rendered after the finalization is committed, see invoice.snapshots
+    pdf = BinaryField(null=True)
+    xml = BinaryField()
+    created = DateTimeField(_("created"), auto_now_add=True)
+
+    objects = InvoiceSnapshotQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = _("invoice snapshot")
+        verbose_name_plural = _("invoice snapshots")
+
+    def __str__(self):
+        return f"InvoiceSnapshot({self.invoice_id})"
+
+    @property
+    def net_total_string(self) -> str:
+        """Get the net total string."""
+        return f"{number_format(self.net_total, decimal_pos=2, use_l10n=True)} {self.currency}"
+
+    @property
+    def total_string(self) -> str:
+        """Get the total string."""
+        return f"{number_format(self.total, decimal_pos=2, use_l10n=True)} {self.currency}"
+
+
+@receiver(post_delete, sender=Invoice)
+def post_delete_invoice(sender, instance, *args, origin=None, **kwargs):  # pylint: disable=unused-argument # noqa: ARG001
+    """
+    Remove a deleted final invoice from the VAT rollup.
+
+    If the invoice is deleted along with its vendor or user, their rollup rows are deleted anyway.
+    """
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if instance.final and origin_model in {Invoice, Customer}:
+        VatRollup.objects.refresh([instance.get_rollup_key()])
+
+
+# net total and tax amount of an item in the database, unrounded like InvoiceItem.net_total and tax_amount
+ITEM_NET_TOTAL = ExpressionWrapper(
+    F("price") * F("quantity"),
+    output_field=DecimalField(max_digits=ROLLUP_MAX_DIGITS, decimal_places=ROLLUP_DECIMAL_PLACES),
+)
+ITEM_TAX_AMOUNT = ExpressionWrapper(
+    F("price") * F("quantity") * F("tax"),
+    output_field=DecimalField(max_digits=ROLLUP_MAX_DIGITS, decimal_places=ROLLUP_DECIMAL_PLACES),
+)
+
+
+class VatRollupQuerySet(OwnedQuerySet):
+    """Query set of VAT rollup rows."""
+
+    @staticmethod
+    def _aggregate(items: QuerySet) -> list[VatRollup]:
+        """Sum up the items of final invoices per vendor, month, currency and tax rate in one query."""
+        rows = (
+            items.filter(invoice__final=True)
+            .values(
+                vendor_id=F("invoice__vendor_id"),
+                period=TruncMonth("invoice__date"),
+                currency=F("invoice__currency"),
+                tax_rate=F("tax"),
+            )
+            .annotate(
+                net_total=Sum(ITEM_NET_TOTAL),
+                tax_amount=Sum(ITEM_TAX_AMOUNT),
+                invoice_count=Count("invoice", distinct=True),
+            )
+            .order_by()
+        )
+        return [VatRollup(**row) for row in rows]
+
+    def refresh(self, keys) -> None:
+        """Recalculate the rows of the (vendor ID, month, currency) keys from the items of the final invoices."""
+        keys = set(keys)
+        items, rollups = Q(), Q()
+        for vendor_id, period, currency in keys:
+            items |= Q(
+                invoice__vendor_id=vendor_id,
+                invoice__currency=currency,
+                invoice__date__gte=period,
+                invoice__date__lt=_next_month(period),
+            )
+            rollups |= Q(vendor_id=vendor_id, period=period, currency=currency)
+        if not keys:
+            return
+        with transaction.atomic():
+            self.filter(rollups).delete()
+            self.bulk_create(self._aggregate(InvoiceItem.objects.filter(items)))
+
+    def rebuild(self, vendors: QuerySet) -> int:
+        """Recalculate all rows of the vendors from scratch. Return the number of rows."""
+        with transaction.atomic():
+            self.filter(vendor__in=vendors).delete()
+            rows = self._aggregate(InvoiceItem.objects.filter(invoice__vendor__in=vendors))
+            self.bulk_create(rows, batch_size=1000)
+        return len(rows)
+
+
+class VatRollup(Model):
+    """
+    Net total and tax amount of the final invoices of a vendor per month, currency and tax rate.
+
+    The rows of a month are recalculated whenever an invoice of it is finalized or a final one is deleted, the items of
+    a final invoice cannot change anymore. Bulk inserts have to call :meth:`VatRollupQuerySet.rebuild`. The VAT reports
+    read only these rows, see :mod:`invoice.reporting`.
+    """
+
+    vendor = ForeignKey(Vendor, verbose_name=_("vendor"), on_delete=CASCADE)
+    period = DateField(_("period"))
+    currency = CharField(_("currency"), max_length=3, choices=Invoice.Currency)
+    tax_rate = DecimalField(_("tax rate"), max_digits=5, decimal_places=4)
+    net_total = DecimalField(_("net total"), max_digits=ROLLUP_MAX_DIGITS, decimal_places=ROLLUP_DECIMAL_PLACES)
+    tax_amount = DecimalField(_("tax amount"), max_digits=ROLLUP_MAX_DIGITS, decimal_places=ROLLUP_DECIMAL_PLACES)
+    invoice_count = IntegerField(_("invoice count"))
+
+    objects = VatRollupQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = _("VAT rollup")
+        verbose_name_plural = _("VAT rollups")
+        constraints = [
+            UniqueConstraint(fields=["vendor", "period", "currency", "tax_rate"], name="unique_vat_rollup_key")
+        ]
+
+    def __str__(self):
+        return f"VatRollup({self.vendor_id},{self.period},{self.currency},{self.tax_rate})"
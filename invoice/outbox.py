@@ -0,0 +1,221 @@
+"""
+Outbox of the invoice emails: the messages are queued in the database and sent in batches by a worker.
+
+The worker claims a batch of due messages, takes the PDF of every invoice of the batch from its snapshot, see
+:mod:`invoice.snapshots`, or renders it once if it has none, and hands the messages to one email connection, which stays
+open for all batches of a run, so that an SMTP server is not dialed per message. Every message is passed to
+:meth:`~django.core.mail.backends.base.BaseEmailBackend.send_messages` on its own, so that a refused recipient fails
+alone and a message that went out is never sent twice. An invoice whose render fails, e.g. because it times out, fails
+only its own messages. A failed message is retried after ``EMAIL_RETRY_DELAY`` seconds,
+doubled with every further attempt, until it is given up after ``EMAIL_MAX_ATTEMPTS`` attempts. The outcome of a batch
+is recorded by a bulk update per outcome.
+
+A claimed message is not due again before ``CLAIM_LEASE`` is over, so that several workers never send it twice and a
+message of a crashed worker is sent by the next run.
+"""
+
+import datetime as dt
+import smtplib
+from contextlib import suppress
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F, QuerySet
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+from django.utils.translation import gettext
+
+from invoice import render_worker
+from invoice.models import Invoice, InvoiceSnapshot, OutboxMessage
+from invoice.render_pool import batch_renderer, invoice_pdf_queryset
+from rechnung.metrics import CACHE_HITS, CACHE_MISSES
+
+CLAIM_LEASE = dt.timedelta(minutes=15)
+# errors of a single message, the connection is reopened for the next one
+SEND_ERRORS = (smtplib.SMTPException, OSError)
+
+
+@dataclass
+class SendResult:
+    """Outcome of a run of the worker."""
+
+    sent: int = 0
+    retried: int = 0
+    failed: int = 0
+
+
+def default_subject(invoice: Invoice) -> str:
+    """Get the subject of the email of the invoice in the active language."""
+    return gettext("Invoice %(number)s") % {"number": invoice.invoice_number}
+
+
+def default_body(invoice: Invoice) -> str:
+    """Get the text of the email of the invoice in the active language."""
+    return gettext(
+        "Dear %(name)s,\n\nplease find attached the invoice %(number)s of %(date)s.\n\nKind regards\n%(vendor)s"
+    ) % {
+        "name": f"{invoice.customer.first_name} {invoice.customer.last_name}",
+        "number": invoice.invoice_number,
+        "date": invoice.date,
+        "vendor": invoice.vendor,
+    }
+
+
+def queue_invoice_emails(invoices: QuerySet) -> int:
+    """
+    Queue an email to the customer of each final invoice with the default subject and text, by one bulk insert.
+
+    Return the number of queued messages.
+    """
+    messages = [
+        OutboxMessage(
+            invoice=invoice,
+            recipient=invoice.customer.email,
+            subject=default_subject(invoice),
+            body=default_body(invoice),
+        )
+        for invoice in invoices.filter(final=True).select_related("vendor", "customer")
+    ]
+    OutboxMessage.objects.bulk_create(messages, batch_size=1000)
+    return len(messages)
+
+
+def attachment_name(invoice_number: str) -> str:
+    """Get the file name of the PDF attached to the email of the invoice with the number."""
+    return get_valid_filename(f"invoice-{invoice_number}.pdf")
+
+
+def retry_delay(attempts: int) -> dt.timedelta:
+    """Get the delay before the next attempt after the given number of failed attempts."""
+    return dt.timedelta(seconds=settings.EMAIL_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+def claim_batch(batch_size: int, now: dt.datetime) -> list[OutboxMessage]:
+    """Claim the next due messages for the lease and return them, oldest due first."""
+    with transaction.atomic():
+        claimed = list(
+            OutboxMessage.objects.due(now)
+            .order_by("next_attempt", "pk")
+            .select_for_update(skip_locked=True)
+            .only("pk", "invoice_id", "recipient", "subject", "body", "attempts")[:batch_size]
+        )
+        OutboxMessage.objects.filter(pk__in=[message.pk for message in claimed]).update(next_attempt=now + CLAIM_LEASE)
+    return claimed
+
+
+def render_attachments(invoices: list[Invoice], render) -> tuple[dict[int, tuple[str, bytes]], dict[int, str]]:
+    """
+    Render the PDFs of the invoices and get their attachments and the errors of the failed renders by the invoice IDs.
+
+    The invoices are rendered as one batch. If that fails, they are rendered one by one, so that only the invoices that
+    cannot be rendered get an error.
+    """
+    try:
+        return {
+            invoice.pk: (attachment_name(invoice.invoice_number), pdf)
+            for invoice, pdf in zip(invoices, render(invoices), strict=True)
+        }, {}
+    except Exception:  # noqa: BLE001 # pylint: disable=broad-exception-caught
+        attachments, errors = {}, {}
+        for invoice in invoices:
+            try:
+                (pdf,) = render([invoice])
+            except Exception as error:  # noqa: BLE001 # pylint: disable=broad-exception-caught
+                errors[invoice.pk] = str(error) or type(error).__name__
+            else:
+                attachments[invoice.pk] = (attachment_name(invoice.invoice_number), pdf)
+        return attachments, errors
+
+
+def send_batch(messages: list[OutboxMessage], connection, render) -> SendResult:
+    """
+    Send the messages with the PDFs of their invoices over the connection and record the outcome of each.
+
+    The PDFs of the snapshots of the invoices are read by one query. The invoices without a snapshot or its PDF are read
+    by one more query and rendered by the render function, see :func:`~invoice.render_pool.batch_renderer`. Every PDF is
+    read or rendered once per batch, also if several messages attach the same invoice. The messages of an invoice whose
+    render fails fail with the error of the render.
+    """
+    invoice_ids = {message.invoice_id for message in messages}
+    pdfs = {
+        pk: (attachment_name(invoice_number), bytes(pdf))
+        for pk, invoice_number, pdf in InvoiceSnapshot.objects.filter(pk__in=invoice_ids).values_list(
+            "pk", "data__invoice_number", "pdf"
+        )
+        if pdf is not None
+    }
+    invoices = list(invoice_pdf_queryset().filter(pk__in=invoice_ids - pdfs.keys()))
+    CACHE_HITS.inc(len(pdfs), cache="snapshot_pdf")
+    CACHE_MISSES.inc(len(invoices), cache="snapshot_pdf")
+    rendered, render_errors = render_attachments(invoices, render)
+    pdfs.update(rendered)
+    sent = []
+    errors = {}
+    for message in messages:
+        if message.invoice_id in render_errors:
+            errors[message] = render_errors[message.invoice_id]
+            continue
+        if message.invoice_id not in pdfs:
+            # the invoice was deleted with its messages meanwhile
+            continue
+        filename, pdf = pdfs[message.invoice_id]
+        email = EmailMessage(message.subject, message.body, to=[message.recipient], connection=connection)
+        email.attach(filename, pdf, "application/pdf")
+        try:
+            # a no-op if the connection is open, reopens it after an error
+            connection.open()
+            connection.send_messages([email])
+        except SEND_ERRORS as error:
+            errors[message] = str(error) or type(error).__name__
+            with suppress(*SEND_ERRORS):
+                connection.close()
+        else:
+            sent.append(message.pk)
+    return record_outcome(sent, errors)
+
+
+def record_outcome(sent: list[int], errors: dict[OutboxMessage, str]) -> SendResult:
+    """Mark the sent messages as sent and schedule the next attempt of the failed ones or give them up."""
+    now = timezone.now()
+    result = SendResult(sent=len(sent))
+    failed = []
+    for message, error in errors.items():
+        message.attempts += 1
+        message.last_error = error
+        if message.attempts >= settings.EMAIL_MAX_ATTEMPTS:
+            message.status = OutboxMessage.Status.FAILED
+            result.failed += 1
+        else:
+            message.next_attempt = now + retry_delay(message.attempts)
+            result.retried += 1
+        failed.append(message)
+    with transaction.atomic():
+        OutboxMessage.objects.filter(pk__in=sent).update(
+            status=OutboxMessage.Status.SENT, attempts=F("attempts") + 1, sent_at=now, last_error=""
+        )
+        OutboxMessage.objects.bulk_update(failed, ["attempts", "last_error", "status", "next_attempt"])
+    return result
+
+
+def send_outbox(batch_size: int = 100, processes: int = 0, connection=None) -> SendResult:
+    """
+    Send the due messages batch by batch until none is due anymore and return the outcome.
+
+    All batches share one connection, by default of the configured email backend, and one render pool of ``processes``
+    processes, 0 to render in this process. The messages that fail are due again later, after this run.
+    """
+    connection = connection or get_connection()
+    result = SendResult()
+    try:
+        with batch_renderer(render_worker.render, processes) as render:
+            while messages := claim_batch(batch_size, timezone.now()):
+                outcome = send_batch(messages, connection, render)
+                result.sent += outcome.sent
+                result.retried += outcome.retried
+                result.failed += outcome.failed
+    finally:
+        with suppress(*SEND_ERRORS):
+            connection.close()
+    return result
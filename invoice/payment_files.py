@@ -0,0 +1,143 @@
+"""
+Payment data of the open final invoices in bulk: a SEPA credit transfer file or an EPC QR code payload per invoice.
+
+* pain.001: one ISO 20022 ``pain.001.001.09`` credit transfer initiation with a transfer per invoice from the account
+  of the payer to the account of the vendor, e.g. to pay the invoices of a vendor in one go in online banking.
+* EPC: JSON lines with the invoice number and the EPC QR code payload of every invoice.
+
+Both are produced by a generator of text chunks, so that a response or a file streams the output of thousands of
+invoices. The invoices are read by one query, the bank account of every vendor is validated once by an
+:class:`~invoice.epc_qr.EpcBeneficiary` beforehand. Only invoices in EUR of vendors with a valid bank account are
+included.
+"""
+
+import json
+from decimal import Decimal
+from typing import TYPE_CHECKING
+from xml.sax.saxutils import escape, quoteattr
+
+from django.db.models import Count, QuerySet, Sum, TextChoices
+from django.utils import timezone
+from django.utils.translation import gettext
+from django.utils.translation import gettext_lazy as _
+from schwifty import IBAN
+
+from invoice.epc_qr import EpcBeneficiary, clean_text
+from invoice.models import Invoice, Vendor
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+PAIN001_NAMESPACE = "urn:iso:std:iso:20022:tech:xsd:pain.001.001.09"
+# maximum lengths of the pain.001 texts
+NAME_LENGTH = 70
+ID_LENGTH = 35
+REMITTANCE_INFO_LENGTH = 140
+
+
+class PaymentFileFormat(TextChoices):
+    """Format of the payment data."""
+
+    PAIN001 = "pain001", _("SEPA credit transfers (pain.001)")
+    EPC = "epc", _("EPC QR code payloads (JSON lines)")
+
+
+def payable_invoices(invoices: QuerySet) -> QuerySet:
+    """Narrow the invoices down to the open final invoices in EUR of vendors with a bank account."""
+    return invoices.filter(
+        final=True, open_balance__gt=0, currency=Invoice.Currency.EUR, vendor__bank_account__isnull=False
+    )
+
+
+def _element(tag: str, text) -> str:
+    """Get an XML element with the escaped text."""
+    return f"<{tag}>{escape(str(text))}</{tag}>"
+
+
+class PaymentFileBuilder:
+    """Build the payment data of invoices, validating the bank account of every vendor once."""
+
+    def __init__(self):
+        """Create a builder without validated bank accounts."""
+        self._beneficiaries = {}
+        self._invoice_label = gettext("Invoice")
+
+    def payable(self, invoices: QuerySet) -> QuerySet:
+        """
+        Get the payable invoices of the vendors with a valid bank account.
+
+        The bank accounts of the vendors of the invoices are read by one query and validated once.
+        """
+        payable = payable_invoices(invoices)
+        vendors = Vendor.objects.filter(pk__in=payable.values("vendor_id")).select_related("bank_account")
+        for vendor in vendors.exclude(pk__in=list(self._beneficiaries)):
+            try:
+                self._beneficiaries[vendor.pk] = EpcBeneficiary(
+                    str(vendor), vendor.bank_account.iban, bic=vendor.bank_account.bic
+                )
+            except ValueError:
+                self._beneficiaries[vendor.pk] = None
+        invalid = [vendor_id for vendor_id, beneficiary in self._beneficiaries.items() if beneficiary is None]
+        return payable.exclude(vendor_id__in=invalid)
+
+    def remittance_info(self, invoice_number: str) -> str:
+        """Get the remittance information of the invoice, the same as in the EPC QR code of its PDF."""
+        return f"{self._invoice_label}: {invoice_number}"
+
+    def payments(self, payable: QuerySet) -> Iterator[tuple[dict, EpcBeneficiary]]:
+        """Yield the number, currency and open balance of the payable invoices with the bank account of the vendor."""
+        rows = payable.order_by("vendor_id", "due_date", "pk").values(
+            "invoice_number", "currency", "open_balance", "vendor_id"
+        )
+        for row in rows.iterator(chunk_size=2000):
+            yield row, self._beneficiaries[row["vendor_id"]]
+
+    def epc_lines(self, invoices: QuerySet) -> Iterator[str]:
+        """Yield a JSON line with the invoice number and the EPC QR code payload of every payable invoice."""
+        for invoice, beneficiary in self.payments(self.payable(invoices)):
+            payload = beneficiary.payload(
+                eur_amount=invoice["open_balance"], remittance_info=self.remittance_info(invoice["invoice_number"])
+            )
+            yield json.dumps({"invoice_number": invoice["invoice_number"], "payload": payload}) + "\n"
+
+    def pain001(self, invoices: QuerySet, debtor_name: str, debtor_iban: str, execution_date) -> Iterator[str]:
+        """
+        Yield the chunks of a pain.001 credit transfer initiation of the payable invoices.
+
+        The number of transfers and their sum precede the transfers in the file, they are summed up by one aggregate
+        query beforehand.
+        """
+        payable = self.payable(invoices)
+        totals = payable.order_by().aggregate(count=Count("pk"), total=Sum("open_balance"))
+        iban = IBAN(debtor_iban)
+        created = timezone.now()
+        message_id = f"RECHNUNG-{created:%Y%m%d%H%M%S%f}"
+        control = [
+            _element("NbOfTxs", totals["count"]),
+            _element("CtrlSum", (totals["total"] or Decimal(0)).quantize(Decimal("0.01"))),
+        ]
+        debtor_agent = _element("BICFI", iban.bic) if iban.bic else "<Othr><Id>NOTPROVIDED</Id></Othr>"
+        yield (
+            f'<?xml version="1.0" encoding="UTF-8"?>\n<Document xmlns="{PAIN001_NAMESPACE}"><CstmrCdtTrfInitn>'
+            f"<GrpHdr>{_element('MsgId', message_id)}{_element('CreDtTm', created.isoformat(timespec='seconds'))}"
+            f"{''.join(control)}<InitgPty>{_element('Nm', clean_text(debtor_name, NAME_LENGTH))}</InitgPty></GrpHdr>"
+            f"<PmtInf>{_element('PmtInfId', message_id)}<PmtMtd>TRF</PmtMtd>{''.join(control)}"
+            "<PmtTpInf><SvcLvl><Cd>SEPA</Cd></SvcLvl></PmtTpInf>"
+            f"<ReqdExctnDt>{_element('Dt', execution_date.isoformat())}</ReqdExctnDt>"
+            f"<Dbtr>{_element('Nm', clean_text(debtor_name, NAME_LENGTH))}</Dbtr>"
+            f"<DbtrAcct><Id>{_element('IBAN', iban.compact)}</Id></DbtrAcct>"
+            f"<DbtrAgt><FinInstnId>{debtor_agent}</FinInstnId></DbtrAgt><ChrgBr>SLEV</ChrgBr>\n"
+        )
+        for invoice, beneficiary in self.payments(payable):
+            remittance_info = clean_text(self.remittance_info(invoice["invoice_number"]), REMITTANCE_INFO_LENGTH)
+            yield (
+                "<CdtTrfTxInf>"
+                f"<PmtId>{_element('EndToEndId', clean_text(invoice['invoice_number'], ID_LENGTH))}</PmtId>"
+                f"<Amt><InstdAmt Ccy={quoteattr(invoice['currency'])}>{invoice['open_balance']}</InstdAmt></Amt>"
+                f"<CdtrAgt><FinInstnId>{_element('BICFI', beneficiary.bic)}</FinInstnId></CdtrAgt>"
+                f"<Cdtr>{_element('Nm', beneficiary.name)}</Cdtr>"
+                f"<CdtrAcct><Id>{_element('IBAN', beneficiary.iban.compact)}</Id></CdtrAcct>"
+                f"<RmtInf>{_element('Ustrd', remittance_info)}</RmtInf>"
+                "</CdtTrfTxInf>\n"
+            )
+        yield "</PmtInf></CstmrCdtTrfInitn></Document>\n"
@@ -3,22 +3,65 @@
 from decimal import Decimal
 
 import reportlab.lib.pagesizes
+from django.conf import settings
+from django.utils.formats import number_format
 from django.utils.translation import gettext, pgettext
 from reportlab.graphics.barcode.qr import QrCode
 from reportlab.graphics.barcode.qrencoder import QR8bitByte
 from reportlab.lib import colors
+from reportlab.lib.utils import ImageReader
 from reportlab.pdfgen import canvas
 from reportlab.platypus import Paragraph, Table
 from schwifty import BIC, IBAN
 
-from invoice import epc_qr
+from invoice import e_invoice, epc_qr
 from invoice.models import Invoice
+from rechnung.metrics import PDF_RENDER_SECONDS
 
 (A4_WIDTH, A4_HEIGHT) = reportlab.lib.pagesizes.A4
+# lines of a statement per page, below the addresses and the title
+STATEMENT_LINES_PER_PAGE = 25
 
 
-def gen_invoice_pdf(invoice, filename_or_io):  # noqa: C901, PLR0915
-    """Generate the invoice pdf document."""
+def render_lines(pdf_object, x, y, lines):
+    """Render lines."""
+    text = "<br/>".join(lines)
+    p = Paragraph(text)
+    _, h = p.wrapOn(pdf_object, A4_WIDTH, A4_HEIGHT)
+    y_end = y - h
+    p.drawOn(pdf_object, x, y_end)
+    return y_end
+
+
+def render_address(pdf_object, x, y, address, *, prefix_lines=(), suffix_lines=()):  # noqa: PLR0913
+    """Render an address."""
+    # pylint: disable=too-many-arguments
+    all_lines = (
+        [line for line in prefix_lines if line]
+        + [
+            line
+            for line in [
+                address.line_1,
+                address.line_2,
+                address.line_3,
+                f"{address.postcode} {address.city}",
+                address.country.name,
+            ]
+            if line
+        ]
+        + [line for line in suffix_lines if line]
+    )
+    return render_lines(pdf_object, x, y, all_lines)
+
+
+@PDF_RENDER_SECONDS.time()
+def gen_invoice_pdf(invoice, filename_or_io, embed_e_invoice=None):  # noqa: C901, PLR0915
+    """
+    Generate the invoice pdf document.
+
+    The CII XML of the invoice is embedded as ZUGFeRD attachment if ``embed_e_invoice`` is true, by default for final
+    invoices if the setting ``E_INVOICE_EMBED`` is enabled.
+    """
     # pylint: disable=too-many-locals, too-many-statements
 
     pdf_object = canvas.Canvas(filename_or_io)
@@ -37,34 +80,6 @@ def gen_invoice_pdf(invoice, filename_or_io):  # noqa: C901, PLR0915
     iban_label = gettext("IBAN")
     bic_label = gettext("BIC")
 
-    def render_lines(x, y, lines):
-        """Render lines."""
-        text = "<br/>".join(lines)
-        p = Paragraph(text)
-        _, h = p.wrapOn(pdf_object, A4_WIDTH, A4_HEIGHT)
-        y_end = y - h
-        p.drawOn(pdf_object, x, y_end)
-        return y_end
-
-    def render_address(x, y, address, prefix_lines=(), suffix_lines=()):
-        """Render an address."""
-        all_lines = (
-            [line for line in prefix_lines if line]
-            + [
-                line
-                for line in [
-                    address.line_1,
-                    address.line_2,
-                    address.line_3,
-                    f"{address.postcode} {address.city}",
-                    address.country.name,
-                ]
-                if line
-            ]
-            + [line for line in suffix_lines if line]
-        )
-        return render_lines(x, y, all_lines)
-
     def render_lines_left_right(x, y, lines, line_offset=0, line_height=16):
         """
         Render two-part lines left- and right-aligned.
@@ -87,7 +102,11 @@ def gen_invoice_pdf(invoice, filename_or_io):  # noqa: C901, PLR0915
 
     # Vendor address
     render_address(
-        x_left, y_top, invoice.vendor.address, prefix_lines=[invoice.vendor.name, invoice.vendor.company_name]
+        pdf_object,
+        x_left,
+        y_top,
+        invoice.vendor.address,
+        prefix_lines=[invoice.vendor.name, invoice.vendor.company_name],
     )
 
     # Center Logo
@@ -95,7 +114,9 @@ def gen_invoice_pdf(invoice, filename_or_io):  # noqa: C901, PLR0915
         pdf_object.drawImage(logo.path, 100, y_top - 100, width=100, height=100)
 
     # Customer address
-    render_address(A4_WIDTH - 200, y_top, invoice.customer.address, prefix_lines=[invoice.customer.full_name])
+    render_address(
+        pdf_object, A4_WIDTH - 200, y_top, invoice.customer.address, prefix_lines=[invoice.customer.full_name]
+    )
 
     # Title, number, date
     title = Paragraph(f"""
@@ -150,13 +171,17 @@ def gen_invoice_pdf(invoice, filename_or_io):  # noqa: C901, PLR0915
     if lines:
         render_lines_left_right(x_left, bottom_y, lines)
 
-    if invoice.vendor.bank_account and invoice.currency == Invoice.Currency.EUR and invoice.total >= Decimal("0.01"):
+    if (
+        invoice.vendor.bank_account
+        and invoice.currency == Invoice.Currency.EUR
+        and invoice.total_rounded >= Decimal("0.01")
+    ):
         encoding = "utf-8"
         data = epc_qr.gen_epc_qr_data(
             str(invoice.vendor),
             invoice.vendor.bank_account.iban,
             beneficiary_bic=invoice.vendor.bank_account.bic,
-            eur_amount=invoice.total,
+            eur_amount=invoice.total_rounded,
             remittance_info=f"{invoice_label}: {invoice.invoice_number}",
             encoding=encoding,
         )
@@ -168,5 +193,162 @@ def gen_invoice_pdf(invoice, filename_or_io):  # noqa: C901, PLR0915
         if epc_qr_code.qr.version > 13:  # noqa: PLR2004
             raise ValueError("the epc qr code payload is limited to 331 bytes/version 13")
 
+    if embed_e_invoice is None:
+        embed_e_invoice = settings.E_INVOICE_EMBED and invoice.final
+    if embed_e_invoice:
+        e_invoice.embed_cii_xml(pdf_object, e_invoice.cii_xml(invoice, invoice.items))
+
+    pdf_object.showPage()
+    pdf_object.save()
+
+
+def gen_statements_pdf(statements, filename_or_io):
+    """
+    Generate one pdf document with the statements, each of them starting on a new page.
+
+    The statements share the canvas, the labels and the logos. A batch is rendered in one pass and embeds every logo
+    once, no matter how many customers of the vendor it has.
+    """
+    # pylint: disable=too-many-locals
+
+    pdf_object = canvas.Canvas(filename_or_io)
+    pdf_object.setFontSize(12)
+
+    statement_label = gettext("Statement")
+    date_label = gettext("Date")
+    balance_label = gettext("Balance")
+    header = [
+        pgettext("invoice number", "Number"),
+        date_label,
+        gettext("Due Date"),
+        gettext("Currency"),
+        gettext("Total"),
+        gettext("Open"),
+        balance_label,
+    ]
+    logos = {}
+
+    def amount(value):
+        """Format an amount of a statement line."""
+        return number_format(value, decimal_pos=2, use_l10n=True)
+
+    y_top = A4_HEIGHT - 50
+    x_left = 80
+    for statement in statements:
+        customer = statement.customer
+        vendor = customer.vendor
+        rows = [
+            [
+                line["invoice_number"],
+                str(line["date"]),
+                str(line["due_date"] or ""),
+                line["currency"],
+                amount(line["total"]),
+                amount(line["open"]),
+                amount(line["balance"]),
+            ]
+            for line in statement.lines
+        ]
+        pages = [
+            rows[start : start + STATEMENT_LINES_PER_PAGE] for start in range(0, len(rows), STATEMENT_LINES_PER_PAGE)
+        ]
+        for number, page in enumerate(pages or [[]], start=1):
+            render_address(pdf_object, x_left, y_top, vendor.address, prefix_lines=[vendor.name, vendor.company_name])
+            if logo := vendor.logo:
+                if logo.path not in logos:
+                    logos[logo.path] = ImageReader(logo.path)
+                pdf_object.drawImage(logos[logo.path], 100, y_top - 100, width=100, height=100)
+            render_address(pdf_object, A4_WIDTH - 200, y_top, customer.address, prefix_lines=[customer.full_name])
+
+            title = Paragraph(f"""
+                <font size="16"><b>{statement_label}</b></font><br/>
+                <font size="12">{date_label}: {statement.date}</font>
+""")
+            _, h = title.wrapOn(pdf_object, A4_WIDTH, A4_HEIGHT)
+            table_y_end = A4_HEIGHT - 150 - h
+            title.drawOn(pdf_object, x_left, table_y_end)
+
+            table = Table(
+                data=[[Paragraph(f"<b>{col}</b>") for col in header], *page],
+                style=[
+                    ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+                    ("LEADING", (0, 0), (-1, 0), 10),
+                    ("ALIGNMENT", (4, 1), (6, -1), "RIGHT"),
+                ],
+            )
+            _, table_height = table.wrapOn(pdf_object, A4_WIDTH - 2 * x_left, A4_HEIGHT)
+            table_y_end -= 20 + table_height
+            table.drawOn(pdf_object, x_left, table_y_end)
+
+            if number == max(len(pages), 1) and statement.balances:
+                balances_table = Table(
+                    data=[
+                        [f"{balance_label}: ", f"{amount(balance)} {currency}"]
+                        for currency, balance in statement.balances.items()
+                    ]
+                )
+                _, table_height = balances_table.wrapOn(pdf_object, A4_WIDTH - 2 * x_left, A4_HEIGHT)
+                balances_table.drawOn(pdf_object, x_left, table_y_end - 20 - table_height)
+            pdf_object.showPage()
+
+    pdf_object.save()
+
+
+def gen_reminder_pdf(reminder, filename_or_io):
+    """Generate the reminder pdf document of an overdue invoice, its text depends on the dunning level."""
+    invoice = reminder.invoice
+    vendor = invoice.vendor
+    pdf_object = canvas.Canvas(filename_or_io)
+    pdf_object.setFontSize(12)
+
+    y_top = A4_HEIGHT - 50
+    x_left = 80
+    render_address(pdf_object, x_left, y_top, vendor.address, prefix_lines=[vendor.name, vendor.company_name])
+    if logo := vendor.logo:
+        pdf_object.drawImage(logo.path, 100, y_top - 100, width=100, height=100)
+    render_address(
+        pdf_object, A4_WIDTH - 200, y_top, invoice.customer.address, prefix_lines=[invoice.customer.full_name]
+    )
+
+    open_amount = f"{number_format(invoice.open_balance, decimal_pos=2, use_l10n=True)} {invoice.currency}"
+    title = Paragraph(f"""
+        <font size="16"><b>{reminder.title}</b></font><br/>
+        <font size="12">{gettext("Date")}: {reminder.date}</font>
+""")
+    _, h = title.wrapOn(pdf_object, A4_WIDTH, A4_HEIGHT)
+    y_end = A4_HEIGHT - 150 - h
+    title.drawOn(pdf_object, x_left, y_end)
+
+    text = Paragraph(reminder.text(open_amount))
+    _, h = text.wrapOn(pdf_object, A4_WIDTH - 2 * x_left, A4_HEIGHT)
+    y_end -= 20 + h
+    text.drawOn(pdf_object, x_left, y_end)
+
+    table = Table(
+        data=[
+            [
+                Paragraph(f"<b>{label}</b>")
+                for label in (
+                    pgettext("invoice number", "Number"),
+                    gettext("Date"),
+                    gettext("Due Date"),
+                    gettext("Open"),
+                )
+            ],
+            [invoice.invoice_number, str(invoice.date), str(invoice.due_date), open_amount],
+        ],
+        style=[("GRID", (0, 0), (-1, -1), 0.5, colors.grey), ("ALIGNMENT", (3, 1), (3, -1), "RIGHT")],
+    )
+    _, h = table.wrapOn(pdf_object, A4_WIDTH - 2 * x_left, A4_HEIGHT)
+    table.drawOn(pdf_object, x_left, y_end - 20 - h)
+
+    if bank_account := vendor.bank_account:
+        render_lines(
+            pdf_object,
+            x_left,
+            100,
+            [f"{gettext('IBAN')}: {IBAN(bank_account.iban).formatted}", f"{gettext('BIC')}: {BIC(bank_account.bic)}"],
+        )
+
     pdf_object.showPage()
     pdf_object.save()
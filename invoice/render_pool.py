@@ -0,0 +1,168 @@
+"""
+Render invoice PDFs in a pool of separate processes, isolated from the web workers.
+
+Every web worker process keeps ``PDF_RENDER_WORKERS`` render processes, started ahead of the first render and fed
+through the queue of a :class:`~concurrent.futures.ProcessPoolExecutor`. A render may take ``PDF_RENDER_TIMEOUT``
+seconds and ``PDF_RENDER_MEMORY_LIMIT`` MiB, so a pathological invoice cannot stall or exhaust the web worker. At most
+``PDF_RENDER_QUEUE_SIZE`` further renders wait for a free process. Beyond that
+:class:`~invoice.errors.RenderOverloadError` is raised at once instead of letting requests pile up.
+"""
+
+import asyncio
+import math
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from functools import cache, partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import translation
+
+from invoice import render_worker
+from invoice.errors import RenderOverloadError, RenderTimeoutError
+from invoice.models import Invoice
+from rechnung.metrics import PDF_RENDER_ERRORS
+from rechnung.profiling import is_profiling
+
+# Seconds the web worker waits beyond the timeout of the render process before it kills the pool. This only happens if
+# the timeout inside the render process could not fire, e.g. while it is stuck in C code.
+KILL_GRACE = 5.0
+
+
+def start_executor(processes: int, memory_limit: int) -> ProcessPoolExecutor:
+    """Start an executor with render processes, each of them limited to ``memory_limit`` MiB."""
+    # forking the threaded web worker is unsafe, the render processes start from a clean interpreter
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    return ProcessPoolExecutor(
+        processes, mp_context=context, initializer=render_worker.initialize, initargs=(memory_limit,)
+    )
+
+
+class RenderPool:
+    """Process pool with a bounded number of renders in flight."""
+
+    def __init__(self, processes: int, queue_size: int, timeout: float, memory_limit: int):
+        """Create the pool. The processes are started with the first render."""
+        self.processes = processes
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self._slots = threading.BoundedSemaphore(processes + queue_size)
+        # a render waits for at most all renders in front of it, each of them limited by the timeout
+        self._deadline = timeout * math.ceil((processes + queue_size) / processes) + KILL_GRACE if timeout else None
+        self._lock = threading.Lock()
+        self._executor: ProcessPoolExecutor | None = None
+
+    def get_executor(self) -> ProcessPoolExecutor:
+        """Get the executor and start its processes if there is none yet."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = start_executor(self.processes, self.memory_limit)
+                for _ in range(self.processes):
+                    self._executor.submit(render_worker.warm_up)
+            return self._executor
+
+    def _discard(self, executor: ProcessPoolExecutor):
+        """Kill the processes of a broken or hung executor. The next render starts a new one."""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.kill_workers()
+
+    async def render(self, document, language: str | None, function=render_worker.render) -> bytes:
+        """
+        Render the PDF of the document in one of the processes and return its content.
+
+        The function of :mod:`invoice.render_worker` renders the document, by default an invoice.
+        """
+        if not self._slots.acquire(blocking=False):  # pylint: disable=consider-using-with
+            PDF_RENDER_ERRORS.inc(reason="overload")
+            raise RenderOverloadError
+        try:
+            executor = self.get_executor()
+            future = executor.submit(function, document, language, self.timeout)
+            try:
+                return await asyncio.wait_for(asyncio.wrap_future(future), self._deadline)
+            except TimeoutError:
+                self._discard(executor)
+                PDF_RENDER_ERRORS.inc(reason="timeout")
+                raise RenderTimeoutError from None
+            except RenderTimeoutError:
+                PDF_RENDER_ERRORS.inc(reason="timeout")
+                raise
+            except MemoryError:
+                PDF_RENDER_ERRORS.inc(reason="memory")
+                raise
+            except BrokenProcessPool:
+                self._discard(executor)
+                PDF_RENDER_ERRORS.inc(reason="crash")
+                raise
+        finally:
+            self._slots.release()
+
+
+@cache
+def get_pool() -> RenderPool:
+    """Get the render pool of this process."""
+    return RenderPool(
+        settings.PDF_RENDER_WORKERS,
+        settings.PDF_RENDER_QUEUE_SIZE,
+        settings.PDF_RENDER_TIMEOUT,
+        settings.PDF_RENDER_MEMORY_LIMIT,
+    )
+
+
+def invoice_pdf_queryset():
+    """Get the invoices with everything the PDF shows, so that the render does not need the database."""
+    return Invoice.objects.select_related(
+        "vendor__address", "vendor__bank_account", "customer__address"
+    ).prefetch_related("invoiceitem_set")
+
+
+async def render_invoice_pdf(invoice) -> bytes:
+    """
+    Render the PDF of the invoice in the render pool and return its content.
+
+    The render must not touch the database, so the invoice has to come with its vendor, customer, addresses, bank
+    account and items already loaded, e.g. with :func:`invoice_pdf_queryset`.
+    """
+    return await _render_pdf(render_worker.render, invoice)
+
+
+async def render_statements_pdf(statements) -> bytes:
+    """
+    Render the statements into one PDF in the render pool and return its content.
+
+    Like :func:`render_invoice_pdf` the render must not touch the database, the customers have to come with their
+    vendor, addresses and bank account, e.g. from :func:`~invoice.statements.statement_customers`.
+    """
+    return await _render_pdf(render_worker.render_statements, statements)
+
+
+@contextmanager
+def batch_renderer(function, processes: int):
+    """
+    Provide a function that renders documents with the function of :mod:`invoice.render_worker`, yielding their PDFs.
+
+    The documents are rendered by a pool of ``processes`` processes of their own, e.g. for a command, so that the
+    renders do not queue behind the renders of requests. The pool lives as long as the context, so that a command
+    starts it once for all its batches. With 0 processes the documents are rendered in this process.
+    """
+    render = partial(function, language=translation.get_language(), timeout=settings.PDF_RENDER_TIMEOUT)
+    if not processes:
+        yield partial(map, render)
+        return
+    with start_executor(processes, settings.PDF_RENDER_MEMORY_LIMIT) as executor:
+        yield partial(executor.map, render, chunksize=8)
+
+
+async def _render_pdf(function, document) -> bytes:
+    """Render the document with the function of :mod:`invoice.render_worker` in the language of the request."""
+    language = translation.get_language()
+    if is_profiling():
+        # the profile shall show the render, so it runs in this process
+        return await sync_to_async(partial(function, document, language, timeout=0))()
+    return await get_pool().render(document, language, function)
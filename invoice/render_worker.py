@@ -0,0 +1,78 @@
+"""
+Entry points of the PDF render processes started by :mod:`invoice.render_pool`.
+
+This module is imported by the render processes before Django is set up, so it must not import models at module level.
+"""
+
+import io
+import os
+import signal
+
+import django
+from django.conf import settings
+from django.utils import translation
+
+from invoice.errors import RenderTimeoutError
+from rechnung.metrics import REGISTRY
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def initialize(memory_limit: int):
+    """Set up Django in a new render process and cap its address space to ``memory_limit`` MiB, 0 for no limit."""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "rechnung.settings")
+    django.setup()
+    if memory_limit and resource is not None:
+        limit = memory_limit * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def warm_up() -> int:
+    """Do nothing, used to start the processes of the pool ahead of the first render."""
+    return os.getpid()
+
+
+def _raise_timeout(signum, frame):  # noqa: ARG001
+    raise RenderTimeoutError
+
+
+def render(invoice, language: str | None, timeout: float) -> bytes:
+    """Render the PDF of the invoice and return its content. Give up after ``timeout`` seconds."""
+    from invoice import pdf_generator  # noqa: PLC0415 # pylint: disable=import-outside-toplevel
+
+    return _render(pdf_generator.gen_invoice_pdf, invoice, language, timeout)
+
+
+def render_statements(statements, language: str | None, timeout: float) -> bytes:
+    """Render the statements into one PDF and return its content. Give up after ``timeout`` seconds."""
+    from invoice import pdf_generator  # noqa: PLC0415 # pylint: disable=import-outside-toplevel
+
+    return _render(pdf_generator.gen_statements_pdf, statements, language, timeout)
+
+
+def render_reminder(reminder, language: str | None, timeout: float) -> bytes:
+    """Render the PDF of the reminder of an invoice and return its content. Give up after ``timeout`` seconds."""
+    from invoice import pdf_generator  # noqa: PLC0415 # pylint: disable=import-outside-toplevel
+
+    return _render(pdf_generator.gen_reminder_pdf, reminder, language, timeout)
+
+
+def _render(generate, document, language: str | None, timeout: float) -> bytes:
+    """Render the document with the generate function of :mod:`invoice.pdf_generator` and return its content."""
+    buffer = io.BytesIO()
+    alarm = timeout > 0 and hasattr(signal, "setitimer")
+    if alarm:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        with translation.override(language):
+            generate(document, buffer)
+    finally:
+        if alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        if settings.METRICS_DIR:
+            REGISTRY.flush(settings.METRICS_DIR)
+    return buffer.getvalue()
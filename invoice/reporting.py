@@ -0,0 +1,147 @@
+"""
+Reports of the final invoices, each computed by one aggregate query.
+
+* VAT report: net total and tax per vendor, period, currency and tax rate. It reads only the monthly
+  :class:`~invoice.models.VatRollup` rows. A quarter sums up three of them, so a report costs one small query no
+  matter how many invoices and items the vendors have.
+* Aging report: the open balances per customer and currency, split into buckets by the days past the due date.
+"""
+
+import csv
+import datetime as dt
+from decimal import Decimal
+
+from django.db.models import CharField, DecimalField, F, Q, QuerySet, Sum, TextChoices, Value
+from django.db.models.functions import Coalesce, NullIf, TruncMonth, TruncQuarter
+from django.utils.translation import gettext_lazy as _
+
+from invoice.models import ROLLUP_DECIMAL_PLACES, ROLLUP_MAX_DIGITS
+
+VENDOR_NAME = Coalesce(NullIf(F("vendor__company_name"), Value("")), F("vendor__name"), output_field=CharField())
+AMOUNT_FIELD = DecimalField(max_digits=ROLLUP_MAX_DIGITS, decimal_places=ROLLUP_DECIMAL_PLACES)
+# first day past the due date of each aging bucket, the last one is open-ended
+AGING_BUCKETS = {"days_0_30": 0, "days_31_60": 31, "days_61_90": 61, "days_over_90": 91}
+AGING_COLUMNS = ("not_due", *AGING_BUCKETS, "total")
+
+
+class Granularity(TextChoices):
+    """Length of the periods of a report."""
+
+    MONTH = "month", _("Month")
+    QUARTER = "quarter", _("Quarter")
+
+
+TRUNCATE = {Granularity.MONTH: TruncMonth, Granularity.QUARTER: TruncQuarter}
+
+
+def vat_report(rollups: QuerySet, granularity: str) -> QuerySet:
+    """Sum up the rollup rows per vendor, period of the granularity, currency and tax rate."""
+    return (
+        rollups.values(
+            "vendor_id",
+            vendor_name=VENDOR_NAME,
+            report_period=TRUNCATE[granularity]("period"),
+            report_currency=F("currency"),
+            report_tax_rate=F("tax_rate"),
+        )
+        .annotate(net_total=Sum("net_total"), tax_amount=Sum("tax_amount"), invoice_count=Sum("invoice_count"))
+        .order_by("vendor_name", "vendor_id", "report_period", "report_currency", "report_tax_rate")
+    )
+
+
+def period_label(period, granularity: str) -> str:
+    """Get the label of the period that starts at the date, e.g. 2024-06 or 2024-Q2."""
+    if granularity == Granularity.QUARTER:
+        return f"{period.year}-Q{(period.month - 1) // 3 + 1}"
+    return f"{period.year}-{period.month:02d}"
+
+
+def tax_rate_label(tax_rate) -> str:
+    """Get the tax rate in percent like InvoiceItem.tax_string."""
+    return f"{tax_rate * 100:.2f}".rstrip("0").rstrip(".") + "%"
+
+
+def report_rows(report: QuerySet, granularity: str) -> list[dict]:
+    """Get the rows of the report with the labels and the amounts rounded to two decimals."""
+    return [
+        {
+            "vendor": row["vendor_name"],
+            "period": period_label(row["report_period"], granularity),
+            "currency": row["report_currency"],
+            "tax_rate": tax_rate_label(row["report_tax_rate"]),
+            "net_total": row["net_total"].quantize(Decimal("0.01")),
+            "tax_amount": row["tax_amount"].quantize(Decimal("0.01")),
+            "invoice_count": row["invoice_count"],
+        }
+        for row in report
+    ]
+
+
+def write_vat_report_csv(rows: list[dict], file):
+    """Write the report rows as CSV with a header row. The amounts are plain, unlocalized numbers."""
+    writer = csv.writer(file)
+    writer.writerow([_("Vendor"), _("Period"), _("Currency"), _("Tax rate"), _("Net Total"), _("Tax"), _("Invoices")])
+    for row in rows:
+        writer.writerow(
+            [
+                row["vendor"],
+                row["period"],
+                row["currency"],
+                row["tax_rate"],
+                row["net_total"],
+                row["tax_amount"],
+                row["invoice_count"],
+            ]
+        )
+
+
+def _aging_conditions(today: dt.date) -> dict[str, Q]:
+    """Get the condition on the due date of each bucket, as ranges of dates, so that no date arithmetic runs in SQL."""
+    conditions = {"not_due": Q(due__gt=today)}
+    starts = list(AGING_BUCKETS.values())
+    for (name, first), after in zip(AGING_BUCKETS.items(), [*starts[1:], None], strict=True):
+        condition = Q(due__lte=today - dt.timedelta(days=first))
+        if after is not None:
+            condition &= Q(due__gt=today - dt.timedelta(days=after))
+        conditions[name] = condition
+    return conditions
+
+
+def aging_report(invoices: QuerySet, today: dt.date) -> QuerySet:
+    """
+    Sum up the open balances of the final invoices per customer and currency into the aging buckets.
+
+    Invoices without a due date are due at their date. The buckets are conditional sums over the open invoices, which
+    the partial index ``invoice_open`` covers, so the database computes the whole report in one query.
+    """
+    sums = {
+        name: Coalesce(Sum("open_balance", filter=condition), Value(Decimal(0)), output_field=AMOUNT_FIELD)
+        for name, condition in _aging_conditions(today).items()
+    }
+    return (
+        invoices.filter(final=True, open_balance__gt=0)
+        .alias(due=Coalesce("due_date", "date"))
+        .values("customer_id", "customer__first_name", "customer__last_name", "currency")
+        .annotate(**sums, total=Sum("open_balance", output_field=AMOUNT_FIELD))
+        .order_by("customer__last_name", "customer__first_name", "customer_id", "currency")
+    )
+
+
+def aging_rows(report: QuerySet) -> list[dict]:
+    """Get the rows of the aging report with the customer name and the amounts rounded to two decimals."""
+    return [
+        {
+            "customer": f"{row['customer__first_name']} {row['customer__last_name']}",
+            "currency": row["currency"],
+            **{column: row[column].quantize(Decimal("0.01")) for column in AGING_COLUMNS},
+        }
+        for row in report
+    ]
+
+
+def write_aging_report_csv(rows: list[dict], file):
+    """Write the aging rows as CSV with a header row. The amounts are plain, unlocalized numbers."""
+    writer = csv.writer(file)
+    writer.writerow([_("Customer"), _("Currency"), _("Not due"), "0-30", "31-60", "61-90", _("Over 90"), _("Total")])
+    for row in rows:
+        writer.writerow([row["customer"], row["currency"], *(row[column] for column in AGING_COLUMNS)])
@@ -0,0 +1,74 @@
+"""
+Search the invoices of a user by invoice number, customer name and email, and item names and descriptions.
+
+The text of every invoice is kept in a :class:`~invoice.models.SearchDocument`, refreshed whenever the invoice, its
+customer or one of its items is saved. Its index depends on the database:
+
+* PostgreSQL: a GIN trigram index of ``pg_trgm`` on the document. It answers substring matches and matches words
+  similar to the term, so that a typo still finds the invoice.
+* SQLite: an FTS5 table with the trigram tokenizer, kept in sync with the documents by triggers. It answers substring
+  matches.
+
+Every term of the query must match. Terms shorter than three characters have no trigrams, they are matched on the
+documents the other terms narrowed down.
+"""
+
+from django.db import connections
+from django.db.models import Lookup, Q, QuerySet
+from django.db.models.expressions import RawSQL
+
+from invoice.models import SearchDocument
+
+MIN_TERM_LENGTH = 3
+# the FTS5 table of the documents on SQLite, created by the migration of the search documents
+FTS_MATCH = "SELECT rowid FROM invoice_searchdocument_fts WHERE invoice_searchdocument_fts MATCH %s"
+
+
+@SearchDocument._meta.get_field("document").register_lookup  # noqa: SLF001
+class WordSimilar(Lookup):  # pylint: disable=abstract-method
+    """Match if the term is similar to a word of the document. PostgreSQL only, supported by the trigram index."""
+
+    lookup_name = "word_similar"
+
+    def as_sql(self, compiler, connection):
+        """Compile to the word similarity operator of pg_trgm."""
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} %%> {rhs}", (*lhs_params, *rhs_params)
+
+
+def search_terms(query: str) -> list[str]:
+    """Split the query into normalized terms like the documents, without duplicates."""
+    return list(dict.fromkeys(query.casefold().split()))
+
+
+def _fts_query(terms: list[str]) -> str:
+    """Quote every term as an FTS5 string, so that its characters are never read as query syntax."""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def search_documents(user, query: str) -> QuerySet:
+    """Get the search documents of the user that match every term of the query."""
+    documents = SearchDocument.objects.filter(user=user)
+    terms = search_terms(query)
+    indexed = [term for term in terms if len(term) >= MIN_TERM_LENGTH]
+    vendor = connections[documents.db].vendor
+    if vendor == "sqlite" and indexed:
+        # the query is a bound parameter
+        documents = documents.filter(invoice_id__in=RawSQL(FTS_MATCH, (_fts_query(indexed),)))  # noqa: S611
+    elif vendor == "postgresql":
+        for term in indexed:
+            documents = documents.filter(Q(document__contains=term) | Q(document__word_similar=term))
+    else:
+        # without a trigram index the documents are scanned
+        for term in indexed:
+            documents = documents.filter(document__contains=term)
+    for term in terms:
+        if len(term) < MIN_TERM_LENGTH:
+            documents = documents.filter(document__contains=term)
+    return documents
+
+
+def search_invoices(invoices: QuerySet, user, query: str) -> QuerySet:
+    """Narrow the invoices down to those of the user that match the query."""
+    return invoices.filter(pk__in=search_documents(user, query).values("invoice_id"))
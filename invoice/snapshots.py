@@ -0,0 +1,193 @@
+"""
+Snapshots of the final invoices: what an invoice showed when it was finalized, together with its PDF and CII XML.
+
+The save that finalizes an invoice takes its snapshot by the signal :data:`~invoice.models.invoice_finalized`. Its
+transaction only stores the data and the XML. The PDF is rendered by the render pool once the transaction is committed,
+so that a render never holds the write lock of the database. The request that finalizes the invoice still waits for that
+render before it responds. The render runs as robust commit callback, so if it fails, e.g. because the pool is
+overloaded, the error is only logged and the snapshot stays without a PDF. That is acceptable, as the first download
+then renders the PDF from the current data and stores it. From then on the PDF and XML downloads, the e-invoice export,
+the invoice list and the outbox read the snapshot instead of deriving the totals from the items and the texts from the
+vendor, the customer and their addresses. The snapshot is looked up by the invoice ID and the owner stored beside it, so
+a download is one query without a join, and a later change of e.g. the vendor address does not change the invoices it
+already issued.
+
+Final invoices that were inserted in bulk, or finalized before the snapshots existed, have none. They are still
+rendered from their current data until :func:`take_missing_snapshots` or the command ``snapshot_invoices`` takes
+their snapshots.
+"""
+
+import io
+from functools import partial
+from itertools import batched
+from typing import TYPE_CHECKING
+
+from asgiref.sync import async_to_sync
+from django.db import transaction
+from django.dispatch import receiver
+
+from invoice.e_invoice import cii_xml
+from invoice.models import Address, Invoice, InvoiceSnapshot, invoice_finalized
+from invoice.pdf_generator import gen_invoice_pdf
+from invoice.render_pool import invoice_pdf_queryset, render_invoice_pdf
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+    from django.db.models import QuerySet
+
+# version of the layout of the snapshot data, raised whenever its keys change
+DATA_VERSION = 1
+
+
+def _address(address: Address) -> dict:
+    """Get the fields of the address."""
+    return {
+        "line_1": address.line_1,
+        "line_2": address.line_2,
+        "line_3": address.line_3,
+        "postcode": address.postcode,
+        "city": address.city,
+        "state": address.state,
+        "country": str(address.country),
+    }
+
+
+def snapshot_data(invoice: Invoice) -> dict:
+    """
+    Get the fields of the invoice, its parties and its items and the totals as the PDF shows them.
+
+    The amounts are rounded to two decimals, the data is serialized as JSON with the :class:`DjangoJSONEncoder`.
+    """
+    vendor = invoice.vendor
+    customer = invoice.customer
+    bank_account = vendor.bank_account
+    return {
+        "version": DATA_VERSION,
+        "invoice_number": invoice.invoice_number,
+        "date": invoice.date,
+        "due_date": invoice.due_date,
+        "delivery_date": invoice.delivery_date,
+        "currency": invoice.currency,
+        "vendor": {
+            "id": vendor.pk,
+            "name": vendor.name,
+            "company_name": vendor.company_name,
+            "tax_id": vendor.tax_id,
+            "address": _address(vendor.address),
+            "bank_account": bank_account
+            and {"owner": bank_account.owner, "iban": bank_account.iban, "bic": bank_account.bic},
+        },
+        "customer": {
+            "id": customer.pk,
+            "first_name": customer.first_name,
+            "last_name": customer.last_name,
+            "email": customer.email,
+            "address": _address(customer.address),
+        },
+        "items": [
+            {
+                "name": item.name,
+                "description": item.description,
+                "quantity": item.quantity,
+                "unit": item.unit,
+                "price": item.price,
+                "tax": item.tax,
+                "net_total": item.net_total_rounded,
+                "tax_amount": item.tax_amount_rounded,
+                "total": item.total_rounded,
+            }
+            for item in invoice.items
+        ],
+        "tax_amounts": invoice.tax_amount_per_rate_rounded,
+        "net_total": invoice.net_total_rounded,
+        "tax_amount": invoice.tax_amount_rounded,
+        "total": invoice.total_rounded,
+    }
+
+
+def render_pdf(invoice: Invoice) -> bytes:
+    """Render the PDF of the invoice in this process and return its content."""
+    buffer = io.BytesIO()
+    gen_invoice_pdf(invoice, buffer)
+    return buffer.getvalue()
+
+
+def render_in_pool(invoices: list[Invoice]) -> Iterator[bytes]:
+    """Render the PDFs of the invoices one by one in the render pool of this process, see :mod:`invoice.render_pool`."""
+    for invoice in invoices:
+        yield async_to_sync(render_invoice_pdf)(invoice)
+
+
+def take_snapshots(invoices: QuerySet) -> list[Invoice]:
+    """
+    Take the snapshots of the final invoices that have none yet, without their PDFs, by one bulk insert.
+
+    The invoices with everything the snapshot shows are read by two queries. Return them, so that their PDFs can be
+    rendered from the same state by :func:`store_pdfs` after the transaction.
+    """
+    pending = list(
+        invoice_pdf_queryset().filter(pk__in=invoices.filter(final=True, snapshot__isnull=True).values("pk"))
+    )
+    snapshots = [
+        InvoiceSnapshot(
+            invoice=invoice,
+            user_id=invoice.vendor.user_id,
+            currency=invoice.currency,
+            net_total=invoice.net_total_rounded,
+            tax_amount=invoice.tax_amount_rounded,
+            total=invoice.total_rounded,
+            data=snapshot_data(invoice),
+            xml=cii_xml(invoice, invoice.items),
+        )
+        for invoice in pending
+    ]
+    # a snapshot is never replaced, also not by a concurrent finalization
+    InvoiceSnapshot.objects.bulk_create(snapshots, ignore_conflicts=True)
+    return pending
+
+
+def store_pdfs(invoices: list[Invoice], render=None):
+    """
+    Render the PDFs of the snapshotted invoices and store them in their snapshots, each by a short update of its own.
+
+    The render function renders the invoices, see :func:`~invoice.render_pool.batch_renderer`, by default they are
+    rendered one by one in this process. It must not run in a transaction, which would hold the write lock meanwhile.
+    A PDF that was stored meanwhile, e.g. by a download, is kept.
+    """
+    pdfs = render(invoices) if render is not None else map(render_pdf, invoices)
+    for invoice, pdf in zip(invoices, pdfs, strict=True):
+        InvoiceSnapshot.objects.filter(pk=invoice.pk, pdf__isnull=True).update(pdf=pdf)
+
+
+async def astore_pdf(invoice_id: int, render) -> bytes:
+    """Await the render of the PDF of a snapshot without one, store it and return its content."""
+    content = await render
+    await InvoiceSnapshot.objects.filter(pk=invoice_id, pdf__isnull=True).aupdate(pdf=content)
+    return content
+
+
+def take_missing_snapshots(invoices: QuerySet, render=None, chunk_size: int = 100) -> int:
+    """
+    Take the snapshots of the final invoices that have none, chunk by chunk, each in its own transaction.
+
+    The PDFs of a chunk are rendered by the render function and stored after its transaction, like by
+    :func:`store_pdfs`. Return the number of snapshots. An interrupted run is continued by the next one, the snapshots
+    whose PDF is missing are rendered by their first download.
+    """
+    missing = invoices.filter(final=True, snapshot__isnull=True).order_by("pk").values_list("pk", flat=True)
+    total = 0
+    for chunk in batched(missing, chunk_size, strict=False):
+        with transaction.atomic():
+            taken = take_snapshots(Invoice.objects.filter(pk__in=chunk))
+        store_pdfs(taken, render)
+        total += len(taken)
+    return total
+
+
+@receiver(invoice_finalized, sender=Invoice)
+def snapshot_finalized_invoice(sender, instance, **kwargs):  # pylint: disable=unused-argument # noqa: ARG001
+    """Take the snapshot of the invoice that was just finalized and render its PDF in the pool after the commit."""
+    taken = take_snapshots(Invoice.objects.filter(pk=instance.pk))
+    # a failed render is logged, the first download renders the PDF then
+    transaction.on_commit(partial(store_pdfs, taken, render_in_pool), robust=True)
@@ -0,0 +1,86 @@
+"""
+Statements of the customers: their open and recent final invoices with a running balance.
+
+A statement lists the final invoices with an open balance and the final invoices of the last ``RECENT_DAYS`` days up
+to its date, in the order of their dates. The balance runs per currency and grows with the open balance of every
+invoice. The invoices of a batch of customers are read by one query joined to the values of their items, the totals are
+rounded from them like on the invoices. The invoices and their items are never loaded as models.
+"""
+
+import datetime as dt
+from dataclasses import dataclass, field
+from decimal import Decimal
+from itertools import groupby
+from operator import itemgetter
+
+from django.db.models import Q, QuerySet
+
+from invoice.models import INVOICE_ITEM_VALUES, Customer, Invoice, rounded_total
+
+RECENT_DAYS = 90
+
+
+@dataclass
+class Statement:
+    """Statement of a customer at a date."""
+
+    customer: Customer
+    date: dt.date
+    lines: list[dict] = field(default_factory=list)
+    balances: dict[str, Decimal] = field(default_factory=dict)
+
+
+def statement_customers() -> QuerySet:
+    """Get the customers with everything the statement shows, so that the PDF render does not need the database."""
+    return Customer.objects.select_related("address", "vendor__address", "vendor__bank_account")
+
+
+def statement_rows(customers: QuerySet, date: dt.date) -> QuerySet:
+    """
+    Get the statement invoices of the customers joined to the values of their items, one row per item.
+
+    The totals are rounded from the rows of an invoice by :func:`~invoice.models.rounded_total`, so that the statement
+    shows the totals of the invoices.
+    """
+    return (
+        Invoice.objects.filter(customer__in=customers, final=True, date__lte=date)
+        .filter(~Q(open_balance=0) | Q(date__gt=date - dt.timedelta(days=RECENT_DAYS)))
+        .values(
+            "pk",
+            "customer_id",
+            "invoice_number",
+            "date",
+            "due_date",
+            "currency",
+            "paid",
+            "open_balance",
+            *INVOICE_ITEM_VALUES,
+        )
+        .order_by("customer_id", "currency", "date", "pk")
+    )
+
+
+def build_statements(customers: QuerySet, date: dt.date) -> list[Statement]:
+    """Get the statements of the customers at the date, in the order of the customers. This takes two queries."""
+    statements = {customer.pk: Statement(customer, date) for customer in customers}
+    for _pk, group in groupby(statement_rows(customers, date), key=itemgetter("pk")):
+        invoice_rows = list(group)
+        row = invoice_rows[0]
+        statement = statements[row["customer_id"]]
+        total = rounded_total(invoice_rows)
+        open_amount = row["open_balance"]
+        balance = statement.balances.get(row["currency"], Decimal("0.00")) + open_amount
+        statement.balances[row["currency"]] = balance
+        statement.lines.append(
+            {
+                "invoice_number": row["invoice_number"],
+                "date": row["date"],
+                "due_date": row["due_date"],
+                "currency": row["currency"],
+                "paid": row["paid"],
+                "total": total,
+                "open": open_amount,
+                "balance": balance,
+            }
+        )
+    return list(statements.values())
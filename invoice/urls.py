@@ -7,15 +7,22 @@ from invoice import views
 urlpatterns = [
     path("", views.StartView.as_view(), name="start"),
     path("customers/", views.CustomerListView.as_view(), name="customer-list"),
+    path("customers/autocomplete/", views.customer_autocomplete, name="customer-autocomplete"),
     path("customer/add/", views.CustomerCreateView.as_view(), name="customer-add"),
     path("customer/<int:pk>/", views.CustomerUpdateView.as_view(), name="customer-update"),
     path("customer/<int:pk>/delete/", views.CustomerDeleteView.as_view(), name="customer-delete"),
+    path("customer/<int:pk>/statement/", views.CustomerStatementView.as_view(), name="customer-statement"),
+    path("customer/<int:pk>/statement/pdf/", views.pdf_customer_statement, name="customer-statement-pdf"),
     path("invoices/", views.InvoiceListView.as_view(), name="invoice-list"),
     path("invoice/add/", views.InvoiceCreateView.as_view(), name="invoice-add"),
+    path("invoices/import/", views.BankStatementImportView.as_view(), name="bank-statement-import"),
+    path("invoices/payments/", views.PaymentFileView.as_view(), name="payment-file"),
     path("invoice/<int:pk>/", views.InvoiceUpdateView.as_view(), name="invoice-update"),
     path("invoice/<int:invoice_id>/pdf/", views.pdf_invoice, name="invoice-pdf"),
+    path("invoice/<int:invoice_id>/xml/", views.xml_invoice, name="invoice-xml"),
     path("invoice/<int:pk>/delete/", views.InvoiceDeleteView.as_view(), name="invoice-delete"),
     path("invoice/<int:pk>/paid/", views.InvoicePaidView.as_view(), name="invoice-paid"),
+    path("invoice/<int:pk>/send/", views.InvoiceSendView.as_view(), name="invoice-send"),
     path("invoice/<int:invoice_id>/item/", views.InvoiceItemCreateView.as_view(), name="invoice-item-add"),
     path(
         "invoice/<int:invoice_id>/item/<int:invoice_item_id>/",
@@ -27,8 +34,14 @@ urlpatterns = [
         views.InvoiceItemDeleteView.as_view(),
         name="invoice-item-delete",
     ),
+    path("reports/vat/", views.VatReportView.as_view(), name="vat-report"),
+    path("reports/vat/csv/", views.VatReportCsvView.as_view(), name="vat-report-csv"),
+    path("reports/aging/", views.AgingReportView.as_view(), name="aging-report"),
+    path("reports/aging/csv/", views.AgingReportCsvView.as_view(), name="aging-report-csv"),
     path("vendors/", views.VendorListView.as_view(), name="vendor-list"),
+    path("vendors/autocomplete/", views.vendor_autocomplete, name="vendor-autocomplete"),
     path("vendor/add/", views.VendorCreateView.as_view(), name="vendor-add"),
     path("vendor/<int:pk>/", views.VendorUpdateView.as_view(), name="vendor-update"),
     path("vendor/<int:pk>/delete/", views.VendorDeleteView.as_view(), name="vendor-delete"),
+    path("vendor/<int:pk>/statements/pdf/", views.pdf_vendor_statements, name="vendor-statements-pdf"),
 ]
@@ -1,33 +1,132 @@
 """Defines the views of the invoice app."""
 
-import io
+# pylint: disable=too-many-lines
+
+from http import HTTPStatus
 from warnings import catch_warnings
+from xml.etree.ElementTree import ParseError
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.contrib.auth.views import redirect_to_login
 from django.contrib.messages.views import SuccessMessageMixin
-from django.http import FileResponse, HttpResponseForbidden, HttpResponseRedirect
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+    HttpResponseRedirect,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404
+from django.template.loader import render_to_string
 from django.urls import reverse, reverse_lazy
-from django.utils.http import urlencode
+from django.utils import timezone
+from django.utils.http import content_disposition_header, urlencode
 from django.utils.translation import gettext as _
-from django.views.generic import CreateView, DeleteView, ListView, TemplateView, UpdateView
+from django.views.generic import CreateView, DeleteView, DetailView, FormView, ListView, TemplateView, UpdateView
 
-from invoice import pdf_generator
+from invoice.bank_statements import import_statement
 from invoice.constants import YEAR_COUNTER_FORMAT
-from invoice.errors import IncompliantWarning
-from invoice.forms import AddressForm, BankAccountForm, CustomerForm, InvoiceForm, InvoiceItemForm, VendorForm
+from invoice.e_invoice import cii_chunks
+from invoice.errors import IncompliantWarning, RenderOverloadError, RenderTimeoutError
+from invoice.forms import (
+    AddressForm,
+    AgingReportForm,
+    BankAccountForm,
+    BankStatementForm,
+    CustomerForm,
+    InvoiceEmailForm,
+    InvoiceForm,
+    InvoiceItemForm,
+    PaymentFileForm,
+    PaymentForm,
+    StatementForm,
+    VatReportForm,
+    VendorForm,
+)
 from invoice.invoice_number_generator import InvoiceNumberFormat
-from invoice.models import Customer, Invoice, InvoiceItem, Vendor
+from invoice.models import (
+    Customer,
+    Invoice,
+    InvoiceItem,
+    InvoiceSnapshot,
+    OutboxMessage,
+    Payment,
+    VatRollup,
+    Vendor,
+    search_name,
+)
+from invoice.outbox import default_body, default_subject
+from invoice.payment_files import PaymentFileBuilder, PaymentFileFormat
+from invoice.render_pool import invoice_pdf_queryset, render_invoice_pdf, render_statements_pdf
+from invoice.reporting import (
+    Granularity,
+    aging_report,
+    aging_rows,
+    report_rows,
+    vat_report,
+    write_aging_report_csv,
+    write_vat_report_csv,
+)
+from invoice.search import search_invoices
+from invoice.snapshots import astore_pdf
+from invoice.statements import build_statements, statement_customers
+from rechnung.instrumentation import timed
+from rechnung.metrics import CACHE_HITS, CACHE_MISSES
+
+AUTOCOMPLETE_LIMIT = 20
+# header of the requests of static/invoice/invoice_items.js, which swap the changed parts of the page in place
+FRAGMENT_HEADER = "X-Fragment"
+
+
+class CachedObjectMixin:  # pylint: disable=too-few-public-methods
+    """Get the object of a single object view only once per request, e.g. for the ownership check and the view."""
+
+    _cached_object = None
+
+    def get_object(self, queryset=None):
+        """Get the object of the URL from the cache of this request if no other queryset is given."""
+        if queryset is not None:
+            return super().get_object(queryset)
+        if self._cached_object is None:
+            CACHE_MISSES.inc(cache="view_object")
+            self._cached_object = super().get_object()
+        else:
+            CACHE_HITS.inc(cache="view_object")
+        return self._cached_object
+
 
+class OwnedObjectMixin(CachedObjectMixin, UserPassesTestMixin):
+    """
+    Look up the object of the URL only among the objects of the user.
 
-class OwnMixin(UserPassesTestMixin):
-    """Use in views that have an object with a vendor field to verify ownership."""
+    The lookup is the ownership check at the same time. Objects of other users and missing objects both fail it.
+    """
+
+    def get_queryset(self):
+        """Scope the objects to the logged-in user."""
+        return super().get_queryset().owned_by(self.request.user)
 
     def test_func(self):
-        """Check if the user is the owner of the object via a vendor field."""
-        return self.request.user == self.get_object().vendor.user
+        """Check if the object of the URL belongs to the user."""
+        if not self.request.user.is_authenticated:
+            return False
+        try:
+            self.get_object()
+        except Http404:
+            return False
+        return True
+
+
+class OwnMixin(OwnedObjectMixin):
+    """Use in views of an object of the user, e.g. with a vendor field or a vendor itself, to verify ownership."""
 
     def handle_no_permission(self, login_redirect="start", permission_redirect="start"):
         """
@@ -46,38 +145,49 @@ class OwnMixin(UserPassesTestMixin):
         return HttpResponseRedirect(url)
 
 
-class OwnVendorMixin(UserPassesTestMixin):
-    """Use in views that have a vendor object to verify ownership."""
+# the vendors are looked up among the objects of the user like the objects with a vendor field
+OwnVendorMixin = OwnMixin
 
-    def test_func(self):
-        """Check if the user is the owner of the object via vendor's user."""
-        return self.request.user == self.get_object().user
 
-    def handle_no_permission(self, login_redirect="start", permission_redirect="start"):
-        """
-        Redirects to login if the user is not authenticated. Otherwise, redirect to the permission page.
+class OwnItemMixin(CachedObjectMixin, UserPassesTestMixin):
+    """Use in views that are invoice item related and require a permission check."""
 
-        :param login_redirect: Name of the target view after logging in as an owner.
-        :param permission_redirect: Name of the target view if user's permissions are not sufficient.
-        :return: HTTP redirect.
-        """
-        if self.request.user.is_authenticated:
-            messages.warning(self.request, self.permission_denied_message)
-            return HttpResponseRedirect(reverse(permission_redirect))
-        next_url = reverse(login_redirect, args=[self.kwargs["pk"]])
-        base_url = reverse("login")
-        url = "{}?{}".format(base_url, urlencode({"next": next_url}))  # pylint: disable=consider-using-f-string
-        return HttpResponseRedirect(url)
+    _invoice = None
 
+    def get_invoice(self):
+        """Get the invoice of the URL among the invoices of the user once per request."""
+        if self._invoice is None:
+            CACHE_MISSES.inc(cache="item_invoice")
+            self._invoice = get_object_or_404(Invoice.objects.owned_by(self.request.user), pk=self.kwargs["invoice_id"])
+        else:
+            CACHE_HITS.inc(cache="item_invoice")
+        return self._invoice
 
-class OwnItemMixin(UserPassesTestMixin):
-    """Use in views that are invoice item related and require a permission check."""
+    def get_queryset(self):
+        """Limit the items to the invoice of the URL, which is the one checked for ownership."""
+        return super().get_queryset().filter(invoice_id=self.kwargs["invoice_id"])
+
+    def get_object(self, queryset=None):
+        """Get the item and attach the already loaded invoice."""
+        invoice_item = super().get_object(queryset)
+        invoice_item.invoice = self.get_invoice()
+        return invoice_item
 
     def test_func(self):
-        """Check if the user is the owner of the customer."""
-        invoice_id = self.kwargs["invoice_id"]
-        invoice = get_object_or_404(Invoice, pk=invoice_id)
-        return self.request.user == invoice.vendor.user
+        """Check if the invoice of the URL belongs to the user and its items can still be changed."""
+        if not self.request.user.is_authenticated:
+            return False
+        try:
+            invoice = self.get_invoice()
+        except Http404:
+            return False
+        return not invoice.final
+
+    def get_permission_denied_message(self):
+        """Tell that the items of a final invoice cannot be changed, as the model raises a FinalError."""
+        if self._invoice is not None and self._invoice.final:
+            return _("The items of a final invoice cannot be changed.")
+        return super().get_permission_denied_message()
 
     def handle_no_permission(self, login_args=None, permission_redirect="start", login_redirect="start"):
         """
@@ -89,7 +199,7 @@ class OwnItemMixin(UserPassesTestMixin):
         :return: HTTP redirect.
         """
         if self.request.user.is_authenticated:
-            messages.warning(self.request, self.permission_denied_message)
+            messages.warning(self.request, self.get_permission_denied_message())
             return HttpResponseRedirect(reverse(permission_redirect))
         next_url = reverse(login_redirect, args=login_args)
         base_url = reverse("login")
@@ -97,6 +207,93 @@ class OwnItemMixin(UserPassesTestMixin):
         return HttpResponseRedirect(url)
 
 
+class ItemFragmentMixin:
+    """
+    Answer the item requests of the invoice page with the changed parts of the page only.
+
+    If the request carries the :data:`FRAGMENT_HEADER`, the response is JSON with the rendered row of the item and the
+    recalculated totals of the invoice instead of a redirect to the whole page. Requests without the header, e.g. with
+    JavaScript disabled, keep the redirect.
+    """
+
+    def is_fragment_request(self) -> bool:
+        """Check if the page asked for the changed fragments."""
+        return FRAGMENT_HEADER in self.request.headers
+
+    def render_fragments(self, invoice_item=None, deleted=None) -> JsonResponse:
+        """Render the row of the created or updated item or name the deleted one, together with the totals."""
+        invoice = self.get_invoice()
+        # the totals are calculated from all items of the invoice, loaded in one query
+        prefetch_related_objects([invoice], "invoiceitem_set")
+        context = {"invoice": invoice, "item": invoice_item}
+        data = {"totals": render_to_string("invoice/invoice_totals.html", context, self.request)}
+        if invoice_item is not None:
+            data["id"] = invoice_item.id
+            data["row"] = render_to_string("invoice/invoiceitem_row.html", context, self.request)
+        if deleted is not None:
+            data["deleted"] = deleted
+        return JsonResponse(data)
+
+    def form_invalid(self, form):
+        """Return the errors of the form to the page, which falls back to the full page to show them."""
+        if self.is_fragment_request():
+            return JsonResponse({"errors": form.errors}, status=HTTPStatus.UNPROCESSABLE_ENTITY)
+        return super().form_invalid(form)
+
+
+class AsyncListMixin:  # pylint: disable=too-few-public-methods
+    """
+    Serve a list view with the async ORM for logged-in users.
+
+    The user is loaded with ``request.auser()``, because the sync ``LoginRequiredMixin`` must not touch the database
+    in an async view. The template renders in a worker thread after the view returned, so the queryset should fetch
+    the related objects that the template shows.
+    """
+
+    async def get(self, request, *args, **kwargs):  # noqa: ARG002
+        """Evaluate the queryset asynchronously and render the list."""
+        # pylint: disable=unused-argument
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        # the lazy user of the authentication middleware would query the database synchronously
+        request.user = user
+        queryset = self.get_queryset()
+        # iterating fills the result cache, the template then reads the fetched objects
+        async for _obj in queryset:
+            pass
+        self.object_list = queryset  # pylint: disable=attribute-defined-outside-init
+        return self.render_to_response(self.get_context_data())
+
+
+def _autocomplete(request, queryset) -> JsonResponse:
+    """Get the first objects whose search name starts with the ``q`` parameter, ordered along the index."""
+    if term := search_name(request.GET.get("q", "")):
+        queryset = queryset.filter(search_name__startswith=term)
+    objects = list(queryset.order_by("search_name", "pk")[: AUTOCOMPLETE_LIMIT + 1])
+    return JsonResponse(
+        {
+            "results": [{"id": obj.pk, "text": str(obj)} for obj in objects[:AUTOCOMPLETE_LIMIT]],
+            "more": len(objects) > AUTOCOMPLETE_LIMIT,
+        }
+    )
+
+
+@login_required
+def customer_autocomplete(request) -> JsonResponse:
+    """Search the customers of the user by last name and first name, optionally only of the ``vendor`` parameter."""
+    customers = Customer.objects.owned_by(request.user).only("first_name", "last_name")
+    if (vendor := request.GET.get("vendor", "")).isdigit():
+        customers = customers.filter(vendor_id=vendor)
+    return _autocomplete(request, customers)
+
+
+@login_required
+def vendor_autocomplete(request) -> JsonResponse:
+    """Search the vendors of the user by their displayed name."""
+    return _autocomplete(request, Vendor.objects.owned_by(request.user).only("name", "company_name"))
+
+
 class StartView(TemplateView):
     """The start page."""
 
@@ -119,7 +316,6 @@ class CustomerCreateView(LoginRequiredMixin, SuccessMessageMixin, CreateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["form"].fields["vendor"].queryset = Vendor.objects.filter(user_id=self.request.user.id)
         if self.request.POST:
             context["address_form"] = AddressForm(self.request.POST)
         else:
@@ -150,9 +346,16 @@ class CustomerUpdateView(OwnMixin, SuccessMessageMixin, UpdateView):
     def handle_no_permission(self, login_redirect="customer-update", permission_redirect="customer-list"):
         return super().handle_no_permission(login_redirect, permission_redirect)
 
+    def get_queryset(self):
+        return super().get_queryset().select_related("address")
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs["user"] = self.request.user
+        return kwargs
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["form"].fields["vendor"].queryset = Vendor.objects.filter(user_id=self.request.user.id)
         if self.request.POST:
             context["address_form"] = AddressForm(self.request.POST)
         else:
@@ -179,7 +382,7 @@ class CustomerDeleteView(OwnMixin, SuccessMessageMixin, DeleteView):
         return super().handle_no_permission(login_redirect, permission_redirect)
 
 
-class CustomerListView(LoginRequiredMixin, ListView):  # pylint: disable=too-many-ancestors
+class CustomerListView(AsyncListMixin, ListView):  # pylint: disable=too-many-ancestors
     """List all customers."""
 
     model = Customer
@@ -187,7 +390,7 @@ class CustomerListView(LoginRequiredMixin, ListView):  # pylint: disable=too-man
     def get_queryset(self, **kwargs):
         """Filter the customer list by the logged-in user."""
         query_set = super().get_queryset(**kwargs)
-        return query_set.filter(vendor__user_id=self.request.user.id)
+        return query_set.owned_by(self.request.user).select_related("address")
 
 
 class InvoiceCreateView(LoginRequiredMixin, SuccessMessageMixin, CreateView):
@@ -204,13 +407,15 @@ class InvoiceCreateView(LoginRequiredMixin, SuccessMessageMixin, CreateView):
         # this does not save to the db, but instead just creates the Invoice object
         invoice = form.save(commit=False)
 
-        # override invoice_number
-        format_string = invoice.vendor.invoice_number_format or YEAR_COUNTER_FORMAT
-        formatter = InvoiceNumberFormat(format_string)
-        invoice.invoice_number = formatter.get_invoice_number(invoice)
+        # allocate the counters and insert the invoice in one write transaction
+        with transaction.atomic():
+            # override invoice_number
+            format_string = invoice.vendor.invoice_number_format or YEAR_COUNTER_FORMAT
+            formatter = InvoiceNumberFormat(format_string)
+            invoice.invoice_number = formatter.get_invoice_number(invoice)
 
-        # actually save to db via super (see ModelFormMixin#form_valid)
-        return super().form_valid(form)
+            # actually save to db via super (see ModelFormMixin#form_valid)
+            return super().form_valid(form)
 
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
@@ -243,6 +448,8 @@ class InvoiceUpdateView(OwnMixin, SuccessMessageMixin, UpdateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        # the item table and every total of the page read the items
+        prefetch_related_objects([self.object], "invoiceitem_set")
         if self.request.POST:
             context["invoice_item_form"] = InvoiceItemForm(self.request.POST)
         else:
@@ -254,11 +461,11 @@ class InvoiceUpdateView(OwnMixin, SuccessMessageMixin, UpdateView):
 
 
 class InvoicePaidView(OwnMixin, SuccessMessageMixin, UpdateView):
-    """Mark an invoice as paid."""
+    """Record a payment of an invoice, by default of its whole open balance, which marks it as paid."""
 
     model = Invoice
-    fields = ["paid"]
-    success_message = _("Invoice was marked as paid successfully.")
+    form_class = PaymentForm
+    success_message = _("Payment was recorded successfully.")
     template_name = "invoice/invoice_paid.html"
 
     def handle_no_permission(self, login_redirect="invoice-paid", permission_redirect="invoice-list"):
@@ -268,12 +475,39 @@ class InvoicePaidView(OwnMixin, SuccessMessageMixin, UpdateView):
         """Redirect to the invoice detail page."""
         return reverse("invoice-update", kwargs={"pk": self.kwargs["pk"]})
 
-    def post(self, request, *args, **kwargs):
-        """Mark an invoice as paid."""
-        super().post(request, *args, **kwargs)
-        self.object.paid = True
-        self.object.save()
-        return HttpResponseRedirect(self.get_success_url())
+    def get_form_kwargs(self):
+        """Bind the form to a new payment of the invoice instead of the invoice itself."""
+        kwargs = super().get_form_kwargs()
+        kwargs["instance"] = Payment(invoice=self.object)
+        kwargs["initial"] = {"amount": self.object.open_balance, "date": timezone.localdate()}
+        return kwargs
+
+
+class InvoiceSendView(OwnMixin, SuccessMessageMixin, UpdateView):
+    """Queue an email of an invoice with its PDF, by default to its customer. The worker sends it later."""
+
+    model = Invoice
+    form_class = InvoiceEmailForm
+    success_message = _("The email was queued and will be sent shortly.")
+    template_name = "invoice/invoice_send.html"
+
+    def handle_no_permission(self, login_redirect="invoice-send", permission_redirect="invoice-list"):
+        return super().handle_no_permission(login_redirect, permission_redirect)
+
+    def get_success_url(self):
+        """Redirect to the invoice detail page."""
+        return reverse("invoice-update", kwargs={"pk": self.kwargs["pk"]})
+
+    def get_form_kwargs(self):
+        """Bind the form to a new outbox message of the invoice instead of the invoice itself."""
+        kwargs = super().get_form_kwargs()
+        kwargs["instance"] = OutboxMessage(invoice=self.object)
+        kwargs["initial"] = {
+            "recipient": self.object.customer.email,
+            "subject": default_subject(self.object),
+            "body": default_body(self.object),
+        }
+        return kwargs
 
 
 class InvoiceDeleteView(OwnMixin, SuccessMessageMixin, DeleteView):
@@ -287,30 +521,107 @@ class InvoiceDeleteView(OwnMixin, SuccessMessageMixin, DeleteView):
         return super().handle_no_permission(login_redirect, permission_redirect)
 
 
-class InvoiceListView(LoginRequiredMixin, ListView):  # pylint: disable=too-many-ancestors
+class InvoiceListView(AsyncListMixin, ListView):  # pylint: disable=too-many-ancestors
     """List all invoices."""
 
     model = Invoice
 
     def get_queryset(self, **kwargs):
-        """Filter the invoice list by the logged-in user."""
-        query_set = super().get_queryset(**kwargs)
-        return query_set.filter(vendor__user_id=self.request.user.id)
+        """Filter the invoice list by the logged-in user and the search query, if any."""
+        query_set = super().get_queryset(**kwargs).owned_by(self.request.user)
+        if query := self.request.GET.get("q", "").strip():
+            query_set = search_invoices(query_set, self.request.user, query)
+        # the final invoices show their snapshot, only the items of the others are loaded for their totals
+        return query_set.select_related("vendor", "customer").prefetch_related(
+            Prefetch("snapshot", queryset=InvoiceSnapshot.objects.defer("data", "pdf", "xml")),
+            Prefetch("invoiceitem_set", queryset=InvoiceItem.objects.filter(invoice__snapshot__isnull=True)),
+        )
 
 
 @login_required
-def pdf_invoice(request, invoice_id) -> HttpResponseForbidden | FileResponse:
-    """Generate an invoice as PDF file. It will raise a 403 Forbidden if the user is not the vendor of the invoice."""
-    invoice = get_object_or_404(Invoice, pk=invoice_id)
-    if invoice.vendor.user != request.user:
+async def pdf_invoice(request, invoice_id) -> HttpResponseForbidden | HttpResponse:
+    """
+    Generate an invoice as PDF file. It will raise a 403 Forbidden if the invoice is not one of the user's invoices.
+
+    A final invoice is answered with the PDF of its snapshot, which is rendered and stored if it is missing. If the PDF
+    is rendered and the render pool is overloaded or the render times out, the response is a 503 Service Unavailable
+    with a Retry-After header.
+    """
+    user = await request.auser()
+    frozen = await InvoiceSnapshot.objects.owned_by(user).filter(pk=invoice_id).values_list("pdf").afirst()
+    if frozen is not None and frozen[0] is not None:
+        CACHE_HITS.inc(cache="snapshot_pdf")
+        return _pdf_file_response(bytes(frozen[0]), "invoice.pdf")
+    CACHE_MISSES.inc(cache="snapshot_pdf")
+    try:
+        invoice = await invoice_pdf_queryset().owned_by(user).aget(pk=invoice_id)
+    except Invoice.DoesNotExist:
         return HttpResponseForbidden("You are not allowed to view this invoice.")
-    buffer = io.BytesIO()
-    pdf_generator.gen_invoice_pdf(invoice, buffer)
-    buffer.seek(0)
-    return FileResponse(buffer, as_attachment=False, filename="invoice.pdf")
+    render = render_invoice_pdf(invoice)
+    if frozen is not None:
+        # the render after the finalization failed, this one is stored in the snapshot
+        render = astore_pdf(invoice.pk, render)
+    return await _pdf_response(render, "invoice.pdf")
 
 
-class InvoiceItemCreateView(OwnItemMixin, SuccessMessageMixin, CreateView):
+@login_required
+def xml_invoice(request, invoice_id) -> HttpResponseForbidden | StreamingHttpResponse:
+    """
+    Stream the CII XML of an invoice, the structured e-invoice of ZUGFeRD and XRechnung.
+
+    A final invoice is answered with the XML of its snapshot. It will raise a 403 Forbidden if the invoice is not one
+    of the user's invoices.
+    """
+    snapshot = InvoiceSnapshot.objects.owned_by(request.user).filter(pk=invoice_id)
+    if frozen := snapshot.values_list("data__invoice_number", "xml").first():
+        invoice_number, xml = frozen
+        CACHE_HITS.inc(cache="snapshot_xml")
+        return HttpResponse(
+            bytes(xml), content_type="application/xml; charset=utf-8", headers=_xml_headers(invoice_number)
+        )
+    CACHE_MISSES.inc(cache="snapshot_xml")
+    invoices = Invoice.objects.select_related("vendor__address", "vendor__bank_account", "customer__address")
+    try:
+        invoice = invoices.owned_by(request.user).get(pk=invoice_id)
+    except Invoice.DoesNotExist:
+        return HttpResponseForbidden("You are not allowed to view this invoice.")
+    return StreamingHttpResponse(
+        cii_chunks(invoice), content_type="application/xml; charset=utf-8", headers=_xml_headers(invoice.invoice_number)
+    )
+
+
+def _xml_headers(invoice_number: str) -> dict[str, str]:
+    """Get the headers of the XML download of the invoice."""
+    filename = f"invoice-{invoice_number}.xml"
+    return {"Content-Disposition": content_disposition_header(as_attachment=True, filename=filename)}
+
+
+async def _pdf_response(render, filename: str) -> HttpResponse:
+    """Await the render of the render pool and respond with the PDF, or with 503 if the pool cannot render it now."""
+    try:
+        with timed("pdf"):
+            content = await render
+    except RenderOverloadError, RenderTimeoutError:
+        return HttpResponse(
+            "The PDF cannot be rendered at the moment, please try again later.",
+            content_type="text/plain",
+            status=HTTPStatus.SERVICE_UNAVAILABLE,
+            headers={"Retry-After": str(settings.PDF_RENDER_RETRY_AFTER)},
+        )
+    return _pdf_file_response(content, filename)
+
+
+def _pdf_file_response(content: bytes, filename: str) -> HttpResponse:
+    """Respond with the PDF to show inline."""
+    # a plain response, a file response would be consumed synchronously under ASGI
+    return HttpResponse(
+        content,
+        content_type="application/pdf",
+        headers={"Content-Disposition": content_disposition_header(as_attachment=False, filename=filename)},
+    )
+
+
+class InvoiceItemCreateView(OwnItemMixin, ItemFragmentMixin, SuccessMessageMixin, CreateView):
     """Create a new invoice item."""
 
     template_name = "invoice/invoice_form.html"
@@ -329,7 +640,9 @@ class InvoiceItemCreateView(OwnItemMixin, SuccessMessageMixin, CreateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        invoice = get_object_or_404(Invoice, pk=self.kwargs["invoice_id"])
+        invoice = self.get_invoice()
+        # the item table and every total of the page read the items
+        prefetch_related_objects([invoice], "invoiceitem_set")
         context["invoice"] = invoice
         context["form"] = InvoiceForm(instance=invoice)
         if self.request.POST:
@@ -342,14 +655,14 @@ class InvoiceItemCreateView(OwnItemMixin, SuccessMessageMixin, CreateView):
         return reverse("invoice-update", kwargs={"pk": self.kwargs["invoice_id"]})
 
     def form_valid(self, form):
-        invoice = get_object_or_404(Invoice, pk=self.kwargs["invoice_id"])
-        invoice_item = form.save(commit=False)
-        invoice_item.invoice = invoice
-        invoice_item.save()
+        form.instance.invoice = self.get_invoice()
+        if self.is_fragment_request():
+            self.object = form.save()  # pylint: disable=attribute-defined-outside-init
+            return self.render_fragments(self.object)
         return super().form_valid(form)
 
 
-class InvoiceItemUpdateView(OwnItemMixin, SuccessMessageMixin, UpdateView):
+class InvoiceItemUpdateView(OwnItemMixin, ItemFragmentMixin, SuccessMessageMixin, UpdateView):
     """Update an existing invoice item."""
 
     template_name = "invoice/invoice_form.html"
@@ -369,7 +682,8 @@ class InvoiceItemUpdateView(OwnItemMixin, SuccessMessageMixin, UpdateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        invoice_item = self.get_object()
+        invoice_item = self.object
+        prefetch_related_objects([invoice_item.invoice], "invoiceitem_set")
         context["invoice"] = invoice_item.invoice
         context["form"] = InvoiceForm(instance=invoice_item.invoice)
         if self.request.POST:
@@ -381,8 +695,14 @@ class InvoiceItemUpdateView(OwnItemMixin, SuccessMessageMixin, UpdateView):
     def get_success_url(self):
         return reverse("invoice-update", kwargs={"pk": self.kwargs["invoice_id"]})
 
+    def form_valid(self, form):
+        if self.is_fragment_request():
+            self.object = form.save()  # pylint: disable=attribute-defined-outside-init
+            return self.render_fragments(self.object)
+        return super().form_valid(form)
+
 
-class InvoiceItemDeleteView(OwnItemMixin, SuccessMessageMixin, DeleteView):
+class InvoiceItemDeleteView(OwnItemMixin, ItemFragmentMixin, SuccessMessageMixin, DeleteView):
     """Delete an existing invoice item."""
 
     model = InvoiceItem
@@ -400,7 +720,7 @@ class InvoiceItemDeleteView(OwnItemMixin, SuccessMessageMixin, DeleteView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        invoice = get_object_or_404(Invoice, pk=self.kwargs["invoice_id"])
+        invoice = self.get_invoice()
         context["invoice"] = invoice
         context["form"] = InvoiceForm(instance=invoice)
         if self.request.POST:
@@ -412,6 +732,13 @@ class InvoiceItemDeleteView(OwnItemMixin, SuccessMessageMixin, DeleteView):
     def get_success_url(self):
         return reverse("invoice-update", kwargs={"pk": self.kwargs["invoice_id"]})
 
+    def form_valid(self, form):
+        if self.is_fragment_request():
+            invoice_item_id = self.object.id
+            self.object.delete()
+            return self.render_fragments(deleted=invoice_item_id)
+        return super().form_valid(form)
+
 
 class VendorCreateView(LoginRequiredMixin, SuccessMessageMixin, CreateView):
     """Create a new vendor. Including a bank account and a new address."""
@@ -461,6 +788,9 @@ class VendorUpdateView(OwnVendorMixin, SuccessMessageMixin, UpdateView):
     def handle_no_permission(self, login_redirect="vendor-update", permission_redirect="vendor-list"):
         return super().handle_no_permission(login_redirect=login_redirect, permission_redirect=permission_redirect)
 
+    def get_queryset(self):
+        return super().get_queryset().select_related("address", "bank_account")
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         if self.request.POST:
@@ -495,7 +825,7 @@ class VendorDeleteView(OwnVendorMixin, SuccessMessageMixin, DeleteView):
         return super().handle_no_permission(login_redirect=login_redirect, permission_redirect=permission_redirect)
 
 
-class VendorListView(LoginRequiredMixin, ListView):  # pylint: disable=too-many-ancestors
+class VendorListView(AsyncListMixin, ListView):  # pylint: disable=too-many-ancestors
     """List all vendors."""
 
     model = Vendor
@@ -503,4 +833,205 @@ class VendorListView(LoginRequiredMixin, ListView):  # pylint: disable=too-many-
     def get_queryset(self, **kwargs):
         """Filter the customer list by the logged-in user."""
         query_set = super().get_queryset(**kwargs)
-        return query_set.filter(user_id=self.request.user.id)
+        return query_set.owned_by(self.request.user)
+
+
+class VatReportView(LoginRequiredMixin, TemplateView):
+    """Show the net totals and the tax of the final invoices per vendor, period, currency and tax rate."""
+
+    template_name = "invoice/vat_report.html"
+
+    def get_form(self) -> VatReportForm:
+        """Get the filter form, bound to the query string or else to the months of the current year."""
+        data = self.request.GET or {"year": timezone.localdate().year, "granularity": Granularity.MONTH}
+        return VatReportForm(data, user=self.request.user)
+
+    def get_rows(self, form: VatReportForm) -> list[dict]:
+        """Get the report rows of the valid form from the VAT rollup."""
+        rollups = VatRollup.objects.owned_by(self.request.user).filter(period__year=form.cleaned_data["year"])
+        if form.cleaned_data["vendor"]:
+            rollups = rollups.filter(vendor=form.cleaned_data["vendor"])
+        granularity = form.cleaned_data["granularity"]
+        return report_rows(vat_report(rollups, granularity), granularity)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        form = self.get_form()
+        context["form"] = form
+        context["rows"] = self.get_rows(form) if form.is_valid() else []
+        return context
+
+
+class VatReportCsvView(VatReportView):
+    """Export the VAT report as CSV."""
+
+    def render_to_response(self, context, **response_kwargs):
+        """Write the rows as CSV file instead of rendering the template."""
+        form = context["form"]
+        if not form.is_valid():
+            return HttpResponseBadRequest(form.errors.as_text(), content_type="text/plain")
+        filename = f"vat-report-{form.cleaned_data['year']}-{form.cleaned_data['granularity']}.csv"
+        response = HttpResponse(
+            content_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": content_disposition_header(as_attachment=True, filename=filename)},
+            **response_kwargs,
+        )
+        write_vat_report_csv(context["rows"], response)
+        return response
+
+
+class AgingReportView(LoginRequiredMixin, TemplateView):
+    """Show the unpaid amounts of the final invoices per customer and currency by the days past the due date."""
+
+    template_name = "invoice/aging_report.html"
+
+    def get_form(self) -> AgingReportForm:
+        """Get the filter form, bound to the query string or else to today."""
+        data = self.request.GET or {"date": timezone.localdate()}
+        return AgingReportForm(data, user=self.request.user)
+
+    def get_rows(self, form: AgingReportForm) -> list[dict]:
+        """Get the report rows of the valid form, aggregated by one query."""
+        invoices = Invoice.objects.owned_by(self.request.user)
+        if form.cleaned_data["vendor"]:
+            invoices = invoices.filter(vendor=form.cleaned_data["vendor"])
+        return aging_rows(aging_report(invoices, form.cleaned_data["date"]))
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        form = self.get_form()
+        context["form"] = form
+        context["rows"] = self.get_rows(form) if form.is_valid() else []
+        return context
+
+
+class AgingReportCsvView(AgingReportView):
+    """Export the aging report as CSV."""
+
+    def render_to_response(self, context, **response_kwargs):
+        """Write the rows as CSV file instead of rendering the template."""
+        form = context["form"]
+        if not form.is_valid():
+            return HttpResponseBadRequest(form.errors.as_text(), content_type="text/plain")
+        filename = f"aging-report-{form.cleaned_data['date'].isoformat()}.csv"
+        response = HttpResponse(
+            content_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": content_disposition_header(as_attachment=True, filename=filename)},
+            **response_kwargs,
+        )
+        write_aging_report_csv(context["rows"], response)
+        return response
+
+
+class BankStatementImportView(LoginRequiredMixin, FormView):
+    """Import a bank statement and record the payments of the open final invoices its transfers match."""
+
+    template_name = "invoice/bank_statement_import.html"
+    form_class = BankStatementForm
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs["user"] = self.request.user
+        return kwargs
+
+    def form_valid(self, form):
+        """Import the statement and show the transfers that did not match an invoice."""
+        invoices = Invoice.objects.owned_by(self.request.user)
+        if form.cleaned_data["vendor"]:
+            invoices = invoices.filter(vendor=form.cleaned_data["vendor"])
+        try:
+            result = import_statement(form.cleaned_data["file"], invoices)
+        except ParseError, ValueError, ArithmeticError:
+            form.add_error("file", _("The file is not a valid CAMT.053 or MT940 statement."))
+            return self.form_invalid(form)
+        messages.success(self.request, _("%(count)d invoices were marked as paid.") % {"count": result.matched})
+        return self.render_to_response(self.get_context_data(form=form, result=result))
+
+
+class PaymentFileView(LoginRequiredMixin, FormView):
+    """Download the payment data of the open final invoices as a SEPA credit transfer file or EPC QR code payloads."""
+
+    template_name = "invoice/payment_file.html"
+    form_class = PaymentFileForm
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs["user"] = self.request.user
+        return kwargs
+
+    def form_valid(self, form):
+        """Stream the payment data of the invoices of the user as attachment."""
+        invoices = Invoice.objects.owned_by(self.request.user)
+        if form.cleaned_data["vendor"]:
+            invoices = invoices.filter(vendor=form.cleaned_data["vendor"])
+        execution_date = form.cleaned_data["execution_date"] or timezone.localdate()
+        builder = PaymentFileBuilder()
+        if form.cleaned_data["format"] == PaymentFileFormat.PAIN001:
+            chunks = builder.pain001(
+                invoices, form.cleaned_data["debtor_name"], form.cleaned_data["debtor_iban"], execution_date
+            )
+            content_type, filename = "application/xml", f"payments-{execution_date.isoformat()}.xml"
+        else:
+            chunks = builder.epc_lines(invoices)
+            content_type, filename = "application/jsonl", f"payments-{execution_date.isoformat()}.jsonl"
+        return StreamingHttpResponse(
+            chunks,
+            content_type=f"{content_type}; charset=utf-8",
+            headers={"Content-Disposition": content_disposition_header(as_attachment=True, filename=filename)},
+        )
+
+
+def _statement_date(request):
+    """Get the date of the ``date`` parameter, today if it is missing, or None if it is invalid."""
+    form = StatementForm(request.GET or {"date": timezone.localdate()})
+    return form.cleaned_data["date"] if form.is_valid() else None
+
+
+class CustomerStatementView(OwnMixin, DetailView):
+    """Show the statement of a customer: the open and recent final invoices with a running balance."""
+
+    queryset = statement_customers()
+    template_name = "invoice/customer_statement.html"
+
+    def handle_no_permission(self, login_redirect="customer-statement", permission_redirect="customer-list"):
+        return super().handle_no_permission(login_redirect=login_redirect, permission_redirect=permission_redirect)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        form = StatementForm(self.request.GET or {"date": timezone.localdate()})
+        context["form"] = form
+        if form.is_valid():
+            (context["statement"],) = build_statements([self.object], form.cleaned_data["date"])
+        return context
+
+
+@login_required
+async def pdf_customer_statement(request, pk) -> HttpResponse:
+    """Generate the statement of a customer as PDF file. It will raise a 403 Forbidden if it is not the user's."""
+    user = await request.auser()
+    if (date := _statement_date(request)) is None:
+        return HttpResponseBadRequest("The date is invalid.", content_type="text/plain")
+    try:
+        customer = await statement_customers().owned_by(user).aget(pk=pk)
+    except Customer.DoesNotExist:
+        return HttpResponseForbidden("You are not allowed to view this customer.")
+    statements = await sync_to_async(build_statements)([customer], date)
+    return await _pdf_response(render_statements_pdf(statements), f"statement-{date.isoformat()}.pdf")
+
+
+@login_required
+async def pdf_vendor_statements(request, pk) -> HttpResponse:
+    """
+    Generate the statements of all customers of a vendor with final invoices as one PDF file.
+
+    The balances of all customers take one aggregate query. It will raise a 403 Forbidden if the vendor is not one of
+    the user's vendors.
+    """
+    user = await request.auser()
+    if (date := _statement_date(request)) is None:
+        return HttpResponseBadRequest("The date is invalid.", content_type="text/plain")
+    if not await Vendor.objects.owned_by(user).filter(pk=pk).aexists():
+        return HttpResponseForbidden("You are not allowed to view this vendor.")
+    customers = statement_customers().filter(vendor_id=pk).order_by("last_name", "first_name", "pk")
+    statements = [statement for statement in await sync_to_async(build_statements)(customers, date) if statement.lines]
+    return await _pdf_response(render_statements_pdf(statements), f"statements-{date.isoformat()}.pdf")
@@ -0,0 +1,52 @@
+"""Form widgets of the invoice app."""
+
+from django.core.exceptions import ValidationError
+from django.forms import Select
+from django.urls import reverse
+from django.utils.translation import gettext as _
+
+
+class AutocompleteSelect(Select):
+    """
+    Select of a model choice field that renders only the selected option.
+
+    The other options are searched by the browser at the JSON autocomplete endpoint named by ``url_name``, see
+    ``static/invoice/autocomplete.js``. The choices are never iterated, so the page size does not grow with the number
+    of objects. ``forward`` names another field of the form whose value is sent along, e.g. to narrow the customers to
+    the selected vendor.
+    """
+
+    class Media:
+        js = ["invoice/autocomplete.js"]
+
+    def __init__(self, url_name: str, forward: str = "", attrs=None):
+        """Create the widget for the autocomplete endpoint with the URL name."""
+        super().__init__(attrs)
+        self.url_name = url_name
+        self.forward = forward
+
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        """Add the URL of the autocomplete endpoint."""
+        attrs = super().build_attrs(base_attrs, extra_attrs)
+        attrs["data-autocomplete-url"] = reverse(self.url_name)
+        attrs["data-autocomplete-placeholder"] = _("Search")
+        if self.forward:
+            attrs["data-autocomplete-forward"] = self.forward
+        return attrs
+
+    def optgroups(self, name, value, attrs=None):
+        """Get the empty option and the selected options only, fetched in one query."""
+        field = self.choices.field
+        selected = [item for item in value if item not in field.empty_values]
+        options = []
+        if field.empty_label is not None:
+            options.append(self.create_option(name, "", field.empty_label, not selected, 0, attrs=attrs))
+        try:
+            objects = list(field.queryset.filter(pk__in=selected)) if selected else []
+        except ValueError, ValidationError:
+            # an invalid submitted value has no option, the form shows its error
+            objects = []
+        for index, obj in enumerate(objects, start=1):
+            option_value, label = field.prepare_value(obj), field.label_from_instance(obj)
+            options.append(self.create_option(name, option_value, label, selected=True, index=index, attrs=attrs))
+        return [(None, options, 0)]
@@ -0,0 +1,27 @@
+"""
+Gunicorn server hooks, loaded by ``gunicorn --config=python:rechnung.gunicorn``.
+
+They keep the shared metrics directory of :mod:`rechnung.metrics` free of stale process files. The files of the workers
+of an earlier start are removed before the first worker is forked, the file of a dead process whose pid a new worker
+reuses when the worker starts. The workers write their last values themselves when they exit.
+"""
+
+import os
+
+from django.conf import settings
+
+from rechnung.metrics import remove_process_files
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "rechnung.settings")
+
+
+def on_starting(server):  # pylint: disable=unused-argument # noqa: ARG001
+    """Remove the metrics files of the workers of an earlier start."""
+    if settings.METRICS_DIR:
+        remove_process_files(settings.METRICS_DIR)
+
+
+def post_fork(server, worker):  # pylint: disable=unused-argument # noqa: ARG001
+    """Remove the metrics file a dead process left under the pid of the new worker."""
+    if settings.METRICS_DIR:
+        remove_process_files(settings.METRICS_DIR, worker.pid)
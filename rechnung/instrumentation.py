@@ -0,0 +1,191 @@
+"""
+Lightweight per-request instrumentation reported as ``Server-Timing`` header and log line.
+
+The middlewares serve both handlers. Under ASGI the ORM calls of a request run in a thread of their own, see
+:func:`~asgiref.sync.sync_to_async`, so the database execute wrappers are installed on the connections of that thread.
+"""
+
+import logging
+from abc import ABC, abstractmethod
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class RequestTimings:
+    """Collects the query count and the durations of the phases of a single request."""
+
+    __slots__ = ("db_count", "db_time", "durations")
+
+    def __init__(self):
+        """Create empty timings."""
+        self.db_count = 0
+        self.db_time = 0.0
+        self.durations: dict[str, float] = {}
+
+    def add(self, name: str, duration: float):
+        """Add a duration in seconds to the named phase."""
+        self.durations[name] = self.durations.get(name, 0.0) + duration
+
+    def __call__(self, execute, sql, params, many, context):
+        """Count the query and measure its time. Used as database execute wrapper."""
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += perf_counter() - start
+            self.db_count += 1
+
+
+@contextmanager
+def wrap_queries(wrapper):
+    """Wrap the queries of all database connections of this thread in the execute wrapper."""
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(wrapper))
+        yield
+
+
+def _add_execute_wrapper(wrapper):
+    for alias in connections:
+        connections[alias].execute_wrappers.append(wrapper)
+
+
+def _remove_execute_wrapper(wrapper):
+    for alias in connections:
+        connections[alias].execute_wrappers.remove(wrapper)
+
+
+@asynccontextmanager
+async def awrap_queries(wrapper):
+    """Wrap the queries of the database connections of the thread that runs the ORM calls of the async request."""
+    await sync_to_async(_add_execute_wrapper)(wrapper)
+    try:
+        yield
+    finally:
+        await sync_to_async(_remove_execute_wrapper)(wrapper)
+
+
+_current_timings: ContextVar[RequestTimings | None] = ContextVar("request_timings", default=None)
+
+
+def current_timings() -> RequestTimings | None:
+    """Get the timings of the current request or None if instrumentation is disabled."""
+    return _current_timings.get()
+
+
+@contextmanager
+def timed(name: str):
+    """Measure the enclosed block as phase of the current request. Does nothing outside an instrumented request."""
+    timings = _current_timings.get()
+    if timings is None:
+        yield
+        return
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, perf_counter() - start)
+
+
+class HybridMiddleware(ABC):
+    """
+    Base of the middlewares that serve the sync and the async handler.
+
+    The instance is a coroutine function if the next handler is, then requests go to :meth:`__acall__` instead of
+    :meth:`handle`.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        """Create the middleware."""
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.handle(request)
+
+    @abstractmethod
+    def handle(self, request):
+        """Handle a request of the sync handler."""
+
+    @abstractmethod
+    async def __acall__(self, request):
+        """Handle a request of the async handler."""
+
+
+class ServerTimingMiddleware(HybridMiddleware):
+    """
+    Record database, template and PDF timings of each request.
+
+    The timings are added as ``Server-Timing`` header and logged as one ``key=value`` line on the
+    ``rechnung.instrumentation`` logger. Enable it with the ``SERVER_TIMING`` setting.
+    """
+
+    def handle(self, request):
+        """Record the timings of a request of the sync handler."""
+        timings = RequestTimings()
+        token = _current_timings.set(timings)
+        start = perf_counter()
+        try:
+            with wrap_queries(timings):
+                response = self.get_response(request)
+        finally:
+            _current_timings.reset(token)
+        return self._report(request, response, timings, perf_counter() - start)
+
+    async def __acall__(self, request):
+        """Record the timings of a request of the async handler."""
+        timings = RequestTimings()
+        token = _current_timings.set(timings)
+        start = perf_counter()
+        try:
+            async with awrap_queries(timings):
+                response = await self.get_response(request)
+        finally:
+            _current_timings.reset(token)
+        return self._report(request, response, timings, perf_counter() - start)
+
+    @staticmethod
+    def _report(request, response, timings: RequestTimings, total: float):
+        """Add the timings of the request to its response as header and log them."""
+        metrics = [f'db;dur={timings.db_time * 1000:.1f};desc="{timings.db_count} queries"']
+        metrics += [f"{name};dur={duration * 1000:.1f}" for name, duration in timings.durations.items()]
+        metrics.append(f"total;dur={total * 1000:.1f}")
+        response["Server-Timing"] = ", ".join(metrics)
+
+        if logger.isEnabledFor(logging.INFO):
+            phases = "".join(f" {name}_ms={duration * 1000:.1f}" for name, duration in timings.durations.items())
+            logger.info(
+                "method=%s path=%s status=%s total_ms=%.1f db_queries=%d db_ms=%.1f%s",
+                request.method,
+                request.path,
+                response.status_code,
+                total * 1000,
+                timings.db_count,
+                timings.db_time * 1000,
+                phases,
+            )
+        return response
+
+    def process_template_response(self, request, response):  # noqa: ARG002
+        """Measure the template rendering, which happens after the view returned."""
+        # pylint: disable=unused-argument
+        render = response.render
+
+        def timed_render():
+            with timed("template"):
+                return render()
+
+        response.render = timed_render
+        return response
@@ -0,0 +1,317 @@
+"""
+In-process metrics registry exposed in the Prometheus text format.
+
+Every process keeps its own counters and histograms in memory. The ``METRICS_DIR`` setting points to a directory shared
+by all workers and their PDF render processes, each process regularly writes its values to ``<pid>.json`` in that
+directory and the ``/metrics`` endpoint sums up all files. This way the numbers are correct across gunicorn workers
+without an external service. Each process writes its file a last time when it exits. The gunicorn hooks in
+:mod:`rechnung.gunicorn` remove the files of an earlier start and the file a new worker finds under its reused pid.
+
+The endpoint requires the ``METRICS_TOKEN`` setting as bearer token, as behind a reverse proxy every request comes from
+the address of the proxy.
+"""
+
+import atexit
+import hmac
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from time import monotonic, perf_counter
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+
+from rechnung.instrumentation import HybridMiddleware, RequestTimings, awrap_queries, wrap_queries
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Metric(ABC):
+    """Base class of a metric with optional labels."""
+
+    type = "untyped"
+
+    def __init__(self, registry: Registry, name: str, documentation: str, labelnames=()):
+        """Create a metric. Use the factory methods of the registry instead."""
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = registry.lock
+        self._values: dict[tuple[str, ...], object] = {}
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        if labels.keys() != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def dump(self) -> list:
+        """Get the values as JSON serializable list of label values and value pairs."""
+        return [[list(key), value] for key, value in self._values.items()]
+
+    @staticmethod
+    @abstractmethod
+    def merge(value, other):
+        """Merge two dumped values of the same label set."""
+
+    @abstractmethod
+    def samples(self, key: tuple[str, ...], value):
+        """Yield the sample lines of one label set."""
+
+    def _labels(self, key, extra=()) -> str:
+        pairs = [*zip(self.labelnames, key, strict=True), *extra]
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter(Metric):
+    """Monotonically increasing counter."""
+
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        """Increase the counter of the given labels."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    @staticmethod
+    def merge(value, other):
+        return value + other
+
+    def samples(self, key, value):
+        yield f"{self.name}{self._labels(key)} {_format_number(value)}"
+
+
+class Histogram(Metric):
+    """Histogram with fixed buckets. Stores the count per bucket plus the sum of all observations."""
+
+    type = "histogram"
+
+    def __init__(self, registry: Registry, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """Create a histogram. Use the factory methods of the registry instead."""
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        """Record an observation for the given labels."""
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # one count per bucket, one for +Inf and the sum as last element
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the enclosed block in seconds. Can also be used as decorator."""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start, **labels)
+
+    def dump(self) -> list:
+        return [[list(key), list(value)] for key, value in self._values.items()]
+
+    @staticmethod
+    def merge(value, other):
+        return [a + b for a, b in zip(value, other, strict=True)]
+
+    def samples(self, key, value):
+        cumulative = 0
+        for bound, count in zip((*self.buckets, "+Inf"), value[:-1], strict=True):
+            cumulative += count
+            le = bound if isinstance(bound, str) else _format_number(bound)
+            yield f"{self.name}_bucket{self._labels(key, [('le', le)])} {cumulative}"
+        yield f"{self.name}_sum{self._labels(key)} {_format_number(value[-1])}"
+        yield f"{self.name}_count{self._labels(key)} {cumulative}"
+
+
+class Registry:
+    """Holds all metrics of a process and renders them, optionally merged with the other processes."""
+
+    def __init__(self):
+        """Create an empty registry."""
+        self.lock = threading.Lock()
+        self._metrics: dict[str, Metric] = {}
+        self._last_flush = 0.0
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        """Create and register a counter."""
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        """Create and register a histogram."""
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def reset(self):
+        """Drop all recorded values, e.g. in a freshly forked process."""
+        with self.lock:
+            for metric in self._metrics.values():
+                metric._values = {}  # noqa: SLF001 # pylint: disable=protected-access
+
+    def dump(self) -> dict[str, list]:
+        """Get the values of all metrics of this process."""
+        with self.lock:
+            return {name: metric.dump() for name, metric in self._metrics.items()}
+
+    def flush(self, directory):
+        """Write the values of this process atomically to the shared metrics directory."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        target = directory / f"{os.getpid()}.json"
+        temporary = directory / f".{os.getpid()}.json.tmp"
+        temporary.write_text(json.dumps(self.dump()), encoding="utf-8")
+        temporary.replace(target)
+        self._last_flush = monotonic()
+
+    def maybe_flush(self, directory, interval: float = 1.0):
+        """Flush if the last flush is longer ago than the interval in seconds."""
+        if monotonic() - self._last_flush >= interval:
+            self.flush(directory)
+
+    def collect(self, directory=None) -> dict[str, dict[tuple[str, ...], object]]:
+        """Get the values of all metrics, summed up over all process files of the directory if given."""
+        if directory is None:
+            dumps = [self.dump()]
+        else:
+            self.flush(directory)
+            dumps = [json.loads(path.read_text(encoding="utf-8")) for path in Path(directory).glob("*.json")]
+
+        collected = {name: {} for name in self._metrics}
+        for dump in dumps:
+            for name, values in dump.items():
+                metric = self._metrics.get(name)
+                if metric is None:
+                    continue
+                merged = collected[name]
+                for key, value in values:
+                    key = tuple(key)  # noqa: PLW2901
+                    merged[key] = metric.merge(merged[key], value) if key in merged else value
+        return collected
+
+    def render(self, directory=None) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = []
+        for name, values in self.collect(directory).items():
+            metric = self._metrics[name]
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for key in sorted(values):
+                lines.extend(metric.samples(key, values[key]))
+        return "\n".join(lines) + "\n"
+
+
+def remove_process_files(directory, pid: int | None = None):
+    """Remove the file of the process with the pid from the shared metrics directory, or the files of all processes."""
+    name = "*" if pid is None else str(pid)
+    for pattern in (f"{name}.json", f".{name}.json.tmp"):
+        for path in Path(directory).glob(pattern):
+            path.unlink(missing_ok=True)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REGISTRY = Registry()
+os.register_at_fork(after_in_child=REGISTRY.reset)
+
+
+@atexit.register
+def flush_at_exit():
+    """Write the values of this process a last time, the requests since its last flush are counted too."""
+    if settings.configured and settings.METRICS_DIR:
+        REGISTRY.flush(settings.METRICS_DIR)
+
+
+PDF_RENDER_SECONDS = REGISTRY.histogram("rechnung_pdf_render_seconds", "Duration of gen_invoice_pdf.")
+PDF_RENDER_ERRORS = REGISTRY.counter(
+    "rechnung_pdf_render_errors_total", "PDF renders rejected or aborted by the render pool by reason.", ["reason"]
+)
+EPC_QR_SECONDS = REGISTRY.histogram(
+    "rechnung_epc_qr_seconds", "Duration of the EPC QR code data generation.", buckets=(0.0001, 0.0005, 0.001, 0.005)
+)
+INVOICE_NUMBER_SECONDS = REGISTRY.histogram(
+    "rechnung_invoice_number_seconds", "Duration of the invoice number allocation including its counters."
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "rechnung_request_duration_seconds", "Latency of requests by URL name.", labelnames=["view"]
+)
+REQUEST_DB_QUERIES = REGISTRY.histogram(
+    "rechnung_request_db_queries", "Database queries per request by URL name.", ["view"], QUERY_COUNT_BUCKETS
+)
+# the caches are the per request objects of the views and the snapshots of the final invoices instead of a render
+CACHE_HITS = REGISTRY.counter("rechnung_cache_hits_total", "Cache hits by cache name.", labelnames=["cache"])
+CACHE_MISSES = REGISTRY.counter("rechnung_cache_misses_total", "Cache misses by cache name.", labelnames=["cache"])
+
+
+class MetricsMiddleware(HybridMiddleware):
+    """Record latency and query count of each request and flush them to the shared metrics directory."""
+
+    def handle(self, request):
+        """Record the metrics of a request of the sync handler."""
+        queries = RequestTimings()
+        start = perf_counter()
+        with wrap_queries(queries):
+            response = self.get_response(request)
+        self._record(request, queries, perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        """Record the metrics of a request of the async handler."""
+        queries = RequestTimings()
+        start = perf_counter()
+        async with awrap_queries(queries):
+            response = await self.get_response(request)
+        self._record(request, queries, perf_counter() - start)
+        return response
+
+    @staticmethod
+    def _record(request, queries: RequestTimings, duration: float):
+        """Observe the latency and the query count of the request and flush them now and then."""
+        match = request.resolver_match
+        view = match.url_name if match and match.url_name else "unknown"
+        REQUEST_SECONDS.observe(duration, view=view)
+        REQUEST_DB_QUERIES.observe(queries.db_count, view=view)
+        if settings.METRICS_DIR:
+            REGISTRY.maybe_flush(settings.METRICS_DIR)
+
+
+def metrics_view(request) -> HttpResponse:
+    """Expose the metrics of all worker processes to the allowed IP addresses with the metrics token."""
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if request.META.get("REMOTE_ADDR") not in settings.METRICS_ALLOWED_IPS or not _has_token(request):
+        return HttpResponseForbidden()
+    return HttpResponse(REGISTRY.render(settings.METRICS_DIR or None), content_type=CONTENT_TYPE)
+
+
+def _has_token(request) -> bool:
+    """Check the bearer token of the request against the metrics token. Without a configured token nobody has it."""
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    return (
+        bool(settings.METRICS_TOKEN)
+        and scheme.lower() == "bearer"
+        and hmac.compare_digest(token, settings.METRICS_TOKEN)
+    )
@@ -0,0 +1,117 @@
+"""
+Profile single requests of staff users on demand.
+
+A request is profiled if it carries a signed token in the ``profile`` query parameter or the ``X-Profile`` header,
+belongs to a staff user and targets one of the URL names in the ``PROFILING_URL_NAMES`` setting. Create the token with
+``manage.py profile_token <username>``. Add ``profile_memory=1`` to also trace the allocations with ``tracemalloc``
+and ``profile_output=store`` to keep the report in the ``PROFILING_DIR`` instead of downloading it. That directory is
+not served, the ``X-Profile-Report`` header of the response only names the report in it.
+"""
+
+import cProfile
+import io
+import pstats
+import secrets
+import tracemalloc
+from contextvars import ContextVar
+from inspect import iscoroutinefunction
+from pathlib import Path
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core import signing
+from django.http import HttpResponse
+from django.utils.timezone import now
+
+SALT = "rechnung.profiling"
+PARAMETER = "profile"
+HEADER = "X-Profile"
+
+
+_profiling: ContextVar[bool] = ContextVar("profiling", default=False)
+
+
+def is_profiling() -> bool:
+    """Check if the current request is profiled. Work offloaded to other threads would be missing in the profile."""
+    return _profiling.get()
+
+
+def make_profile_token(user) -> str:
+    """Create a signed profiling token for the given user."""
+    return signing.dumps(user.pk, salt=SALT)
+
+
+def is_valid_profile_token(token: str, user) -> bool:
+    """Check that the token was issued for the user and is not expired."""
+    try:
+        return signing.loads(token, salt=SALT, max_age=settings.PROFILING_TOKEN_MAX_AGE) == user.pk
+    except signing.BadSignature:
+        return False
+
+
+class ProfilingMiddleware:
+    """Run the view of a profiling request inside ``cProfile`` and optionally ``tracemalloc``."""
+
+    def __init__(self, get_response):
+        """Create the middleware."""
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """Profile the view if requested, otherwise let the request pass untouched."""
+        token = request.GET.get(PARAMETER) or request.headers.get(HEADER)
+        if not token:
+            return None
+        url_name = request.resolver_match.url_name
+        if url_name not in settings.PROFILING_URL_NAMES:
+            return None
+        if not request.user.is_staff or not is_valid_profile_token(token, request.user):
+            return None
+
+        trace_memory = request.GET.get("profile_memory") == "1"
+        profiler = cProfile.Profile()
+        snapshot = None
+        if iscoroutinefunction(view_func):
+            # the async ORM runs its queries in this thread, offloaded work checks is_profiling() to stay here as well
+            view_func = async_to_sync(view_func)
+        if trace_memory:
+            tracemalloc.start(settings.PROFILING_TRACEBACK_LIMIT)
+        token = _profiling.set(True)
+        try:
+            response = profiler.runcall(view_func, request, *view_args, **view_kwargs)
+            if callable(getattr(response, "render", None)):
+                # template responses are rendered lazily, which is part of the cost of the view
+                response = profiler.runcall(response.render)
+            if trace_memory:
+                snapshot = tracemalloc.take_snapshot()
+        finally:
+            _profiling.reset(token)
+            if trace_memory:
+                tracemalloc.stop()
+
+        report = _report(profiler, snapshot)
+        name = f"{now():%Y%m%d-%H%M%S}-{url_name}-{secrets.token_hex(4)}"
+        if request.GET.get("profile_output", settings.PROFILING_OUTPUT) == "store":
+            directory = Path(settings.PROFILING_DIR)
+            directory.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(directory / f"{name}.prof")
+            (directory / f"{name}.txt").write_text(report, encoding="utf-8")
+            response["X-Profile-Report"] = f"{name}.txt"
+            return response
+        download = HttpResponse(report, content_type="text/plain; charset=utf-8")
+        download["Content-Disposition"] = f'attachment; filename="{name}.txt"'
+        return download
+
+
+def _report(profiler: cProfile.Profile, snapshot: tracemalloc.Snapshot | None) -> str:
+    """Format the profile sorted by cumulative time and the top allocations as text."""
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(settings.PROFILING_REPORT_LIMIT)
+    if snapshot is not None:
+        stream.write("Top allocations\n\n")
+        for statistic in snapshot.statistics("lineno")[: settings.PROFILING_REPORT_LIMIT]:
+            stream.write(f"{statistic}\n")
+    return stream.getvalue()
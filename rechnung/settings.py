@@ -16,8 +16,9 @@ import os
 import sys
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
 from django.utils.translation import gettext_lazy as _
-from environs import FileAwareEnv
+from environs import FileAwareEnv, validate
 
 env = FileAwareEnv(expand_vars=True, strip_whitespace=True)
 env.read_env()  # read .env file
@@ -89,6 +90,51 @@ WSGI_APPLICATION = "rechnung.wsgi.application"
 
 DATABASES = {"default": env.dj_db_url("DATABASE_URL", default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}")}
 
+# SQLite tuned for concurrent workers: write-ahead log, fsync only at checkpoints, memory mapped reads and a 64 MiB page
+# cache. Write transactions take the write lock at BEGIN and wait up to SQLITE_BUSY_TIMEOUT seconds for it, instead of
+# failing with "database is locked" when a read lock cannot be upgraded.
+SQLITE_TUNING = env.bool("SQLITE_TUNING", default=True)
+if SQLITE_TUNING and DATABASES["default"]["ENGINE"] == "django.db.backends.sqlite3":
+    DATABASES["default"].setdefault("OPTIONS", {}).update(
+        {
+            "init_command": (
+                "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; "
+                "PRAGMA mmap_size=268435456; PRAGMA cache_size=-65536"
+            ),
+            "transaction_mode": "IMMEDIATE",
+            # sets the busy_timeout of every new connection
+            "timeout": env.float("SQLITE_BUSY_TIMEOUT", default=20.0),
+        }
+    )
+
+# Connection handling: "default" opens a new connection per request, "persistent" reuses it for DB_CONN_MAX_AGE
+# seconds after a health check and "pool" keeps a psycopg connection pool per worker process (PostgreSQL only).
+DB_CONN_PROFILE = env.str(
+    "DB_CONN_PROFILE", default="default", validate=validate.OneOf(["default", "persistent", "pool"])
+)
+# Threads per gunicorn worker. Each thread holds at most one connection, so they size the pool of a worker process.
+GUNICORN_THREADS = env.int("GUNICORN_THREADS", default=1)
+# "wsgi" serves with threaded sync workers, "asgi" with uvicorn workers, see entrypoint.sh. The uvicorn workers have no
+# thread count, each concurrent request runs the ORM in a thread of its own, so their pool needs an explicit size.
+SERVER_MODE = env.str("SERVER_MODE", default="wsgi", validate=validate.OneOf(["wsgi", "asgi"]))
+if DB_CONN_PROFILE == "persistent":
+    DATABASES["default"]["CONN_MAX_AGE"] = env.int("DB_CONN_MAX_AGE", default=60)
+    DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+elif DB_CONN_PROFILE == "pool":
+    if DATABASES["default"]["ENGINE"] != "django.db.backends.postgresql":
+        raise ImproperlyConfigured("DB_CONN_PROFILE=pool requires a PostgreSQL database.")
+    DB_POOL_MAX_SIZE = env.int("DB_POOL_MAX_SIZE", default=None)
+    if DB_POOL_MAX_SIZE is None:
+        if SERVER_MODE == "asgi":
+            raise ImproperlyConfigured("DB_CONN_PROFILE=pool with SERVER_MODE=asgi requires DB_POOL_MAX_SIZE.")
+        DB_POOL_MAX_SIZE = GUNICORN_THREADS
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+    DATABASES["default"].setdefault("OPTIONS", {})["pool"] = {
+        "min_size": env.int("DB_POOL_MIN_SIZE", default=min(GUNICORN_THREADS, DB_POOL_MAX_SIZE)),
+        "max_size": DB_POOL_MAX_SIZE,
+        "timeout": env.float("DB_POOL_TIMEOUT", default=10.0),
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -141,10 +187,75 @@ if not DEBUG:
         "disable_existing_loggers": False,
         "handlers": {"console": {"class": "logging.StreamHandler"}},
         "root": {"handlers": ["console"], "level": "WARNING"},
+        "loggers": {"rechnung.instrumentation": {"level": "INFO"}},
     }
 
 CSRF_TRUSTED_ORIGINS = env.list("CSRF_TRUSTED_ORIGINS", default=["http://*", "https://*"])
 
+# Invoice PDFs render in separate processes, PDF_RENDER_WORKERS of them per web worker process, see invoice.render_pool.
+# Up to PDF_RENDER_QUEUE_SIZE further renders wait for a free process, beyond that the response is a 503 with a
+# Retry-After header of PDF_RENDER_RETRY_AFTER seconds. A render is aborted after PDF_RENDER_TIMEOUT seconds or when it
+# needs more than PDF_RENDER_MEMORY_LIMIT MiB. A limit of 0 disables it.
+PDF_RENDER_WORKERS = env.int("PDF_RENDER_WORKERS", default=2, validate=validate.Range(min=1))
+PDF_RENDER_QUEUE_SIZE = env.int("PDF_RENDER_QUEUE_SIZE", default=8, validate=validate.Range(min=0))
+PDF_RENDER_TIMEOUT = env.float("PDF_RENDER_TIMEOUT", default=30.0, validate=validate.Range(min=0))
+PDF_RENDER_MEMORY_LIMIT = env.int("PDF_RENDER_MEMORY_LIMIT", default=1024, validate=validate.Range(min=0))
+PDF_RENDER_RETRY_AFTER = env.int("PDF_RENDER_RETRY_AFTER", default=5, validate=validate.Range(min=1))
+
+# The dunning run writes a reminder of level n for an unpaid invoice DUNNING_DAYS[n - 1] days past its due date, see
+# invoice.dunning.
+DUNNING_DAYS = env.list("DUNNING_DAYS", subcast=int, default=[14, 28, 42])
+
+# Invoice emails are queued in the outbox and sent by ``manage.py send_emails``, see invoice.outbox. A failed message is
+# retried after EMAIL_RETRY_DELAY seconds, doubled with every attempt, and given up after EMAIL_MAX_ATTEMPTS attempts.
+EMAIL_BACKEND = env.str("EMAIL_BACKEND", default="django.core.mail.backends.smtp.EmailBackend")
+EMAIL_HOST = env.str("EMAIL_HOST", default="localhost")
+EMAIL_PORT = env.int("EMAIL_PORT", default=25)
+EMAIL_HOST_USER = env.str("EMAIL_HOST_USER", default="")
+EMAIL_HOST_PASSWORD = env.str("EMAIL_HOST_PASSWORD", default="")
+EMAIL_USE_TLS = env.bool("EMAIL_USE_TLS", default=False)
+EMAIL_TIMEOUT = env.int("EMAIL_TIMEOUT", default=30)
+DEFAULT_FROM_EMAIL = env.str("DEFAULT_FROM_EMAIL", default="webmaster@localhost")
+EMAIL_MAX_ATTEMPTS = env.int("EMAIL_MAX_ATTEMPTS", default=5, validate=validate.Range(min=1))
+EMAIL_RETRY_DELAY = env.int("EMAIL_RETRY_DELAY", default=60, validate=validate.Range(min=0))
+
+# The PDFs of final invoices embed their CII XML as ZUGFeRD attachment, see invoice.e_invoice.
+E_INVOICE_EMBED = env.bool("E_INVOICE_EMBED", default=False)
+
+# Adds a Server-Timing header and a log line with query, template and PDF timings to every request.
+SERVER_TIMING = env.bool("SERVER_TIMING", default=False)
+if SERVER_TIMING:
+    MIDDLEWARE.insert(0, "rechnung.instrumentation.ServerTimingMiddleware")
+
+# In-process metrics exposed at /metrics in the Prometheus text format.
+METRICS_ENABLED = env.bool("METRICS_ENABLED", default=False)
+# Directory shared by all worker processes to aggregate their metrics. The PDF render processes report their metrics
+# only through it, so it is required with the metrics.
+METRICS_DIR = env.str("METRICS_DIR", default="")
+METRICS_ALLOWED_IPS = env.list("METRICS_ALLOWED_IPS", default=["127.0.0.1", "::1"])
+# Bearer token of the scrapes. Behind a reverse proxy the allowed IP addresses alone would let everybody in.
+METRICS_TOKEN = env.str("METRICS_TOKEN", default="")
+if METRICS_ENABLED:
+    if not METRICS_TOKEN:
+        raise ImproperlyConfigured("METRICS_ENABLED requires a METRICS_TOKEN.")
+    if not METRICS_DIR:
+        raise ImproperlyConfigured("METRICS_ENABLED requires a METRICS_DIR.")
+    MIDDLEWARE.insert(0, "rechnung.metrics.MetricsMiddleware")
+
+# Staff users can profile single requests with a token from ``manage.py profile_token``, see rechnung.profiling.
+PROFILING_ENABLED = env.bool("PROFILING_ENABLED", default=False)
+PROFILING_URL_NAMES = ["invoice-pdf", "invoice-list", "customer-list", "vendor-list"]
+PROFILING_OUTPUT = env.str("PROFILING_OUTPUT", default="download")
+# Stored reports show code paths and data of the requests, so they must not be in the public MEDIA_ROOT.
+PROFILING_DIR = env.path("PROFILING_DIR", default=BASE_DIR / "profiles")
+if PROFILING_DIR.resolve().is_relative_to(MEDIA_ROOT.resolve()):
+    raise ImproperlyConfigured("PROFILING_DIR must not be inside MEDIA_ROOT, which is served publicly.")
+PROFILING_TOKEN_MAX_AGE = 60 * 60
+PROFILING_REPORT_LIMIT = 50
+PROFILING_TRACEBACK_LIMIT = 10
+if PROFILING_ENABLED:
+    MIDDLEWARE.append("rechnung.profiling.ProfilingMiddleware")
+
 ENABLE_DEBUG_TOOLBAR = DEBUG and not ("test" in sys.argv or "PYTEST_VERSION" in os.environ)
 if ENABLE_DEBUG_TOOLBAR:
     INSTALLED_APPS += ["debug_toolbar"]
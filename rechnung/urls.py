@@ -23,6 +23,8 @@ from django.contrib import admin
 from django.urls import include, path, re_path
 from django.views.static import serve
 
+from rechnung.metrics import metrics_view
+
 urlpatterns = [
     *static(settings.STATIC_URL, document_root=settings.STATIC_ROOT),
     re_path(
@@ -31,6 +33,7 @@ urlpatterns = [
         kwargs={"document_root": settings.MEDIA_ROOT},
     ),  # TODO: this is unsafe for prod
     path("admin/", admin.site.urls),
+    path("metrics", metrics_view, name="metrics"),
     path("accounts/", include("django.contrib.auth.urls")),
     path("i18n/", include("django.conf.urls.i18n")),
     path("accounts/", include("accounts.urls")),
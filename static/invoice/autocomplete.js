@@ -0,0 +1,69 @@
+// Loads the options of selects with a data-autocomplete-url from the JSON autocomplete endpoints.
+// The server renders only the selected option. A search field next to the select fetches matching objects by prefix.
+(function () {
+    "use strict";
+
+    function setup(select) {
+        const search = document.createElement("input");
+        search.type = "search";
+        search.className = "form-control form-control-sm mb-2";
+        search.placeholder = select.dataset.autocompletePlaceholder || "";
+        search.setAttribute("aria-label", select.name);
+        const container = select.closest(".form-floating") || select;
+        container.after(search);
+
+        let timer = null;
+        let controller = null;
+
+        function load() {
+            const url = new URL(select.dataset.autocompleteUrl, window.location.href);
+            url.searchParams.set("q", search.value);
+            const forward = select.dataset.autocompleteForward;
+            if (forward && select.form && select.form.elements[forward]) {
+                url.searchParams.set(forward, select.form.elements[forward].value);
+            }
+            if (controller) {
+                controller.abort();
+            }
+            controller = new AbortController();
+            fetch(url, {headers: {Accept: "application/json"}, signal: controller.signal})
+                .then((response) => response.json())
+                .then((data) => replaceOptions(data))
+                .catch((error) => {
+                    if (error.name !== "AbortError") {
+                        throw error;
+                    }
+                });
+        }
+
+        function replaceOptions(data) {
+            const selected = select.value;
+            for (const option of Array.from(select.options)) {
+                if (option.dataset.more || (option.value !== "" && option.value !== selected)) {
+                    option.remove();
+                }
+            }
+            for (const result of data.results) {
+                if (String(result.id) !== selected) {
+                    select.add(new Option(result.text, result.id));
+                }
+            }
+            if (data.more) {
+                const more = new Option("…", "");
+                more.disabled = true;
+                more.dataset.more = "true";
+                select.add(more);
+            }
+        }
+
+        search.addEventListener("input", function () {
+            clearTimeout(timer);
+            timer = setTimeout(load, 250);
+        });
+        select.addEventListener("focus", load, {once: true});
+    }
+
+    document.addEventListener("DOMContentLoaded", function () {
+        document.querySelectorAll("select[data-autocomplete-url]").forEach(setup);
+    });
+})();
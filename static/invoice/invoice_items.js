@@ -0,0 +1,88 @@
+// Adds, updates and deletes the items of the invoice page without reloading the page.
+// The item views answer requests with the X-Fragment header with the changed row and the recalculated totals only.
+// Whenever that fails, the page falls back to the regular form submit or the delete confirmation page.
+(function () {
+    "use strict";
+
+    function csrfToken() {
+        const input = document.querySelector("input[name=csrfmiddlewaretoken]");
+        return input ? input.value : "";
+    }
+
+    function post(url, body) {
+        return fetch(url, {
+            method: "POST",
+            body: body,
+            headers: {"X-Fragment": "1", "X-CSRFToken": csrfToken(), Accept: "application/json"},
+            credentials: "same-origin",
+        }).then((response) => {
+            if (!response.ok) {
+                throw new Error(response.statusText);
+            }
+            return response.json();
+        });
+    }
+
+    function swap(data) {
+        const totals = document.getElementById("invoice-totals");
+        if (totals) {
+            totals.outerHTML = data.totals;
+        }
+        if (data.deleted !== undefined) {
+            const deleted = document.getElementById("invoice-item-" + data.deleted);
+            if (deleted) {
+                deleted.remove();
+            }
+        }
+        if (data.row) {
+            const row = document.getElementById("invoice-item-" + data.id);
+            if (row) {
+                row.outerHTML = data.row;
+            } else {
+                document.getElementById("invoice-items").insertAdjacentHTML("beforeend", data.row);
+            }
+        }
+    }
+
+    function hideModal() {
+        const modal = document.getElementById("InvoiceItemModal");
+        if (modal && window.bootstrap) {
+            window.bootstrap.Modal.getOrCreateInstance(modal).hide();
+        }
+    }
+
+    document.addEventListener("DOMContentLoaded", function () {
+        const form = document.getElementById("invoice-item-form");
+        if (form) {
+            form.addEventListener("submit", function (event) {
+                event.preventDefault();
+                post(form.action, new FormData(form))
+                    .then((data) => {
+                        swap(data);
+                        form.reset();
+                        hideModal();
+                    })
+                    .catch(() => form.submit());
+            });
+        }
+
+        const items = document.getElementById("invoice-items");
+        if (items) {
+            items.addEventListener("click", function (event) {
+                const link = event.target.closest("a.invoice-item-delete");
+                if (!link) {
+                    return;
+                }
+                event.preventDefault();
+                if (!confirm(link.dataset.confirm)) {
+                    return;
+                }
+                post(link.href, new FormData())
+                    .then(swap)
+                    .catch(() => {
+                        window.location.href = link.href;
+                    });
+            });
+        }
+    });
+})();